@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the scripts in src (run.py, selfplay.py, server.py, ...) import each other and the game state by their top level
+# names, the way they do when run from src, so their tests need src on the path
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
@@ -0,0 +1,637 @@
+import copy
+import io
+import json
+import pickle
+import random
+import time
+
+import pytest
+from src.agents.agent import AlphaBetaAgent, GreedyAgent, MCTSAgent, MinMaxAgent, SolverAgent
+from src.agents.book import HEADER, MAGIC, OpeningBook, writeBook
+from src.agents.metrics import SearchMetrics
+from src.agents.ordering import MoveOrdering
+from src.agents import parallel
+from src.agents.records import GameRecord, RecordWriter, readRecords, replay
+from src.agents.solver import Solver
+from src.agents.threats import analyseThreats
+from src.agents.transposition import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
+from src.game_state import BitboardGameState, GameState
+
+
+def play_columns(game_state: GameState, columns):
+    for col in columns:
+        game_state.make_move(col)
+    return game_state
+
+
+class TestAlphaBetaAgent:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_takes_immediate_win(self, state_cls):
+        # player 1 has three in column 1, player -1 is spread out
+        game_state = play_columns(state_cls(6, 7, 1), [1, 2, 1, 3, 1, 6])
+        agent = AlphaBetaAgent(1, depth=3)
+        assert agent.getAction(game_state) == (4, 1)
+
+    def test_blocks_immediate_loss(self):
+        game_state = play_columns(GameState(6, 7, 1), [1, 2, 1, 3, 1])
+        agent = AlphaBetaAgent(-1, depth=3)
+        assert agent.getAction(game_state) == (4, 1)
+
+    def test_search_leaves_state_untouched(self):
+        game_state = play_columns(GameState(6, 7, 1), [4, 4, 3, 5, 2])
+        grid, edge_nodes = copy.deepcopy(game_state.grid), copy.deepcopy(game_state.edge_nodes)
+        AlphaBetaAgent(-1, depth=4).getAction(game_state)
+        assert game_state.grid == grid and game_state.edge_nodes == edge_nodes
+        assert game_state.move_numer == 5 and game_state.current_player == -1 and game_state.move_stack
+
+    def test_timeout_still_returns_valid_move(self):
+        game_state = GameState(6, 7, 1)
+        agent = AlphaBetaAgent(1, depth=20, timeout=0)
+        assert agent.getAction(game_state) in game_state.getPossibleMoves()
+        assert game_state.move_numer == 0 and not game_state.move_stack
+
+    @pytest.mark.parametrize("columns", [[], [4, 4, 3], [1, 2, 3, 4, 5, 1, 2]])
+    def test_pruning_does_not_change_score(self, columns):
+        game_state = play_columns(GameState(4, 5, 1), columns)
+        for depth in [1, 2, 3]:
+            minmax, alphabeta = MinMaxAgent(game_state.current_player), AlphaBetaAgent(game_state.current_player)
+            for search_agent in (minmax, alphabeta):
+                search_agent.deadline, search_agent.nodes = None, 0
+            assert minmax.searchRoot(game_state, depth, None)[1] == alphabeta.searchRoot(game_state, depth, None)[1]
+            assert alphabeta.nodes <= minmax.nodes
+
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_incremental_evaluator(self, state_cls):
+        game_state = play_columns(state_cls(6, 7, 1), [1, 2, 1, 3, 1])
+        agent = AlphaBetaAgent(-1, depth=3, evaluator='incremental')
+        assert agent.getAction(game_state) == (4, 1)
+        game_state.make_move(6)
+        assert GreedyAgent(1, evaluator='incremental').getAction(game_state) == (4, 1)
+        with pytest.raises(ValueError):
+            GreedyAgent(1, evaluator='unknown')
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_scoring_leaves_the_shared_moves_alone(self, state_cls):
+        game_state = play_columns(state_cls(5, 6, 1), [3, 4, 3, 4])
+        moves = game_state.getPossibleMoves()
+        before = copy.deepcopy(moves)
+        GreedyAgent(1).getAction(game_state)
+        AlphaBetaAgent(1, depth=2).getAction(game_state)
+        MinMaxAgent(1, depth=1)._bestMoveScore(game_state, -1)
+        random.seed(0)
+        MCTSAgent(1, rollout_policy='scoreMove', playouts=20).getAction(game_state)
+        # searches rebuild the dict as they make and unmake moves, neither version may carry scores
+        assert moves == before and game_state.getPossibleMoves() == before
+
+    def test_transposition_table_is_kept_across_moves(self):
+        game_state = GameState(5, 5, 1)
+        agent = AlphaBetaAgent(1, depth=3, tt_size_mb=1, keep_tt=True)
+        game_state.update(1, agent.getAction(game_state))
+        table = agent.transposition_table
+        game_state.make_move(3)
+        game_state.current_player = 1
+        agent.getAction(game_state)
+        assert agent.transposition_table is table and table.hits > 0
+
+
+def brute_force_score(game_state: GameState) -> int:
+    '''Exhaustive negamax in the Solver score convention, only usable with a handful of empty cells.'''
+    empty = game_state.num_rows * game_state.num_cols - game_state.move_numer
+    best_score = None
+    for col in game_state.getPossibleColumns():
+        game_state.make_move(col)
+        if game_state.game_complete:
+            score = empty
+        elif empty == 1:
+            score = 0
+        else:
+            score = -brute_force_score(game_state)
+        game_state.unmake_move()
+        best_score = score if best_score is None else max(best_score, score)
+    return best_score
+
+
+class TestSolver:
+
+    @pytest.mark.parametrize("num_rows, num_cols, seed", [(4, 4, seed) for seed in range(8)] + [(3, 5, 10), (4, 5, 11)])
+    def test_matches_brute_force(self, num_rows, num_cols, seed):
+        rng = random.Random(seed)
+        game_state = BitboardGameState(num_rows, num_cols, 1)
+        while num_rows * num_cols - game_state.move_numer > 8:
+            game_state.make_move(rng.choice(game_state.getPossibleColumns()))
+            if game_state.game_complete:
+                game_state.unmake_move()
+        solution = Solver(num_rows, num_cols, tt_size_mb=1).solve(game_state)
+        assert solution.score == brute_force_score(game_state)
+
+    def test_reports_outcome_and_distance(self):
+        # player 1 to move completes column 1 straight away
+        game_state = play_columns(GameState(4, 4, 1), [1, 2, 1, 3, 1, 2])
+        solution = Solver(4, 4, tt_size_mb=1).solve(game_state)
+        assert solution.outcome == 'win' and solution.best_col == 1 and solution.distance == 1
+        assert solution.score == 10
+
+    def test_solver_agent_plays_exact_move(self):
+        game_state = play_columns(GameState(4, 4, 1), [1, 2, 1, 3, 1, 2])
+        agent = SolverAgent(1, solver_empty_cells=10)
+        assert agent.getAction(game_state) == (4, 1)
+        assert agent.last_solution.outcome == 'win'
+        assert game_state.move_numer == 6
+
+
+class TestOpeningBook:
+
+    def test_lookup(self, tmp_path):
+        path = str(tmp_path / 'book.bin')
+        entries = {key: (key - 50, key % 7 + 1, key % 2 == 0) for key in range(3, 300, 3)}
+        writeBook(path, 6, 7, 4, entries)
+        book = OpeningBook(path)
+        assert (book.num_rows, book.num_cols, book.plies, len(book)) == (6, 7, 4, len(entries))
+        for key, entry in entries.items():
+            assert book.lookup(key) == entry
+        assert book.lookup(1) is None and book.lookup(301) is None and book.lookup(4) is None
+        assert book.hits == len(entries) and book.misses == 3
+        book.close()
+
+    @pytest.mark.parametrize("num_rows, num_cols", [(7, 9), (8, 8), (16, 4)])
+    def test_rejects_boards_with_keys_over_64_bits(self, tmp_path, num_rows, num_cols):
+        path = tmp_path / 'book.bin'
+        with pytest.raises(ValueError, match="num_rows\\+1"):
+            writeBook(str(path), num_rows, num_cols, 1, {1: (0, 1, False)})
+        assert not path.exists()
+
+    def test_rejects_books_of_the_raw_key_version(self, tmp_path):
+        path = tmp_path / 'book.bin'
+        path.write_bytes(HEADER.pack(MAGIC, 1, 6, 7, 1, 0))
+        with pytest.raises(ValueError, match="version 2"):
+            OpeningBook(str(path))
+
+    def test_largest_supported_board(self, tmp_path):
+        path = str(tmp_path / 'book.bin')
+        game_state = play_columns(BitboardGameState(7, 8, 1), [8] * 7 + [1])
+        key, _ = game_state.canonicalKey()
+        writeBook(path, 7, 8, 8, {key: (3, 2, True)})
+        book = OpeningBook(path)
+        assert book.lookup(key) == (3, 2, True)
+        book.close()
+
+    def test_agent_plays_book_move_and_falls_back(self, tmp_path):
+        path = str(tmp_path / 'book.bin')
+        game_state = GameState(6, 7, 1)
+        # a move no search would pick, to make sure the book was used
+        writeBook(path, 6, 7, 1, {game_state.toBitboard().positionKey(): (0, 1, False)})
+        agent = AlphaBetaAgent(1, depth=2, book_path=path)
+        assert agent.getAction(game_state) == (1, 1)
+        game_state.make_move(4)
+        game_state.current_player = 1
+        assert agent.getAction(game_state) != (1, 1)
+        assert agent.book.hits == 1 and agent.book.misses == 1
+
+    def test_mirrored_position_uses_mirrored_book_move(self, tmp_path):
+        path = str(tmp_path / 'book.bin')
+        game_state = play_columns(BitboardGameState(6, 7, 1), [1])
+        key, mirrored = game_state.canonicalKey()
+        writeBook(path, 6, 7, 2, {key: (0, 2 if not mirrored else 6, False)})
+        agent = AlphaBetaAgent(-1, book_path=path)
+        assert agent.getAction(game_state) == (1, 2)
+        mirrored_state = play_columns(BitboardGameState(6, 7, 1), [7])
+        assert agent.getAction(mirrored_state) == (1, 6)
+
+
+def random_record(seed: int, num_rows: int = 6, num_cols: int = 7) -> GameRecord:
+    rng = random.Random(seed)
+    first_player = rng.choice([1, -1])
+    game_state = GameState(num_rows, num_cols, first_player)
+    columns = []
+    while not game_state.game_complete and game_state.getPossibleColumns():
+        columns.append(rng.choice(game_state.getPossibleColumns()))
+        game_state.make_move(columns[-1])
+    winner = -game_state.current_player if game_state.game_complete else 0
+    return GameRecord(num_rows, num_cols, first_player, winner, columns)
+
+
+class TestGameRecords:
+
+    def test_round_trip_and_append(self, tmp_path):
+        path = str(tmp_path / 'games.c4r')
+        records = [random_record(seed) for seed in range(20)] + [GameRecord(5, 9, -1, None, [5, 5, 1])]
+        with RecordWriter(path) as writer:
+            writer.writeAll(records[:10])
+        with RecordWriter(path) as writer:
+            writer.writeAll(records[10:])
+        assert list(readRecords(path)) == records
+        assert (tmp_path / 'games.c4r').stat().st_size == 5 + sum(6 + len(record.moves) for record in records)
+
+    def test_reads_lazily(self, tmp_path):
+        path = str(tmp_path / 'games.c4r')
+        with RecordWriter(path) as writer:
+            writer.writeAll(random_record(seed) for seed in range(5))
+        records = readRecords(path)
+        assert next(records) == random_record(0)
+        records.close()
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_replay(self, state_cls):
+        record = random_record(3)
+        game_state = replay(record, state_cls)
+        expected = GameState(6, 7, record.first_player)
+        for col in record.moves:
+            expected.make_move(col)
+        assert game_state.zobrist_hash == expected.zobrist_hash and game_state.move_numer == len(record.moves)
+        assert game_state.game_complete == (record.winner != 0)
+        for _ in record.moves:
+            game_state.unmake_move()
+        assert game_state.move_numer == 0 and game_state.current_player == record.first_player
+
+    def test_rejects_other_files(self, tmp_path):
+        path = tmp_path / 'book.bin'
+        writeBook(str(path), 6, 7, 1, {1: (0, 4, False)})
+        size = path.stat().st_size
+        with pytest.raises(ValueError):
+            list(readRecords(str(path)))
+        with pytest.raises(ValueError):
+            RecordWriter(str(path))
+        assert path.stat().st_size == size
+        (tmp_path / 'short.c4r').write_bytes(b'C4')
+        with pytest.raises(ValueError):
+            list(readRecords(str(tmp_path / 'short.c4r')))
+
+    @pytest.mark.parametrize("cut", [1, 3, 6, 7])
+    def test_truncated_last_record(self, tmp_path, cut):
+        path = tmp_path / 'games.c4r'
+        records = [random_record(seed) for seed in range(3)]
+        with RecordWriter(str(path)) as writer:
+            writer.writeAll(records)
+        # cut within the header or the moves of the last record
+        path.write_bytes(path.read_bytes()[:5 + sum(6 + len(record.moves) for record in records[:2]) + cut])
+        read = readRecords(str(path))
+        assert [next(read), next(read)] == records[:2]
+        with pytest.raises(ValueError, match='truncated'):
+            next(read)
+
+
+class TestTranspositionTable:
+
+    def test_store_and_probe(self):
+        table = TranspositionTable(size_mb=1)
+        assert table.num_buckets == 1024 * 1024 // 32
+        table.store(12345, 3, LOWER_BOUND, -4321, 5)
+        table.store(777, 0, EXACT, 10, None)
+        assert table.probe(12345) == (3, LOWER_BOUND, -4321, 5)
+        assert table.probe(777) == (0, EXACT, 10, None)
+        assert table.probe(999) is None
+        assert table.stats() == {'hits': 2, 'misses': 1, 'collisions': 0, 'stores': 2}
+
+    def test_depth_preferred_replacement(self):
+        table = TranspositionTable(size_mb=1)
+        buckets = table.num_buckets
+        deep, shallow, newest = 1, 1 + buckets, 1 + 2 * buckets  # all three map to the same bucket
+        table.store(deep, 6, EXACT, 1, 1)
+        table.store(shallow, 2, UPPER_BOUND, 2, 2)
+        table.store(newest, 1, EXACT, 3, 3)
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert table.probe(shallow) is None
+        assert table.probe(newest) == (1, EXACT, 3, 3)
+        assert table.collisions == 1
+        # a deeper search takes over the depth-preferred slot and demotes the old entry
+        table.store(shallow, 8, EXACT, 4, 4)
+        assert table.probe(shallow) == (8, EXACT, 4, 4)
+        assert table.probe(deep) == (6, EXACT, 1, 1)
+        assert table.probe(newest) is None
+
+    def test_clear_empties_the_table_in_place(self):
+        table = TranspositionTable(size_mb=1)
+        keys = table.keys
+        for key in range(1, 100):
+            table.store(key, 2, EXACT, key, 3)
+        table.probe(5)
+        table.clear()
+        assert table.keys is keys and len(table.keys) == 2 * table.num_buckets
+        assert all(table.probe(key) is None for key in range(1, 100))
+        assert table.stats() == {'hits': 0, 'misses': 99, 'collisions': 0, 'stores': 0}
+
+    def test_search_reuses_its_table_between_moves(self):
+        game_state = GameState(5, 5, 1)
+        agent = AlphaBetaAgent(1, depth=3, tt_size_mb=1)
+        game_state.update(1, agent.getAction(game_state))
+        table = agent.transposition_table
+        game_state.make_move(3)
+        game_state.current_player = 1
+        agent.getAction(game_state)
+        assert agent.transposition_table is table
+
+
+class TestThreats:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, seed", [(6, 7, 0), (6, 7, 1), (5, 4, 2), (7, 9, 3)])
+    def test_threat_cells_match_lines(self, state_cls, num_rows, num_cols, seed):
+        rng = random.Random(seed)
+        game_state = state_cls(num_rows, num_cols, 1)
+        while not game_state.game_complete and game_state.getPossibleColumns():
+            threats = analyseThreats(game_state)
+            for player in (1, -1):
+                expected = set()
+                for line in game_state.winning_lines.lines:
+                    values = [game_state.grid[cell].value if cell in game_state.grid else 0 for cell in line]
+                    if values.count(player) == len(line) - 1 and values.count(0) == 1:
+                        expected.add(line[values.index(0)])
+                assert set(threats.threatCells(player)) == expected
+            game_state.make_move(rng.choice(game_state.getPossibleColumns()))
+
+    @pytest.mark.parametrize("seed", range(12))
+    def test_forced_outcome_agrees_with_solver(self, seed):
+        rng = random.Random(seed)
+        solver = Solver(4, 5, tt_size_mb=1)
+        game_state = BitboardGameState(4, 5, 1)
+        while game_state.getPossibleColumns() and game_state.move_numer < 18:
+            forced = analyseThreats(game_state).forcedOutcome()
+            if forced is not None:
+                solution = solver.solve(game_state)
+                assert (solution.score > 0) == (forced[0] > 0) and solution.score != 0
+                assert solution.distance == forced[1]
+            game_state.make_move(rng.choice(game_state.getPossibleColumns()))
+            if game_state.game_complete:
+                break
+
+    def test_stacked_threats(self):
+        # player 1 threatens (1, 4) and (2, 4) at once, blocking the first opens the second
+        game_state = play_columns(GameState(6, 7, 1), [1, 7, 2, 6, 3, 7, 1, 6, 2, 1, 3])
+        threats = analyseThreats(game_state)
+        assert game_state.current_player == -1
+        assert threats.lowestThreats(1)[3] == 1 and (2, 4) in threats.threatCells(1)
+        assert threats.nonLosingColumns() == [] and threats.forcedOutcome() == (-1, 2)
+
+    def test_parity(self):
+        # player 1 moved first and threatens (3, 4), an odd row, on the diagonal from (1, 2) to (4, 5)
+        game_state = play_columns(GameState(6, 7, 1), [5, 3, 2, 5, 6, 5, 3, 7, 5, 2])
+        threats = analyseThreats(game_state)
+        assert threats.first_player == 1 and threats.lowestThreats(1)[3] == 3
+        assert threats.goodParityThreats(1) == [4] and threats.zugzwangWinner() == 1
+        assert threats.parityScore(1) == 1 and threats.parityScore(-1) == -1 and threats.forcedOutcome() is None
+
+    def test_agent_uses_threats(self):
+        game_state = play_columns(GameState(6, 7, 1), [1, 7, 2, 6, 3, 7, 1, 6, 2, 1, 3])
+        agent = AlphaBetaAgent(-1, depth=2, threats=True)
+        agent.getAction(game_state)
+        assert game_state.move_numer == 11 and game_state.current_player == -1
+        game_state = play_columns(GameState(6, 7, 1), [1, 2, 1, 3, 1])
+        assert AlphaBetaAgent(-1, depth=3, threats=True).getAction(game_state) == (4, 1)
+
+
+class TestMoveOrdering:
+
+    def test_tiers(self):
+        # player 1 to move wins in column 1, player -1 threatens to win in column 5
+        game_state = play_columns(GameState(6, 7, 1), [1, 5, 1, 5, 1, 5])
+        ordering = MoveOrdering()
+        columns = game_state.getPossibleColumns()
+        assert ordering.order(game_state, columns, 2) == [1, 5, 4, 3, 2, 6, 7]
+        assert ordering.order(game_state, columns, 2, tt_move=7) == [7, 1, 5, 4, 3, 2, 6]
+        ordering.recordCutoff(1, 2, 6, 3, True)
+        ordering.recordCutoff(1, 2, 2, 1, False)
+        assert ordering.order(game_state, columns, 2) == [1, 5, 2, 6, 4, 3, 7]
+        # other plies only see the history, where column 6 has cut off deeper
+        assert ordering.order(game_state, columns, 3) == [1, 5, 6, 2, 4, 3, 7]
+        assert ordering.stats() == {'cutoffs': 2, 'first_move_cutoffs': 1, 'first_move_rate': 0.5}
+        ordering.newSearch()
+        assert ordering.killers == {} and ordering.history[1] == {6: 4, 2: 0}
+
+    @pytest.mark.parametrize("columns", [[4, 4, 3], [4, 3, 5, 4, 4, 2]])
+    def test_reduces_nodes_without_changing_score(self, columns):
+        results = {}
+        for move_ordering in (False, True):
+            game_state = play_columns(GameState(6, 7, 1), columns)
+            agent = AlphaBetaAgent(game_state.current_player, depth=5, tt_size_mb=0, move_ordering=move_ordering)
+            results[move_ordering] = agent.search(game_state)[1], agent.nodes
+        assert results[True][0] == results[False][0]
+        assert results[True][1] < results[False][1]
+        assert agent.ordering.stats()['first_move_rate'] > 0.5
+
+
+class TestMCTSAgent:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("rollout_policy", ['random', 'scoreMove'])
+    def test_takes_win_and_blocks(self, state_cls, rollout_policy):
+        random.seed(0)
+        game_state = play_columns(state_cls(6, 7, 1), [1, 2, 1, 3, 1])
+        agent = MCTSAgent(-1, playouts=500, rollout_policy=rollout_policy)
+        assert agent.getAction(game_state) == (4, 1)
+        assert game_state.move_numer == 5 and game_state.current_player == -1
+        game_state.make_move(7)
+        assert MCTSAgent(1, playouts=500, rollout_policy=rollout_policy).getAction(game_state) == (4, 1)
+
+    def test_reroots_on_opponent_reply(self):
+        random.seed(1)
+        game_state = GameState(6, 7, 1)
+        agent = MCTSAgent(1, playouts=400)
+        action = agent.getAction(game_state)
+        assert agent.last_playouts == 400 and agent.playouts_per_second > 0
+        game_state.update(1, action)
+        game_state.current_player = -1
+        reply = agent.root.mostVisitedChild()
+        kept_visits = reply.visits
+        game_state.make_move(reply.move)
+        agent.getAction(game_state)
+        # the playouts of the second move went through the kept node of the reply
+        assert reply.visits == kept_visits + 400 and reply.children[agent.root.move] is agent.root
+        assert agent.root.parent is None
+        # a position that does not follow from the last root starts a new tree
+        other_game = play_columns(GameState(6, 7, 1), [1, 1])
+        assert agent._findRoot(other_game.toBitboard()).visits == 0
+
+    def test_timeout_budget(self):
+        agent = MCTSAgent(1, timeout=0)
+        game_state = GameState(6, 7, 1)
+        assert agent.getAction(game_state) in game_state.getPossibleMoves()
+        assert agent.last_playouts == 1
+        with pytest.raises(ValueError):
+            MCTSAgent(1, rollout_policy='unknown')
+
+
+class TestParallelSearch:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_root_split_matches_sequential_search(self, state_cls):
+        game_state = play_columns(state_cls(5, 6, 1), [3, 4, 3])
+        sequential = AlphaBetaAgent(-1, depth=4, move_ordering=False, tt_size_mb=0)
+        parallel = AlphaBetaAgent(-1, depth=4, move_ordering=False, tt_size_mb=1, workers=2)
+        try:
+            assert parallel.search(game_state) == sequential.search(game_state)
+            assert parallel.getAction(game_state) == sequential.getAction(game_state)
+        finally:
+            parallel.close()
+        assert game_state.move_numer == 3 and len(game_state.move_stack) == 3
+
+    def test_root_parallel_mcts(self):
+        game_state = play_columns(GameState(6, 7, 1), [1, 2, 1, 3, 1])
+        actions = []
+        for _ in range(2):
+            random.seed(5)
+            agent = MCTSAgent(-1, playouts=300, workers=2)
+            try:
+                actions.append(agent.getAction(game_state))
+            finally:
+                agent.close()
+            assert agent.last_playouts == 600 and agent.root is None
+        assert actions == [(4, 1), (4, 1)]
+
+    def test_every_root_move_starts_from_a_clean_table(self):
+        game_state = play_columns(GameState(5, 6, 1), [3, 4, 3])
+        worker = pickle.loads(pickle.dumps(AlphaBetaAgent(-1, depth=4, tt_size_mb=1, keep_tt=True)))
+        alone = worker.searchRootMove(game_state, 4, 3, None)
+        table = worker.transposition_table
+        assert table.stores > 0
+        worker.searchRootMove(game_state, 3, 3, None)
+        # emptied in place, so the score does not depend on the moves the worker searched before
+        assert worker.searchRootMove(game_state, 4, 3, None) == alone
+        assert worker.transposition_table is table and game_state.move_numer == 3
+
+    @pytest.mark.parametrize("columns", [[1, 2, 3, 4, 5, 6, 7], [4, 4, 4, 3, 3, 5]])
+    def test_parallel_search_does_not_depend_on_the_workers(self, columns):
+        game_state = play_columns(GameState(6, 7, 1), columns)
+        # every root move searched on its own by a fresh agent
+        alone = {
+            col: AlphaBetaAgent(-1, depth=6).searchRootMove(game_state, col, 6, None)[1]
+            for col in game_state.getPossibleColumns()
+        }
+        results = set()
+        for workers in (2, 3):
+            agent = AlphaBetaAgent(-1, depth=6, workers=workers)
+            try:
+                results.add(agent.search(game_state))
+            finally:
+                agent.close()
+        assert len(results) == 1
+        col, score, depth = results.pop()
+        assert depth == 6 and score == alone[col] == max(alone.values())
+
+    def test_root_move_stops_at_an_absolute_deadline(self):
+        game_state = play_columns(GameState(6, 7, 1), [4])
+        worker = AlphaBetaAgent(-1, depth=8)
+        col, score, _ = worker.searchRootMove(game_state, 4, 8, time.perf_counter() - 1)
+        assert (col, score) == (4, None)
+        assert game_state.move_numer == 1
+
+    def test_worker_agents_are_bounded(self):
+        parallel._WORKER_AGENTS.clear()
+        try:
+            for idx in range(parallel.MAX_WORKER_AGENTS + 3):
+                agent = GreedyAgent(1)
+                parallel._callWorkerAgent((f"agent-{idx}", agent, 'getAction', (GameState(4, 4, 1),)))
+            assert len(parallel._WORKER_AGENTS) == parallel.MAX_WORKER_AGENTS
+            assert list(parallel._WORKER_AGENTS)[-1] == f"agent-{parallel.MAX_WORKER_AGENTS + 2}"
+        finally:
+            parallel._WORKER_AGENTS.clear()
+
+    def test_pickled_agent_leaves_out_worker_state(self):
+        agent = AlphaBetaAgent(1, workers=2)
+        agent.search(GameState(4, 4, 1))
+        copied = pickle.loads(pickle.dumps(agent))
+        agent.close()
+        assert copied.worker_pool is None and copied.transposition_table is None
+        assert copied.depth == agent.depth and copied.ordering is not None
+
+
+class TestPondering:
+
+    def test_alpha_beta_warms_its_table(self):
+        game_state = play_columns(GameState(6, 7, 1), [4, 4, 3, 3])
+        agent = AlphaBetaAgent(-1, depth=4, ponder=True)
+        assert agent.keep_tt
+        agent.startPondering(game_state)
+        time.sleep(0.3)
+        game_state.make_move(5)
+        agent.stopPondering()
+        assert agent._ponder_thread is None and agent.ponder_nodes > 0
+        stores = agent.transposition_table.stores
+        assert stores > 0
+        assert agent.getAction(game_state) in game_state.getPossibleMoves()
+        # the search after pondering ran to full depth on the warmed table
+        assert agent.transposition_table.hits > 0 and agent.transposition_table.stores > stores
+        assert game_state.move_numer == 5 and game_state.current_player == -1
+
+    def test_mcts_grows_the_kept_tree(self):
+        random.seed(2)
+        game_state = GameState(6, 7, 1)
+        agent = MCTSAgent(1, playouts=200, ponder=True)
+        game_state.update(1, agent.getAction(game_state))
+        game_state.current_player = -1
+        kept_visits = agent.root.visits
+        agent.startPondering(game_state)
+        time.sleep(0.3)
+        game_state.make_move(4)
+        agent.stopPondering()
+        assert agent.ponder_playouts > 0 and agent.root.visits == kept_visits + agent.ponder_playouts
+        reply = agent.root.children[4]
+        pondered_visits = reply.visits
+        agent.getAction(game_state)
+        assert reply.visits == pondered_visits + 200 and reply.children[agent.root.move] is agent.root
+
+    def test_agents_without_pondering(self):
+        game_state = GameState(4, 4, 1)
+        agent = AlphaBetaAgent(1, depth=2)
+        agent.startPondering(game_state)
+        assert agent._ponder_thread is None
+        # agents that do not search accept the option and have nothing to ponder
+        agent = GreedyAgent(1, ponder=True)
+        agent.startPondering(game_state)
+        agent.close()
+        assert agent._ponder_thread is None and not agent._ponder_stop
+
+
+class TestSearchMetrics:
+
+    def test_alpha_beta_move_record(self):
+        output = io.StringIO()
+        metrics = SearchMetrics(output)
+        game_state = play_columns(GameState(6, 7, 1), [4, 4, 3])
+        game_state.metrics = metrics
+        agent = AlphaBetaAgent(-1, depth=4, metrics=metrics)
+        action = agent.getAction(game_state)
+        record = json.loads(output.getvalue())
+        assert record == metrics.last_record
+        assert record['agent'] == 'AlphaBetaAgent' and record['player'] == -1 and tuple(record['action']) == action
+        assert record['move_number'] == 3 and record['depth'] == 4 and record['source'] == 'search'
+        assert record['nodes'] == agent.nodes > 0 and record['evaluations'] == agent.evaluations > 0
+        assert record['cutoffs'] > 0 and record['cache_hits'] > 0
+        # every searched node is reached by one make_move on the game state
+        assert record['updates'] == record['nodes']
+        assert set(record['phases']) == {'book', 'search'}
+        assert metrics.nodes == metrics.updates == 0
+
+    def test_one_line_per_move(self):
+        output = io.StringIO()
+        agent = GreedyAgent(1, metrics=SearchMetrics(output))
+        game_state = GameState(6, 7, 1)
+        for _ in range(3):
+            agent.getAction(game_state)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert len(records) == 3
+        assert all(record['nodes'] == record['evaluations'] == 7 for record in records)
+
+    def test_mcts_counts_playouts(self):
+        metrics = SearchMetrics()
+        agent = MCTSAgent(1, playouts=50, metrics=metrics)
+        agent.getAction(GameState(6, 7, 1))
+        assert metrics.last_record['nodes'] == 50 and 'playouts' in metrics.last_record['phases']
+
+    def test_metrics_do_not_change_the_move(self):
+        game_state = play_columns(GameState(6, 7, 1), [4, 3, 5, 4])
+        plain = AlphaBetaAgent(1, depth=4).getAction(game_state)
+        game_state.metrics = SearchMetrics()
+        assert AlphaBetaAgent(1, depth=4, metrics=game_state.metrics).getAction(game_state) == plain
+
+    def test_copies_do_not_write(self):
+        output = io.StringIO()
+        game_state = GameState(4, 4, 1)
+        game_state.metrics = SearchMetrics(output)
+        game_state.metrics.write({'move_number': 0})
+        copied = copy.deepcopy(game_state)
+        assert copied.metrics.output is None
+        assert pickle.loads(pickle.dumps(AlphaBetaAgent(1, metrics=game_state.metrics))).metrics is None
+        copied.metrics.write({'move_number': 1})
+        assert output.getvalue().count('\n') == 1
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+np = pytest.importorskip("numpy")
+from src.agents.batch_eval import boardWindows, evaluateBoards, statesToArray
+from src.game_state import GameState
+
+
+def random_states(num_states: int, num_rows: int = 6, num_cols: int = 7, seed: int = 0):
+    rng = random.Random(seed)
+    states = []
+    for _ in range(num_states):
+        game_state = GameState(num_rows, num_cols, 1)
+        for _ in range(rng.randint(0, num_rows * num_cols // 2)):
+            game_state.make_move(rng.choice(game_state.getPossibleColumns()))
+            if game_state.game_complete:
+                break
+        states.append(game_state)
+    return states
+
+
+def naive_lines(game_state: GameState, length: int = 4):
+    lines = []
+    for row in range(1, game_state.num_rows + 1):
+        for col in range(1, game_state.num_cols + 1):
+            for dir in [(0, 1), (1, 0), (1, 1), (-1, 1)]:
+                cells = [(row + step * dir[0], col + step * dir[1]) for step in range(length)]
+                if all(game_state.check_if_index_in_grid(*cell) for cell in cells):
+                    lines.append([game_state.grid[cell].value if cell in game_state.grid else 0 for cell in cells])
+    return lines
+
+
+class TestBatchEval:
+
+    def test_states_to_array(self):
+        game_state = GameState(4, 5, 1)
+        for col in [1, 1, 5]:
+            game_state.make_move(col)
+        boards = statesToArray([game_state])
+        assert boards.shape == (1, 4, 5) and boards.dtype == np.int8
+        assert boards[0, 0, 0] == 1 and boards[0, 1, 0] == -1 and boards[0, 0, 4] == 1 and np.abs(boards).sum() == 3
+
+    @pytest.mark.parametrize("num_rows, num_cols", [(6, 7), (4, 4), (3, 5), (5, 3)])
+    def test_windows_cover_every_line(self, num_rows, num_cols):
+        states = random_states(5, num_rows, num_cols, seed=num_rows * num_cols)
+        windows = boardWindows(statesToArray(states))
+        for idx, game_state in enumerate(states):
+            expected = sorted(map(tuple, naive_lines(game_state)))
+            assert sorted(map(tuple, windows[idx].tolist())) == expected
+
+    def test_matches_per_board_evaluation(self):
+        states = random_states(50, seed=1)
+        batch = evaluateBoards(statesToArray(states), player_number=-1)
+        for idx, game_state in enumerate(states):
+            lines = naive_lines(game_state)
+            own_threats = sum(line.count(-1) == 3 and line.count(1) == 0 for line in lines)
+            streak = sum(10 ** line.count(-1) for line in lines if 1 not in line)
+            streak -= sum(10 ** line.count(1) for line in lines if -1 not in line)
+            assert batch['threats'][idx] == own_threats
+            assert batch['streak'][idx] == streak
+            assert batch['won'][idx] == any(line.count(-1) == 4 for line in lines)
+
+    def test_centre_and_symmetry(self):
+        game_state = GameState(6, 7, 1)
+        game_state.make_move(4)
+        result = evaluateBoards(statesToArray([game_state]))
+        assert result['centre'][0] == 2
+        mirrored = evaluateBoards(statesToArray(random_states(10, seed=3))[:, :, ::-1])
+        original = evaluateBoards(statesToArray(random_states(10, seed=3)))
+        assert (mirrored['streak'] == original['streak']).all() and (mirrored['centre'] == original['centre']).all()
@@ -0,0 +1,59 @@
+import pytest
+from benchmark import BENCHMARKS, BOARD_SIZES, allocationBenchmark, compareToBaseline, moveSequences, timeBenchmark
+from run import GAME_STATE_ENGINES
+
+
+def result(alloc: float = 100.0, relative_time: float = 10.0, ops: int = 50) -> dict:
+    return {'ops': ops, 'ns_per_op': 1000.0, 'relative_time': relative_time, 'alloc_bytes_per_op': alloc}
+
+
+class TestBenchmark:
+
+    @pytest.mark.parametrize("num_rows, num_cols", [(4, 5), (6, 7), (7, 9)])
+    def test_move_sequences_are_complete_games(self, num_rows, num_cols):
+        sequences = moveSequences(num_rows, num_cols, 5, seed=0)
+        assert len(sequences) == 5 and len({tuple(sequence) for sequence in sequences}) == 5
+        for sequence in sequences:
+            game_state = GAME_STATE_ENGINES['bitboard'](num_rows, num_cols, 1)
+            for col in sequence:
+                assert not game_state.game_complete and col in game_state.getPossibleColumns()
+                game_state.make_move(col)
+            assert game_state.game_complete or not game_state.getPossibleColumns()
+
+    def test_move_sequences_are_seeded(self):
+        assert moveSequences(6, 7, 3, seed=1) == moveSequences(6, 7, 3, seed=1)
+        assert moveSequences(6, 7, 3, seed=1) != moveSequences(6, 7, 3, seed=2)
+        # more games only add games
+        assert moveSequences(6, 7, 4, seed=1)[:3] == moveSequences(6, 7, 3, seed=1)
+
+    def test_compare_to_baseline(self):
+        baseline = {name: result() for name in ('ok', 'allocs', 'slower', 'faster', 'other games')}
+        timings = {name: result() for name in ('ok', 'allocs', 'slower', 'faster')}
+        results = {
+            'ok': result(alloc=100.5, relative_time=14.0),
+            'allocs': result(alloc=102.0),
+            'slower': result(relative_time=16.0),
+            'faster': result(alloc=50.0, relative_time=4.0),
+            'other games': result(ops=60),
+            'missing': result(),
+        }
+        assert compareToBaseline(results, baseline, timings, threshold=0.5, alloc_threshold=0.01) == {
+            'ok': 'ok', 'allocs': 'more allocations', 'slower': 'slower', 'faster': 'faster', 'other games': 'new',
+            'missing': 'new',
+        }
+
+    def test_timings_are_only_compared_with_local_timings(self):
+        baseline = {'name': result()}
+        results = {'name': result(relative_time=100.0)}
+        assert compareToBaseline(results, baseline, {}, threshold=0.5, alloc_threshold=0.01) == {'name': 'ok'}
+        assert compareToBaseline(results, baseline, baseline, threshold=0.5, alloc_threshold=0.01) == {'name': 'slower'}
+
+    @pytest.mark.parametrize("engine", ['grid', 'bitboard'])
+    @pytest.mark.parametrize("num_rows, num_cols", BOARD_SIZES)
+    @pytest.mark.parametrize("benchmark", BENCHMARKS)
+    def test_allocations_are_the_same_on_every_run(self, benchmark, num_rows, num_cols, engine):
+        sequences = moveSequences(num_rows, num_cols, 2, seed=0)
+        first = allocationBenchmark(benchmark, engine, num_rows, num_cols, sequences)
+        # whatever ran in between, like the timing replays, whose number depends on the machine
+        timeBenchmark(benchmark, engine, num_rows, num_cols, moveSequences(num_rows, num_cols, 3, seed=1), repeat=1)
+        assert allocationBenchmark(benchmark, engine, num_rows, num_cols, sequences) == first
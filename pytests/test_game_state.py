@@ -1,7 +1,12 @@
 from typing import Dict, List, Tuple
+import copy
+import random
 
 import pytest
-from src.game_state import GameState, Node, Sum
+from src.game_state import (
+    BitboardGameState, CENTRE_COL_WEIGHT, GameState, LINE_WEIGHTS, Node, Sum, WINNING_PIECES, getWinningLines
+)
+from src.perft import KNOWN_PERFT, divide, naivePerft, parseMoves, perft, playMoves
 
 '''
 Tests to be done
@@ -306,4 +311,423 @@ class TestGameState:
     def test_is_blocking_move(self, node, grid_indices, sums, expected_value, test_name, game_state):
         game_state.grid = create_grid_from_idx_and_sum(grid_indices, sums)
         game_state.current_player = node.value
-        assert game_state.isBlockingMove(node) == expected_value, f"Failed for test case : {test_name}"
\ No newline at end of file
+        assert game_state.isBlockingMove(node) == expected_value, f"Failed for test case : {test_name}"
+
+
+def play_random_game(game_states: List[GameState], seed: int, first_player: int = 1):
+    ''' Plays the same random game on all the given states, yielding after every move so callers can compare them.'''
+    rng = random.Random(seed)
+    player = first_player
+    while not game_states[0].game_complete and game_states[0].getPossibleMoves():
+        move = rng.choice(list(game_states[0].getPossibleMoves().keys()))
+        for state in game_states:
+            state.current_player = player
+            state.update(player, move)
+        yield move
+        player = -player
+
+
+class TestBitboardGameState:
+
+    @pytest.mark.parametrize(
+        "moves, expected_value",
+        [
+            ([(1, 1), (1, 2), (2, 1), (2, 2), (3, 1), (3, 2)], False),
+            ([(1, 1), (1, 2), (2, 1), (2, 2), (3, 1), (3, 2), (4, 1)], True),  # col win
+            ([(1, 1), (2, 1), (1, 2), (2, 2), (1, 3), (2, 3), (1, 4)], True),  # row win
+            ([(1, 1), (1, 2), (2, 2), (1, 3), (2, 3), (1, 4), (3, 3), (2, 4), (3, 4), (2, 1), (4, 4)], True),  # pos diag win
+            ([(1, 4), (1, 3), (2, 3), (1, 2), (2, 2), (1, 1), (3, 2), (2, 1), (3, 1), (2, 4), (4, 1)], True),  # neg diag win
+        ]
+    )
+    def test_update_detects_win(self, moves, expected_value):
+        game_state = BitboardGameState(4, 4, 1)
+        player = 1
+        for move in moves:
+            game_state.update(player, move)
+            player = -player
+        assert game_state.game_complete == expected_value
+
+    def test_possible_moves_skip_full_columns(self):
+        game_state = BitboardGameState(2, 3, 1)
+        game_state.update(1, (1, 2))
+        game_state.update(-1, (2, 2))
+        assert list(game_state.getPossibleMoves().keys()) == [(1, 1), (1, 3)]
+        assert game_state.getPossibleColumns() == [1, 3]
+
+    def test_grid_adapter(self):
+        game_state = BitboardGameState(4, 4, 1)
+        game_state.update(1, (1, 1))
+        game_state.update(1, (1, 2))
+        game_state.update(-1, (2, 2))
+        assert game_state.grid.get((1, 3)) is None
+        assert game_state.grid.get((5, 1)) is None
+        assert game_state.grid[(1, 2)] == Node(row=1, col=2, value=1, cumulative_sum=Sum(
+            row_sum=2, col_sum=1, pos_slope_diag_sum=1, neg_slope_diag_sum=1
+        ))
+        assert sorted(game_state.grid.keys()) == [(1, 1), (1, 2), (2, 2)]
+        assert (2, 2) in game_state.grid and (2, 1) not in game_state.grid
+        assert [node.row for node in game_state.edge_nodes] == [1, 2, 0, 0]
+
+    @pytest.mark.parametrize("num_rows, num_cols, seed", [(4, 4, 0), (6, 7, 1), (6, 7, 2), (5, 6, 3), (7, 9, 4)])
+    def test_matches_grid_game_state(self, num_rows, num_cols, seed):
+        game_state = GameState(num_rows, num_cols, 1)
+        bitboard = BitboardGameState(num_rows, num_cols, 1)
+        for _ in play_random_game([game_state, bitboard], seed):
+            assert bitboard.game_complete == game_state.game_complete
+            assert list(bitboard.getPossibleMoves().keys()) == list(game_state.getPossibleMoves().keys())
+            if game_state.game_complete:
+                break
+            for idx, node in game_state.grid.items():
+                assert bitboard.grid[idx] == node
+        converted = game_state.toBitboard()
+        assert converted.boards == bitboard.boards and converted.heights == bitboard.heights
+        assert converted.game_complete == bitboard.game_complete
+
+
+
+class TestMakeUnmakeMove:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, seed", [(4, 4, 0), (6, 7, 1), (6, 7, 2), (5, 6, 3)])
+    def test_unmake_restores_state(self, state_cls, num_rows, num_cols, seed):
+        rng = random.Random(seed)
+        game_state = state_cls(num_rows, num_cols, 1)
+        snapshots = []
+        while not game_state.game_complete and game_state.getPossibleColumns():
+            snapshots.append((
+                {idx: copy.deepcopy(node) for idx, node in game_state.grid.items()},
+                copy.deepcopy(game_state.edge_nodes), game_state.move_numer, game_state.current_player,
+            ))
+            game_state.make_move(rng.choice(game_state.getPossibleColumns()))
+        for grid, edge_nodes, move_numer, current_player in reversed(snapshots):
+            game_state.unmake_move()
+            assert dict(game_state.grid.items()) == grid
+            assert game_state.edge_nodes == edge_nodes
+            assert game_state.move_numer == move_numer
+            assert game_state.current_player == current_player
+            assert not game_state.game_complete
+        assert game_state.move_stack == []
+
+    def test_make_move_alternates_players(self):
+        game_state = GameState(4, 4, -1)
+        game_state.make_move(2)
+        game_state.make_move(2)
+        assert game_state.grid[(1, 2)].value == -1 and game_state.grid[(2, 2)].value == 1
+        assert game_state.current_player == -1
+        assert game_state.getPossibleColumns() == [1, 2, 3, 4]
+
+    def test_unmake_reverts_neighbour_sums(self):
+        game_state = GameState(4, 4, 1)
+        for col in [1, 3, 3, 4]:
+            game_state.update(1, (game_state.edge_nodes[col-1].row + 1, col))
+        assert game_state.grid[(1, 4)].cumulative_sum.row_sum == 2
+        game_state.make_move(2)
+        assert game_state.game_complete
+        game_state.unmake_move()
+        assert game_state.grid[(1, 3)].cumulative_sum.row_sum == 1
+        assert game_state.grid[(1, 4)].cumulative_sum.row_sum == 2
+        assert not game_state.game_complete and (1, 2) not in game_state.grid
+
+
+
+class TestZobristHash:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_transpositions_share_hash(self, state_cls):
+        first, second = state_cls(6, 7, 1), state_cls(6, 7, 1)
+        for col in [4, 3, 5, 4]:
+            first.make_move(col)
+        for col in [5, 3, 4, 4]:
+            second.make_move(col)
+        assert first.zobrist_hash == second.zobrist_hash
+        second.make_move(1)
+        assert first.zobrist_hash != second.zobrist_hash
+
+    def test_hash_depends_on_player_to_move(self):
+        game_state = GameState(6, 7, 1)
+        empty_hash = game_state.zobrist_hash
+        game_state.current_player = -1
+        assert game_state.zobrist_hash != empty_hash
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_unmake_restores_hash(self, state_cls):
+        game_state = state_cls(6, 7, 1)
+        hashes = []
+        for _ in play_random_game([game_state], seed=5):
+            hashes.append(game_state.zobrist_hash)
+        hashes.pop()
+        while hashes:
+            game_state.unmake_move()
+            game_state.current_player = -game_state.current_player
+            assert game_state.zobrist_hash == hashes.pop()
+
+    def test_engines_agree(self):
+        game_state, bitboard = GameState(5, 6, 1), BitboardGameState(5, 6, 1)
+        for _ in play_random_game([game_state, bitboard], seed=7):
+            assert game_state.zobrist_hash == bitboard.zobrist_hash
+        assert game_state.toBitboard().zobrist_hash == bitboard.zobrist_hash
+
+
+class TestCanonicalForm:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, columns", [(6, 7, [1, 2, 2, 7, 3]), (4, 6, [1, 1, 2, 5, 6, 3])])
+    def test_mirror_images_share_canonical_hash(self, state_cls, num_rows, num_cols, columns):
+        game_state, mirrored_state = state_cls(num_rows, num_cols, 1), state_cls(num_rows, num_cols, 1)
+        for col in columns:
+            game_state.make_move(col)
+            mirrored_state.make_move(mirrored_state.mirrorMove(col))
+        assert game_state.zobrist_hash != mirrored_state.zobrist_hash
+        hash_, mirrored = game_state.canonicalHash()
+        mirrored_hash, mirrored_mirrored = mirrored_state.canonicalHash()
+        assert hash_ == mirrored_hash and mirrored != mirrored_mirrored
+        key, mirrored = game_state.toBitboard().canonicalKey()
+        mirrored_key, mirrored_mirrored = mirrored_state.toBitboard().canonicalKey()
+        assert key == mirrored_key and mirrored != mirrored_mirrored
+        game_state.unmake_move()
+        mirrored_state.unmake_move()
+        assert game_state.canonicalHash()[0] == mirrored_state.canonicalHash()[0]
+
+    def test_symmetric_position_is_not_mirrored(self):
+        game_state = BitboardGameState(6, 7, 1)
+        for col in [4, 4, 3, 3, 5, 5]:
+            game_state.make_move(col)
+        assert game_state.canonicalKey() == (game_state.positionKey(), False)
+        assert game_state.canonicalHash() == (game_state.zobrist_hash, False)
+
+    @pytest.mark.parametrize("num_cols, centre_col", [(7, 4), (6, 3), (4, 2), (5, 3)])
+    def test_mirror_move(self, num_cols, centre_col):
+        game_state = GameState(4, num_cols, 1)
+        assert game_state.centre_col == centre_col
+        assert [game_state.mirrorMove(col) for col in range(1, num_cols + 1)] == list(range(num_cols, 0, -1))
+
+
+
+def naive_threat_count(game_state: GameState, player_number: int) -> int:
+    ''' Lines with WINNING_PIECES-1 pieces of the player and one empty cell, counted from the grid.'''
+    count = 0
+    for line in game_state.winning_lines.lines:
+        values = [game_state.grid[cell].value if cell in game_state.grid else 0 for cell in line]
+        count += values.count(player_number) == WINNING_PIECES - 1 and values.count(0) == 1
+    return count
+
+
+class TestWinningLines:
+
+    @pytest.mark.parametrize(
+        "num_rows, num_cols, num_lines, cell, cell_lines",
+        [(6, 7, 69, (1, 1), 3), (6, 7, 69, (3, 4), 13), (4, 4, 10, (2, 2), 3), (3, 3, 0, (2, 2), 0)]
+    )
+    def test_index(self, num_rows, num_cols, num_lines, cell, cell_lines):
+        winning_lines = getWinningLines(num_rows, num_cols)
+        assert len(winning_lines.lines) == num_lines
+        assert len(winning_lines.cell_lines[cell]) == cell_lines
+        assert getWinningLines(num_rows, num_cols) is winning_lines
+        for line_id in winning_lines.cell_lines[cell]:
+            assert cell in winning_lines.lines[line_id]
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("seed", range(4))
+    def test_counts_follow_moves_and_undo(self, state_cls, seed):
+        game_state = state_cls(6, 7, 1)
+        game_state.trackLines()
+        bitboard = BitboardGameState(6, 7, 1)
+        num_moves = 0
+        for _ in play_random_game([game_state, bitboard], seed):
+            num_moves += 1
+            assert game_state.game_complete == bitboard.game_complete
+            for player in (1, -1):
+                assert game_state.threat_counts[player] == naive_threat_count(game_state, player)
+            assert sum(game_state.line_counts[1]) + sum(game_state.line_counts[-1]) == sum(
+                len(game_state.winning_lines.cell_lines[cell]) for cell in game_state.grid
+            )
+        for _ in range(num_moves):
+            game_state.unmake_move()
+            for player in (1, -1):
+                assert game_state.threat_counts[player] == naive_threat_count(game_state, player)
+        assert not any(game_state.line_counts[1]) and not any(game_state.line_counts[-1])
+
+
+def naive_evaluation(game_state: GameState) -> int:
+    ''' Evaluation for player 1 recomputed from every line and the centre column of the grid.'''
+    score = 0
+    for line in game_state.winning_lines.lines:
+        values = [game_state.grid[cell].value if cell in game_state.grid else 0 for cell in line]
+        own, other = values.count(1), values.count(-1)
+        if not other:
+            score += LINE_WEIGHTS[own]
+        elif not own:
+            score -= LINE_WEIGHTS[other]
+    for (row, col), node in game_state.grid.items():
+        if col == game_state.centre_col:
+            score += node.value * CENTRE_COL_WEIGHT
+    return score
+
+
+class TestIncrementalEvaluation:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, seed", [(6, 7, 0), (6, 7, 1), (5, 4, 2), (7, 9, 3)])
+    def test_matches_recomputation(self, state_cls, num_rows, num_cols, seed):
+        game_state = state_cls(num_rows, num_cols, 1)
+        game_state.trackLines()
+        num_moves = 0
+        for _ in play_random_game([game_state], seed):
+            num_moves += 1
+            assert game_state.evaluation == naive_evaluation(game_state)
+        for _ in range(num_moves):
+            game_state.unmake_move()
+            assert game_state.evaluation == naive_evaluation(game_state)
+        assert game_state.evaluation == 0
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_score_if_played(self, state_cls):
+        game_state = state_cls(6, 7, 1)
+        game_state.trackLines()
+        for col in [4, 3, 4, 5, 2]:
+            game_state.make_move(col)
+        for col in game_state.getPossibleColumns():
+            for player in (1, -1):
+                expected = game_state.scoreIfPlayed(col, player)
+                game_state.current_player = player
+                game_state.make_move(col)
+                assert player * game_state.evaluation == expected
+                game_state.unmake_move()
+        assert game_state.current_player == -1
+        assert game_state.scoreIfPlayed(4) == game_state.scoreIfPlayed(4, -1)
+
+    def test_copy_keeps_evaluation(self):
+        bitboard = BitboardGameState(6, 7, 1)
+        bitboard.trackLines()
+        for col in [4, 4, 3]:
+            bitboard.make_move(col)
+        copied = bitboard.copy()
+        assert copied.evaluation == bitboard.evaluation != 0
+        copied.make_move(5)
+        assert copied.evaluation == naive_evaluation(copied) and bitboard.evaluation == naive_evaluation(bitboard)
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_bitboard_tracks_lines_only_when_asked(self, seed):
+        bitboard = BitboardGameState(6, 7, 1)
+        tracked = BitboardGameState(6, 7, 1)
+        tracked.trackLines()
+        for num_moves, _ in enumerate(play_random_game([bitboard, tracked], seed), start=1):
+            if num_moves == 9:
+                break
+        assert bitboard.line_counts is None and bitboard.evaluation is None and bitboard.copy().evaluation is None
+        # started in the middle of the game, the counts are rebuilt from the boards
+        bitboard.trackLines()
+        assert (bitboard.line_counts, bitboard.threat_counts, bitboard.evaluation) == (
+            tracked.line_counts, tracked.threat_counts, tracked.evaluation
+        )
+        for _ in range(num_moves):
+            bitboard.unmake_move()
+        assert bitboard.evaluation == 0 and not any(bitboard.line_counts[1]) and not any(bitboard.line_counts[-1])
+
+
+class TestColumnHeights:
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, seed", [(4, 4, 0), (6, 7, 1), (5, 6, 2)])
+    def test_heights_follow_moves(self, state_cls, num_rows, num_cols, seed):
+        game_state = state_cls(num_rows, num_cols, 1)
+        num_moves = 0
+        for _ in play_random_game([game_state], seed):
+            num_moves += 1
+            assert game_state.heights == [node.row for node in game_state.edge_nodes]
+        for _ in range(num_moves):
+            game_state.unmake_move()
+            assert game_state.heights == [node.row for node in game_state.edge_nodes]
+        assert game_state.heights == [0] * num_cols
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_possible_moves_cached_until_update(self, state_cls):
+        game_state = state_cls(4, 4, 1)
+        moves = game_state.getPossibleMoves()
+        assert game_state.getPossibleMoves() is moves
+        game_state.make_move(2)
+        assert game_state.getPossibleMoves() is not moves
+        assert list(game_state.getPossibleMoves()) == [(1, 1), (2, 2), (1, 3), (1, 4)]
+        game_state.unmake_move()
+        assert game_state.getPossibleMoves() == moves
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_move_node_leaves_the_shared_moves_alone(self, state_cls):
+        game_state = state_cls(5, 5, 1)
+        for col in [3, 3, 2, 4]:
+            game_state.make_move(col)
+        moves = game_state.getPossibleMoves()
+        before = {move: copy.deepcopy(node) for move, node in moves.items()}
+        for move in moves:
+            node = game_state.moveNode(1, move)
+            assert node is not moves[move] and (node.row, node.col) == move
+            assert node.cumulative_sum == game_state.updateNodeCumulativeSum(1, move)
+        assert game_state.getPossibleMoves() is moves and moves == before
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    def test_is_valid_action_matches_possible_moves(self, state_cls):
+        game_state = state_cls(4, 4, 1)
+        for col in [1, 1, 1, 1, 2]:
+            game_state.make_move(col)
+        for row in range(-1, 7):
+            for col in range(-1, 7):
+                assert game_state.isValidAction((row, col)) == ((row, col) in game_state.getPossibleMoves())
+
+    def test_setting_edge_nodes_sets_heights(self, game_state):
+        game_state.edge_nodes = [Node(row=1, col=1), Node(row=3, col=3)]
+        assert game_state.heights == [1, 4, 3, 4]
+        assert game_state.getPossibleColumns() == [1, 3]
+        game_state.edge_nodes = None
+        assert game_state.getPossibleColumns() == [] and game_state.getPossibleMoves() == {}
+
+    def test_nodes_have_no_instance_dict(self):
+        assert not hasattr(Node(row=1, col=1), '__dict__') and not hasattr(Sum(), '__dict__')
+
+
+class TestPerft:
+
+    @pytest.mark.parametrize("num_rows, num_cols, max_depth", [(4, 4, 6), (4, 5, 5), (5, 6, 4), (6, 7, 4)])
+    def test_known_counts_match_naive_perft(self, num_rows, num_cols, max_depth):
+        for depth in range(max_depth + 1):
+            assert KNOWN_PERFT[(num_rows, num_cols)][depth] == naivePerft(num_rows, num_cols, depth)
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, max_depth", [(4, 4, 7), (4, 5, 6), (6, 7, 5)])
+    def test_matches_known_counts(self, state_cls, num_rows, num_cols, max_depth):
+        game_state = state_cls(num_rows, num_cols, 1)
+        for depth in range(max_depth + 1):
+            assert perft(game_state, depth) == KNOWN_PERFT[(num_rows, num_cols)][depth]
+        assert game_state.move_stack == [] and game_state.zobrist_hash == state_cls(num_rows, num_cols, 1).zobrist_hash
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, depth", [(3, 5, 5), (5, 8, 4), (7, 4, 6)])
+    def test_other_board_sizes_match_naive_perft(self, state_cls, num_rows, num_cols, depth):
+        assert perft(state_cls(num_rows, num_cols, 1), depth) == naivePerft(num_rows, num_cols, depth)
+
+    def test_divide_sums_to_perft(self):
+        game_state = GameState(4, 5, 1)
+        for col in [3, 3, 2]:
+            game_state.make_move(col)
+        counts = divide(game_state, 4)
+        assert list(counts) == list(game_state.getPossibleMoves())
+        assert sum(counts.values()) == perft(game_state, 4)
+
+    @pytest.mark.parametrize("state_cls", [GameState, BitboardGameState])
+    @pytest.mark.parametrize("num_rows, num_cols, moves, depth", [(6, 7, '4453', 4), (4, 5, '33211', 5), (5, 8, '1,8,4', 3)])
+    def test_moves_match_naive_perft(self, state_cls, num_rows, num_cols, moves, depth):
+        game_state = state_cls(num_rows, num_cols, 1)
+        playMoves(game_state, parseMoves(moves))
+        for depth in range(depth + 1):
+            assert perft(game_state, depth) == naivePerft(num_rows, num_cols, depth, moves=parseMoves(moves))
+
+    def test_parse_moves(self):
+        assert parseMoves('4453') == [4, 4, 5, 3]
+        assert parseMoves('4,10,3') == [4, 10, 3]
+        assert parseMoves('') == []
+        with pytest.raises(ValueError):
+            parseMoves('4a')
+
+    @pytest.mark.parametrize("moves", [[6], [0], [1, 1, 1, 1, 1], [1, 2, 1, 2, 1, 2, 1]])
+    def test_play_moves_rejects_illegal_and_ending_moves(self, moves):
+        with pytest.raises(ValueError):
+            playMoves(GameState(4, 5, 1), moves)
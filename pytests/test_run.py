@@ -0,0 +1,111 @@
+import io
+import json
+import random
+
+import pytest
+from agents.metrics import SearchMetrics
+from run import AI_PLAYER, GAME_STATE_ENGINES, Game
+
+
+def played_game(engine: str, seed: int = 1) -> Game:
+    random.seed(seed)
+    game = Game('GreedyAgent', human_agent='RandomAgent', num_rows=4, num_cols=5, engine=engine)
+    game.alternateTurns()
+    return game
+
+
+def position(game: Game):
+    ''' Everything undo and redo have to restore: the log, the player to move, the zobrist hash, the nodes of the
+    board and the cumulative sums either player would get from every possible move.
+    '''
+    game_state = game.game_state
+    cells = {
+        (row, col): game_state.grid.get((row, col))
+        for row in range(1, game.NUM_ROWS + 1) for col in range(1, game.NUM_COLS + 1)
+    }
+    sums = {
+        (player, action): game_state.moveNode(player, action).cumulative_sum
+        for action in game_state.getPossibleMoves() for player in (1, -1)
+    }
+    return (list(game.log), game.current_player.identifier, game_state.current_player, game_state.game_complete,
+            game_state.zobrist_hash, cells, sums)
+
+
+class TestGame:
+
+    @pytest.mark.parametrize("engine", list(GAME_STATE_ENGINES))
+    def test_undo_and_redo_restore_every_position(self, engine):
+        game = played_game(engine)
+        num_moves = len(game.log)
+        positions = [position(game)]
+        for _ in range(num_moves):
+            game.undo()
+            positions.append(position(game))
+        assert game.log == [] and game.game_state.zobrist_hash == GAME_STATE_ENGINES[engine](4, 5, 1).zobrist_hash
+        assert game.current_player.identifier == game.first_player
+        for expected in reversed(positions[:-1]):
+            game.redo()
+            assert position(game) == expected
+        game.undo(num_moves)
+        assert position(game) == positions[-1]
+        game.redo(num_moves)
+        assert position(game) == positions[0] and game.redo_log == []
+
+    @pytest.mark.parametrize("engine", list(GAME_STATE_ENGINES))
+    def test_a_new_move_clears_the_redo_log(self, engine):
+        game = played_game(engine)
+        game.undo(3)
+        assert len(game.redo_log) == 3
+        action = game.current_player.getAction(game.game_state)
+        game.updateGameState(action)
+        assert game.redo_log == [] and game.log[-1] == (game.current_player.identifier, action)
+        with pytest.raises(ValueError):
+            game.redo()
+
+    def test_undo_single_turn(self):
+        game = played_game('grid')
+        num_moves = len(game.log)
+        before_turn_3 = game.log[:2]
+        for turn_number in (0, num_moves + 1):
+            with pytest.raises(ValueError):
+                game.undoSingleTurn(turn_number)
+        for num_moves_to_undo in (0, num_moves + 1):
+            with pytest.raises(ValueError):
+                game.undo(num_moves_to_undo)
+        undone = game.undoSingleTurn(3)
+        assert game.log == before_turn_3 and len(undone) == len(game.redo_log) == num_moves - 2
+        assert game.current_player.identifier == undone[-1][0]
+        with pytest.raises(ValueError):
+            game.redo(num_moves - 1)
+
+    def test_undo_and_redo_restore_the_computer_time_used(self):
+        random.seed(2)
+        game = Game('AlphaBetaAgent', human_agent='RandomAgent', num_rows=4, num_cols=5,
+                    agent_args={'depth': 2, 'timeout': 60})
+        game.alternateTurns()
+        computer = game.computer_player
+        # the time used at every position from the end of the game back, 0 before the computer's first move
+        time_used = []
+        for _ in range(len(game.log)):
+            time_used.append(computer.time_used)
+            game.undo()
+        assert computer.time_used == 0.0 and time_used[0] > 0.0
+        for expected in reversed(time_used):
+            game.redo()
+            assert computer.time_used == expected
+        game.undo(3)
+        game.updateGameState(game.current_player.getAction(game.game_state))
+        assert game.redo_ai_times == [] and len(game.ai_times) == sum(player == AI_PLAYER for player, _ in game.log)
+
+    def test_metrics_count_only_the_computer_search(self):
+        random.seed(5)
+        output = io.StringIO()
+        metrics = SearchMetrics(output)
+        game = Game('AlphaBetaAgent', human_agent='RandomAgent', num_rows=4, num_cols=5,
+                    agent_args={'depth': 2, 'metrics': metrics})
+        game.alternateTurns()
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [tuple(record['action']) for record in records] == [action for player, action in game.log if player == AI_PLAYER]
+        # every searched node is one make_move, the human's moves and the moves played are not counted
+        assert all(record['updates'] == record['nodes'] for record in records)
+        assert metrics.updates == 0 and game.game_state.metrics is None
@@ -0,0 +1,47 @@
+import pytest
+from selfplay import FIRST_AGENT, SECOND_AGENT, SelfPlayConfig, runSelfPlay, summarise
+
+
+def outcomes(results):
+    # everything but the move times, which depend on the machine
+    return [(result.game_number, result.winner, result.first_player, result.num_moves, result.columns) for result in results]
+
+
+def config(seed: int = 3, **agent_args) -> SelfPlayConfig:
+    return SelfPlayConfig(
+        agents={FIRST_AGENT: 'GreedyAgent', SECOND_AGENT: 'RandomAgent'},
+        agent_args={FIRST_AGENT: agent_args, SECOND_AGENT: {}}, num_rows=4, num_cols=5, seed=seed,
+    )
+
+
+class TestSelfPlay:
+
+    def test_same_seed_gives_the_same_games_whatever_the_workers(self):
+        serial = runSelfPlay(config(), 6, workers=1)
+        assert outcomes(runSelfPlay(config(), 6, workers=1)) == outcomes(serial)
+        assert outcomes(runSelfPlay(config(), 6, workers=2)) == outcomes(serial)
+        assert outcomes(runSelfPlay(config(seed=4), 6, workers=1)) != outcomes(serial)
+
+    def test_agents_alternate_the_first_move(self):
+        results = runSelfPlay(config(), 4, workers=1)
+        assert [result.first_player for result in results] == [FIRST_AGENT, SECOND_AGENT] * 2
+        for result in results:
+            assert len(result.columns) == result.num_moves
+            assert len(result.move_times[FIRST_AGENT]) + len(result.move_times[SECOND_AGENT]) == result.num_moves
+
+    def test_summary_counts_every_game(self):
+        cfg = config()
+        summary = summarise(cfg, runSelfPlay(cfg, 6, workers=1))
+        first, second = summary['agents']['first'], summary['agents']['second']
+        assert summary['games'] == 6
+        assert first['wins'] + second['wins'] + summary['draws'] == 6
+        assert first['wins'] == second['losses'] and second['wins'] == first['losses']
+
+    def test_parallel_agents_play_in_process(self):
+        cfg = SelfPlayConfig(
+            agents={FIRST_AGENT: 'AlphaBetaAgent', SECOND_AGENT: 'GreedyAgent'},
+            agent_args={FIRST_AGENT: {'depth': 2, 'workers': 2}, SECOND_AGENT: {}}, num_rows=4, num_cols=5,
+        )
+        results = runSelfPlay(cfg, 2, workers=2)
+        assert [result.game_number for result in results] == [0, 1]
+        assert all(result.num_moves > 0 for result in results)
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import time
+
+import pytest
+import server
+from server import AI_PLAYER, HUMAN_PLAYER, MAX_BOARD_SIZE, GameServer, ProtocolError, fallbackMove
+
+
+def slowMove(agent_name, agent_args, game_state, time_used, record_metrics):
+    time.sleep(0.5)
+    return fallbackMove(game_state), time_used, None
+
+
+def timedMove(agent_name, agent_args, game_state, time_used, record_metrics):
+    # every AI move spends one second of the game's time budget
+    return fallbackMove(game_state), time_used + 1.0, None
+
+
+def invalidMove(agent_name, agent_args, game_state, time_used, record_metrics):
+    # the column the fallback move plays is free, the row is not the next one of it
+    col = fallbackMove(game_state)[1]
+    return (game_state.num_rows, col), time_used, None
+
+
+def failingMove(agent_name, agent_args, game_state, time_used, record_metrics):
+    raise RuntimeError('agent crashed')
+
+
+def run(coroutine_fn, **server_args):
+    ''' Run coroutine_fn(game_server) on a fresh single worker GameServer and close the server after.'''
+    async def main():
+        game_server = GameServer(workers=1, **server_args)
+        try:
+            return await coroutine_fn(game_server)
+        finally:
+            game_server.close()
+    return asyncio.run(main())
+
+
+def board_pieces(game: dict) -> int:
+    return sum(cell != 0 for row in game['board'] for cell in row)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data: bytes):
+        self.lines.extend(json.loads(line) for line in data.splitlines())
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestGameServer:
+
+    def test_new_game_and_moves(self):
+        async def play(game_server):
+            game = await game_server.ops['new']({'agent': 'GreedyAgent', 'rows': 6, 'cols': 7})
+            assert (game['complete'], board_pieces(game)) == (False, 0)
+            assert game['possible_columns'] == list(range(1, 8))
+            moved = await game_server.ops['move']({'game_id': game['game_id'], 'col': 4})
+            assert moved['human_move'] == [1, 4] and moved['ai_timeout'] is False
+            assert board_pieces(moved) == 2 and moved['board'][0][3] == HUMAN_PLAYER
+            state = await game_server.ops['state']({'game_id': game['game_id']})
+            assert state['board'] == moved['board']
+            stats = await game_server.ops['stats']({})
+            assert (stats['games'], stats['moves_served'], stats['in_flight']) == (1, 1, 0)
+            await game_server.ops['close']({'game_id': game['game_id']})
+            with pytest.raises(ProtocolError):
+                await game_server.ops['state']({'game_id': game['game_id']})
+        run(play)
+
+    def test_ai_first(self):
+        async def play(game_server):
+            game = await game_server.ops['new']({'agent': 'AlphaBetaAgent', 'agent_args': {'depth': 2}, 'ai_first': True,
+                                                 'rows': 6, 'cols': 7})
+            assert board_pieces(game) == 1 and AI_PLAYER in game['board'][0]
+            assert 'ai_move' in game
+        run(play)
+
+    @pytest.mark.parametrize("request_args", [
+        {'agent': 'KeyBoardAgent'},
+        {'agent': 'BaseAgent'},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'book_path': '/etc/passwd'}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'workers': 8}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'ponder': True}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'tt_size_mb': 100000}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'metrics': None}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'depth': 100}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'depth': True}},
+        {'agent': 'AlphaBetaAgent', 'agent_args': {'threats': 1}},
+        {'agent': 'GreedyAgent', 'agent_args': {'evaluator': 'unknown'}},
+        {'agent': 'GreedyAgent', 'agent_args': []},
+        {'agent': 'GreedyAgent', 'rows': 0},
+        {'agent': 'GreedyAgent', 'cols': -3},
+        {'agent': 'GreedyAgent', 'rows': MAX_BOARD_SIZE + 1},
+        {'agent': 'GreedyAgent', 'cols': 100000},
+        {'agent': 'GreedyAgent', 'rows': '6'},
+        {'agent': 'GreedyAgent', 'engine': 'unknown'},
+    ])
+    def test_new_game_rejects_untrusted_input(self, request_args):
+        async def play(game_server):
+            with pytest.raises(ProtocolError):
+                await game_server.ops['new'](request_args)
+            assert not game_server.games
+        run(play)
+
+    def test_move_validation(self):
+        async def play(game_server):
+            game = await game_server.ops['new']({'agent': 'RandomAgent', 'rows': 4, 'cols': 4})
+            for col in (0, 5, '1', None, True, 1.0):
+                with pytest.raises(ProtocolError):
+                    await game_server.ops['move']({'game_id': game['game_id'], 'col': col})
+            with pytest.raises(ProtocolError):
+                await game_server.ops['move']({'game_id': 'unknown', 'col': 1})
+        run(play)
+
+    def test_undo_and_redo_with_ai_first(self, monkeypatch):
+        monkeypatch.setattr(server, 'computeMove', timedMove)
+
+        async def play(game_server):
+            views = [await game_server.ops['new']({'agent': 'GreedyAgent', 'ai_first': True, 'rows': 6, 'cols': 7})]
+            game_id = views[0]['game_id']
+            game = game_server.games[game_id]
+            for col in (1, 2):
+                views.append(await game_server.ops['move']({'game_id': game_id, 'col': col}))
+            assert game.ai_time_used == 3.0
+            for moves in (True, 0, 3, '1'):
+                with pytest.raises(ProtocolError):
+                    await game_server.ops['undo']({'game_id': game_id, 'moves': moves})
+            # the AI's first move is not the reply to a human move, so it stays
+            undone = await game_server.ops['undo']({'game_id': game_id, 'moves': 2})
+            assert undone['board'] == views[0]['board'] and [player for player, _ in game.log] == [AI_PLAYER]
+            assert game.ai_time_used == 1.0 and game.game_state.current_player == HUMAN_PLAYER
+            for expected, time_used in ((views[1], 2.0), (views[2], 3.0)):
+                redone = await game_server.ops['redo']({'game_id': game_id})
+                assert redone['board'] == expected['board'] and game.ai_time_used == time_used
+            with pytest.raises(ProtocolError):
+                await game_server.ops['redo']({'game_id': game_id})
+            await game_server.ops['undo']({'game_id': game_id})
+            assert game.ai_time_used == 2.0
+            await game_server.ops['move']({'game_id': game_id, 'col': 3})
+            assert game.redo_log == [] and game.redo_ai_times == [] and game.ai_time_used == 3.0
+            with pytest.raises(ProtocolError):
+                await game_server.ops['redo']({'game_id': game_id})
+        run(play)
+
+    def test_connection_reports_every_error_and_carries_on(self):
+        async def play(game_server):
+            async def broken(request):
+                raise KeyError('bug')
+            game_server.ops['broken'] = broken
+            reader = asyncio.StreamReader()
+            for line in ('not json', '[1]', '{"op": "unknown"}', '{"op": "broken", "id": 7}', '{"op": "stats", "id": 8}'):
+                reader.feed_data(line.encode() + b'\n')
+            reader.feed_eof()
+            writer = FakeWriter()
+            await game_server.handleConnection(reader, writer)
+            return writer.lines
+        responses = run(play)
+        assert [response['ok'] for response in responses] == [False, False, False, False, True]
+        assert responses[3]['id'] == 7 and 'KeyError' in responses[3]['error']
+        assert responses[4]['id'] == 8 and responses[4]['games'] == 0
+
+    def test_timed_out_move_keeps_its_pool_slot(self, monkeypatch):
+        monkeypatch.setattr(server, 'computeMove', slowMove)
+
+        async def play(game_server):
+            game = await game_server.ops['new']({'agent': 'GreedyAgent', 'rows': 6, 'cols': 7})
+            moved = await game_server.ops['move']({'game_id': game['game_id'], 'col': 1})
+            assert moved['ai_timeout'] is True and moved['ai_move'] == [1, 4]
+            # the worker is still busy with the move, so the only slot stays taken
+            assert game_server.in_flight == 1 and game_server.pending.locked()
+            for _ in range(100):
+                if game_server.in_flight == 0:
+                    break
+                await asyncio.sleep(0.05)
+            assert game_server.in_flight == 0 and not game_server.pending.locked()
+        run(play, max_pending=1, move_timeout=0.05)
+
+    @pytest.mark.parametrize("compute_move, error", [(invalidMove, 'invalid move'), (failingMove, 'agent crashed')])
+    def test_failed_ai_move_plays_the_fallback(self, monkeypatch, compute_move, error):
+        monkeypatch.setattr(server, 'computeMove', compute_move)
+
+        async def play(game_server):
+            game = await game_server.ops['new']({'agent': 'GreedyAgent', 'rows': 6, 'cols': 7})
+            moved = await game_server.ops['move']({'game_id': game['game_id'], 'col': 1})
+            assert error in moved['ai_error'] and moved['ai_move'] == [1, 4]
+            # the AI moved, so it is the human's turn again
+            assert board_pieces(moved) == 2 and moved['board'][0][3] == AI_PLAYER
+            assert game_server.games[game['game_id']].game_state.current_player == HUMAN_PLAYER
+            assert (await game_server.ops['stats']({}))['move_errors'] == 1
+        run(play)
+
+    def test_worker_agents_are_reused(self):
+        first = server._workerAgent('AlphaBetaAgent', {'depth': 2}, 6, 7)
+        assert server._workerAgent('AlphaBetaAgent', {'depth': 2}, 6, 7) is first
+        assert server._workerAgent('AlphaBetaAgent', {'depth': 2}, 5, 7) is not first
+        assert server._workerAgent('AlphaBetaAgent', {'depth': 3}, 6, 7) is not first
+        for depth in range(1, server.MAX_WORKER_AGENTS + 1):
+            server._workerAgent('GreedyAgent', {'depth': depth}, 6, 7)
+        assert len(server._WORKER_AGENTS) == server.MAX_WORKER_AGENTS
+        assert server._workerAgent('AlphaBetaAgent', {'depth': 2}, 6, 7) is not first
+        server._WORKER_AGENTS.clear()
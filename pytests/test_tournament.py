@@ -0,0 +1,82 @@
+import json
+
+import pytest
+from tournament import bootstrapElo, estimateElo, parseAgentSpec, runTournament, scheduleGames, standings
+
+
+def result(first: str, second: str, winner: str, game_number: int = 0) -> dict:
+    return {
+        'first': first, 'second': second, 'game_number': game_number, 'winner': winner,
+        'first_move_times': [0.001], 'second_move_times': [0.002],
+    }
+
+
+def round_robin(outcomes, games: int = 20):
+    ''' Results of <games> games for every (first, second, share of the games first wins, share drawn).'''
+    results = []
+    for first, second, win_share, draw_share in outcomes:
+        wins, draws = round(games * win_share), round(games * draw_share)
+        for game_number in range(games):
+            winner = 'first' if game_number < wins else 'draw' if game_number < wins + draws else 'second'
+            results.append(result(first, second, winner, game_number))
+    return results
+
+
+class TestTournament:
+
+    def test_parse_agent_spec(self):
+        assert parseAgentSpec('GreedyAgent') == ('GreedyAgent', {})
+        assert parseAgentSpec('AlphaBetaAgent:depth=4,timeout=10.5,evaluator=incremental') == (
+            'AlphaBetaAgent', {'depth': 4, 'timeout': 10.5, 'evaluator': 'incremental'}
+        )
+
+    def test_schedule_plays_every_pairing_an_even_number_of_times(self):
+        schedule = scheduleGames(['a', 'b', 'c'], 3)
+        assert len(schedule) == 3 * 4
+        assert {(first, second) for first, second, _ in schedule} == {('a', 'b'), ('a', 'c'), ('b', 'c')}
+        assert sorted(game_number for first, second, game_number in schedule if (first, second) == ('a', 'c')) == [0, 1, 2, 3]
+        assert len(scheduleGames(['a', 'b'], 4)) == 4
+
+    def test_equal_agents_are_rated_near_zero(self):
+        ratings = estimateElo(round_robin([('a', 'b', 0.5, 0.0), ('a', 'c', 0.25, 0.5), ('b', 'c', 0.4, 0.2)]))
+        assert set(ratings) == {'a', 'b', 'c'}
+        assert all(abs(rating) < 1 for rating in ratings.values())
+        assert abs(sum(ratings.values())) < 1e-6
+
+    def test_dominant_agent_ranks_first_with_finite_rating(self):
+        results = round_robin([('strong', 'weak', 1.0, 0.0), ('strong', 'middle', 1.0, 0.0), ('middle', 'weak', 0.75, 0.0)])
+        ratings = estimateElo(results)
+        assert ratings['strong'] > ratings['middle'] > ratings['weak']
+        assert ratings['strong'] < 2000
+        rows = standings(results, samples=50)
+        assert [row['agent'] for row in rows] == ['strong', 'middle', 'weak']
+        strong = rows[0]
+        assert (strong['games'], strong['wins'], strong['draws']) == (40, 40, 0)
+        assert strong['elo_low'] <= strong['elo'] <= strong['elo_high']
+        assert strong['mean_move_ms'] == pytest.approx(1.0)
+        # weak only ever played second, so its move times are the second ones
+        assert rows[2]['mean_move_ms'] == pytest.approx(2.0)
+
+    def test_bootstrap_intervals_are_seeded_and_ordered(self):
+        results = round_robin([('a', 'b', 0.7, 0.1), ('b', 'c', 0.6, 0.0), ('a', 'c', 0.8, 0.0)])
+        intervals = bootstrapElo(results, samples=50, seed=1)
+        assert intervals == bootstrapElo(results, samples=50, seed=1)
+        for low, high in intervals.values():
+            assert low <= high
+        assert intervals['a'][1] > intervals['c'][0]
+
+    def test_resume_skips_played_games_of_the_same_settings_only(self, tmp_path):
+        path = tmp_path / 'tournament.jsonl'
+        specs = ['RandomAgent', 'GreedyAgent']
+        results = runTournament(specs, 2, str(path), num_rows=4, num_cols=5, seed=1, workers=1)
+        assert len(results) == 2
+        assert all((result['num_rows'], result['num_cols'], result['engine'], result['seed']) == (4, 5, 'grid', 1)
+                   for result in results)
+        # a rerun with the same settings has nothing left to play
+        assert runTournament(specs, 2, str(path), num_rows=4, num_cols=5, seed=1, workers=1) == results
+        assert len(path.read_text().splitlines()) == 2
+        # the games on another board are played again rather than mixed in
+        other = runTournament(specs, 2, str(path), num_rows=5, num_cols=5, seed=1, workers=1)
+        assert len(other) == 2 and all(result['num_rows'] == 5 for result in other)
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert len(lines) == 4
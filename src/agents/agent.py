@@ -1,16 +1,101 @@
+from contextlib import nullcontext
+import copy
 import random
-from typing import Tuple, TYPE_CHECKING
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from .book import OpeningBook
+from .mcts import MCTSNode
+from .metrics import SearchMetrics
+from .ordering import MoveOrdering
+from .parallel import WorkerPool
+from .solver import Solver, SolverTimeout
+from .threats import analyseThreats
+from .transposition import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
 WINNING_PIECES = 4
+# Score of a won position. Larger than any sum of scoreMove weights, reduced by the ply so that faster wins are preferred
+WIN_SCORE = 10 ** (WINNING_PIECES + 3)
+# Scores beyond this are wins or losses at a known distance rather than heuristic values
+WIN_THRESHOLD = WIN_SCORE - 1000
+# 'scoreMove' scores every candidate from the cumulative sums, 'incremental' reads the evaluation the game state
+# maintains move by move
+EVALUATORS = ('scoreMove', 'incremental')
+# 'random' plays uniformly random rollouts, 'scoreMove' picks rollout moves with probability proportional to scoreMove
+ROLLOUT_POLICIES = ('random', 'scoreMove')
 
 if TYPE_CHECKING:
+    from src.agents.solver import Solution
     from src.game_state import GameState, Node
 
 class BaseAgent:
-    def __init__(self, player_number, **kwargs):
+    # attributes left out when the agent is pickled for a WorkerPool, the worker copies build their own
+    WORKER_EXCLUDED = ('worker_pool', '_ponder_thread', 'metrics')
+
+    def __init__(
+        self, player_number, depth: int = 2, timeout: Optional[float] = None, evaluator: str = 'scoreMove',
+        workers: int = 1, ponder: bool = False, metrics: Optional[SearchMetrics] = None, **kwargs
+    ):
+        ''' <depth> is the maximum search depth and <timeout> the total number of seconds the agent may spend computing
+        over a single game. Agents that do not search ignore both. <evaluator> is one of EVALUATORS. Search agents split
+        each move across <workers> processes when it is more than 1. With <ponder> they keep searching in a background
+        thread while the opponent thinks, see startPondering. Agents that score or search moves report every move to
+        <metrics> when given.
+        '''
+        if evaluator not in EVALUATORS:
+            raise ValueError(f"Unknown evaluator {evaluator}, expected one of {EVALUATORS}")
         self.identifier = player_number
-        self.BLOCKING_WEIGHT = (10**WINNING_PIECES)/2
+        self.BLOCKING_WEIGHT = (10**WINNING_PIECES)//2
         self.WEIGHTS = {num_pieces: 10 ** num_pieces for num_pieces in range(WINNING_PIECES + 1)}
         self.CENTRE_COL_WEIGHT = 2
+        self.depth = int(depth)
+        self.timeout = timeout
+        self.time_used = 0.0
+        self.evaluator = evaluator
+        self.workers = int(workers)
+        self.worker_pool = WorkerPool(self.workers) if self.workers > 1 else None
+        self._worker_key = uuid.uuid4().hex
+        self.ponder = ponder
+        self._ponder_thread = None
+        # set by stopPondering, the pondering search checks it the way it checks its deadline
+        self._ponder_stop = False
+        self.metrics = metrics
+
+    def startPondering(self, game_state: "GameState"):
+        ''' Start pondering on a copy of <game_state>, the position the opponent now has to move in, when the agent
+        ponders. Game calls this as the turn passes to the opponent and stopPondering once their move is made.
+        '''
+        if not self.ponder or self.worker_pool is not None:
+            return
+        self.stopPondering()
+        self._ponder_thread = threading.Thread(target=self.ponderOn, args=(copy.deepcopy(game_state),), daemon=True)
+        self._ponder_thread.start()
+
+    def stopPondering(self):
+        '''Stop the pondering thread and wait for it, so that the agent's tables are settled before its next move.'''
+        if self._ponder_thread is not None:
+            self._ponder_stop = True
+            self._ponder_thread.join()
+            self._ponder_thread = None
+            self._ponder_stop = False
+
+    def ponderOn(self, game_state: "GameState"):
+        ''' Search <game_state>, a private copy, until self._ponder_stop is set, keeping whatever helps the next move.
+        Runs in the pondering thread. Agents that do not search have nothing to ponder.
+        '''
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.WORKER_EXCLUDED:
+            state[name] = None
+        return state
+
+    def close(self):
+        '''Stop the pondering thread and the worker processes of a parallel agent.'''
+        self.stopPondering()
+        if self.worker_pool is not None:
+            self.worker_pool.close()
 
     def getAction(self, game_state: "GameState") -> Tuple[int, int]:
         """
@@ -19,37 +104,61 @@ class BaseAgent:
         """
         raise NotImplementedError
 
-    def scoreMove(self, game_state: "GameState", move: "Node") -> int:
+    def _phase(self, name: str):
+        '''Context timing phase <name> of the move into the metrics, a no-op without metrics.'''
+        return nullcontext() if self.metrics is None else self.metrics.phase(name)
+
+    def _reportMove(self, game_state: "GameState", action: Tuple[int, int], counts: Dict[str, int], **extra):
+        ''' Add the <counts> of the move to the metrics and close its record, <extra> values go into the record as
+        they are. Does nothing without metrics.
+        '''
+        if self.metrics is None:
+            return
+        self.metrics.add(**counts)
+        self.metrics.endMove(type(self).__name__, self.identifier, game_state.move_numer, action, **extra)
+
+    def _moveTimeBudget(self, game_state: "GameState") -> Optional[float]:
+        ''' Split the time left for the game evenly over the moves this agent still has to play.'''
+        if self.timeout is None:
+            return None
+        remaining_moves = max(1, (game_state.num_rows * game_state.num_cols - game_state.move_numer + 1) // 2)
+        return max(0.0, float(self.timeout) - self.time_used) / remaining_moves
+
+    def scoreMove(self, game_state: "GameState", move: "Node", player_number: Optional[int] = None) -> int:
         ''' Score current move. The score is base on whether the move is blocking opposite player, or advancing self
         game. Scoring is agnosting of the player and assumes both player are utilizing the same scoring function which
         is a simplifying assumption. Hence score will also be a positive value.
 
         Scoring of the current action has to be evaluated using only the state of the board after taking this particular
         action and nothing else. Using depth and other optimization is the job of algorithm and should not be done here
+
+        <player_number> is the player making the move and defaults to this agent. Search agents use it to score the
+        moves of the opponent as well.
         '''
+        player = self.identifier if player_number is None else player_number
         score = 0
         if move.col == game_state.centre_col:
             score += self.CENTRE_COL_WEIGHT
 
         # Get the longest continuous streak created by the current move
-        max_row_lookahead_sum = self.identifier*(
+        max_row_lookahead_sum = player*(
             game_state.getMaxLookAheadSum(move, [0, 1], lambda sum_: sum_.row_sum if sum_ else 0)
             if game_state.getNextNode(move.row, move.col, [0, 1])
             else 0
         )
-        max_row_sum = max(self.identifier*move.cumulative_sum.row_sum, max_row_lookahead_sum)
-        max_pos_slope_diag_lookahead_sum = self.identifier*(
+        max_row_sum = max(player*move.cumulative_sum.row_sum, max_row_lookahead_sum)
+        max_pos_slope_diag_lookahead_sum = player*(
             game_state.getMaxLookAheadSum(move, [1, 1], lambda sum_: sum_.pos_slope_diag_sum if sum_ else 0)
             if game_state.getNextNode(move.row, move.col, [1, 1])
             else 0
         )
-        max_pos_slope_sum = max(self.identifier*move.cumulative_sum.pos_slope_diag_sum, max_pos_slope_diag_lookahead_sum)
-        max_neg_slope_diag_lookahead_sum = self.identifier*(
+        max_pos_slope_sum = max(player*move.cumulative_sum.pos_slope_diag_sum, max_pos_slope_diag_lookahead_sum)
+        max_neg_slope_diag_lookahead_sum = player*(
             game_state.getMaxLookAheadSum(move, [-1, 1], lambda sum_: sum_.neg_slope_diag_sum if sum_ else 0)
             if game_state.getNextNode(move.row, move.col, [-1, 1])
             else 0
         )
-        max_neg_slope_sum = max(self.identifier*move.cumulative_sum.neg_slope_diag_sum, max_neg_slope_diag_lookahead_sum)
+        max_neg_slope_sum = max(player*move.cumulative_sum.neg_slope_diag_sum, max_neg_slope_diag_lookahead_sum)
 
         if game_state.isBlockingMove(move):
             if game_state.verbose:
@@ -57,7 +166,7 @@ class BaseAgent:
             score += self.BLOCKING_WEIGHT
 
         score += (
-            self.WEIGHTS[max_row_sum] + self.WEIGHTS[self.identifier*move.cumulative_sum.col_sum] +
+            self.WEIGHTS[max_row_sum] + self.WEIGHTS[player*move.cumulative_sum.col_sum] +
             self.WEIGHTS[max_pos_slope_sum] + self.WEIGHTS[max_neg_slope_sum]
         )
         return score
@@ -71,28 +180,609 @@ class RandomAgent(BaseAgent):
 
 class GreedyAgent(BaseAgent):
     def getAction(self, game_state: "GameState") -> Tuple[int, int]:
-        assert game_state.current_player == -1
+        assert game_state.current_player == self.identifier
+        if self.evaluator == 'incremental':
+            game_state.trackLines()
         moves = game_state.getPossibleMoves()
         best_score = float('-inf')
         best_move = None
-        for move, move_node in moves.items():
-            move_node.cumulative_sum = game_state.updateNodeCumulativeSum(self.identifier, move)
-            score = self.scoreMove(game_state, move_node)
-            if score > best_score:
-                best_score = score
-                best_move = move
+        with self._phase('evaluate'):
+            for move, move_node in moves.items():
+                if self.evaluator == 'incremental':
+                    score = game_state.scoreIfPlayed(move[1], self.identifier)
+                    if score > best_score:
+                        best_score = score
+                        best_move = move
+                    continue
+                score = self.scoreMove(game_state, game_state.moveNode(self.identifier, move))
+                if score > best_score:
+                    best_score = score
+                    best_move = move
         if game_state.verbose:
             print(f"best score is : {best_score} for best move : {best_move}")
+        self._reportMove(game_state, best_move, {'nodes': len(moves), 'evaluations': len(moves)})
         return best_move
 
+class SearchTimeout(Exception):
+    '''Raised inside a search when the time budget for the current move has run out.'''
+
+
 class MinMaxAgent(BaseAgent):
-    def getAction(self, game_state:"GameState"):
-        pass
+    ''' Negamax search over make_move / unmake_move on the live game state, so no board is ever copied. Leaves are
+    scored with scoreMove: the best move available to the player to move minus the best move available to the opponent.
+
+    The search deepens iteratively from depth 1 up to self.depth and stops when the time budget for the move runs out,
+    returning the best move of the last depth that completed.
+
+    With more than one worker every iteration is split at the root instead: each root move is searched with a full
+    window in a worker process, on a copy of the game state, and the best score wins with ties going
+    to the earlier move in centre first order, so the result does not depend on which worker finishes first.
+    '''
+    PRUNE = False
+    WORKER_EXCLUDED = BaseAgent.WORKER_EXCLUDED + ('transposition_table', 'solver', 'book')
 
-class AlphaBetaAgent(BaseAgent) :
-    def getAction(self, game_state: "GameState"):
-        pass
+    def __init__(
+        self, player_number, tt_size_mb: float = 0, keep_tt: bool = False, solver_empty_cells: int = 0,
+        book_path: Optional[str] = None, threats: bool = False, move_ordering: bool = False, **kwargs
+    ):
+        ''' <tt_size_mb> sizes the transposition table shared by all the iterations of one getAction call, 0 disables
+        it. With <keep_tt>, or when pondering, the same table is also kept across the moves of a game. Once at most <solver_empty_cells>
+        cells are empty the agent tries to solve the position exactly before falling back to the heuristic search.
+        Positions found in the opening book at <book_path> (see build_book.py) are played from the book.
+        With <threats> every node is checked for wins and losses its threats force (see threats.py), moves that lose
+        at once are skipped and leaves score the row parity of the threats as well. <move_ordering> replaces the plain
+        centre first order with MoveOrdering (killer moves, history heuristic and tactical moves first).
+        '''
+        super().__init__(player_number, **kwargs)
+        self.tt_size_mb = float(tt_size_mb)
+        # the point of pondering is the table it leaves behind
+        self.keep_tt = keep_tt or self.ponder
+        # counts of the last search, see SearchMetrics
+        self.nodes = self.evaluations = self.cutoffs = 0
+        self.ponder_nodes = 0
+        self.transposition_table = None
+        self.solver_empty_cells = int(solver_empty_cells)
+        self.solver = None
+        self.last_solution = None
+        self.book_path = book_path
+        self.book = None
+        self.threats = threats
+        self.THREAT_WEIGHT = 10 ** (WINNING_PIECES - 1)
+        self.ordering = MoveOrdering() if move_ordering else None
+
+    def _bestMoveScore(self, game_state: "GameState", player_number: int) -> int:
+        best_score = 0
+        for move in game_state.getPossibleMoves():
+            move_node = game_state.moveNode(player_number, move)
+            best_score = max(best_score, self.scoreMove(game_state, move_node, player_number))
+        return best_score
+
+    def evaluate(self, game_state: "GameState") -> int:
+        ''' Heuristic value of the position for the player to move.'''
+        self.evaluations += 1
+        player = game_state.current_player
+        threat_score = self.THREAT_WEIGHT * analyseThreats(game_state).parityScore(player) if self.threats else 0
+        if self.evaluator == 'incremental':
+            return player * game_state.evaluation + threat_score
+        own_score = self._bestMoveScore(game_state, player)
+        # isBlockingMove reads the player to move from the game state
+        game_state.current_player = -player
+        try:
+            opponent_score = self._bestMoveScore(game_state, -player)
+        finally:
+            game_state.current_player = player
+        return own_score - opponent_score + threat_score
+
+    def orderColumns(self, game_state: "GameState", columns: List[int]) -> List[int]:
+        ''' Centre columns first, they take part in the most winning lines.'''
+        return sorted(columns, key=lambda col: abs(col - game_state.centre_col))
+
+    def orderMoves(
+        self, game_state: "GameState", columns: List[int], ply: int, first_col: Optional[int] = None
+    ) -> List[int]:
+        '''<columns> in search order at <ply>, <first_col> (the transposition table or previous iteration move) first.'''
+        if self.ordering is not None:
+            return self.ordering.order(game_state, columns, ply, first_col)
+        ordered_columns = self.orderColumns(game_state, columns)
+        if first_col in ordered_columns:
+            ordered_columns.remove(first_col)
+            ordered_columns.insert(0, first_col)
+        return ordered_columns
+
+    def _checkTime(self):
+        self.nodes += 1
+        if self._ponder_stop or self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+
+    @staticmethod
+    def _scoreToTable(score: float, ply: int) -> float:
+        ''' Win and loss scores count plies from the root. The table stores them relative to the stored position so
+        that an entry stays valid when the position is reached at another ply.
+        '''
+        if score >= WIN_THRESHOLD:
+            return score + ply
+        if score <= -WIN_THRESHOLD:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _scoreFromTable(score: float, ply: int) -> float:
+        if score >= WIN_THRESHOLD:
+            return score - ply
+        if score <= -WIN_THRESHOLD:
+            return score + ply
+        return score
+
+    def negamax(self, game_state: "GameState", depth: int, alpha: float, beta: float, ply: int) -> float:
+        self._checkTime()
+        if game_state.game_complete:
+            # the player who just moved has won
+            return -(WIN_SCORE - ply)
+        columns = game_state.getPossibleColumns()
+        if not columns:
+            return 0
+        if self.threats:
+            threats = analyseThreats(game_state)
+            forced = threats.forcedOutcome()
+            if forced is not None:
+                sign, plies = forced
+                return sign * (WIN_SCORE - ply - plies)
+            columns = threats.nonLosingColumns()
+
+        table = self.transposition_table
+        tt_move = None
+        if table is not None:
+            # mirror images share an entry, with the move stored as played on the canonical side
+            key, mirrored = game_state.canonicalHash()
+            entry = table.probe(key)
+            if entry is not None:
+                tt_depth, flag, tt_score, tt_move = entry
+                if mirrored and tt_move is not None:
+                    tt_move = game_state.mirrorMove(tt_move)
+                if tt_depth >= depth:
+                    tt_score = self._scoreFromTable(tt_score, ply)
+                    if flag == EXACT:
+                        return tt_score
+                    if flag == LOWER_BOUND:
+                        alpha = max(alpha, tt_score)
+                    elif flag == UPPER_BOUND:
+                        beta = min(beta, tt_score)
+                    if alpha >= beta:
+                        return tt_score
+
+        if depth == 0:
+            score = self.evaluate(game_state)
+            if table is not None:
+                table.store(key, 0, EXACT, score, None)
+            return score
+
+        alpha_orig = alpha
+        best_score, best_col = float('-inf'), None
+        ordered_columns = self.orderMoves(game_state, columns, ply, tt_move)
+        for index, col in enumerate(ordered_columns):
+            game_state.make_move(col)
+            try:
+                score = -self.negamax(game_state, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game_state.unmake_move()
+            if score > best_score:
+                best_score, best_col = score, col
+            alpha = max(alpha, score)
+            if self.PRUNE and alpha >= beta:
+                self.cutoffs += 1
+                if self.ordering is not None:
+                    self.ordering.recordCutoff(game_state.current_player, ply, col, depth, index == 0)
+                break
 
+        if table is not None:
+            if best_score <= alpha_orig:
+                flag = UPPER_BOUND
+            elif best_score >= beta:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            table.store(
+                key, depth, flag, self._scoreToTable(best_score, ply),
+                game_state.mirrorMove(best_col) if mirrored else best_col
+            )
+        return best_score
 
+    def searchRoot(self, game_state: "GameState", depth: int, first_col: Optional[int]) -> Tuple[int, float]:
+        ''' Search every root move to <depth> and return the best column with its score. <first_col>, the best move of
+        the previous iteration, is searched first.
+        '''
+        columns = game_state.getPossibleColumns()
+        if self.threats:
+            # when every move loses, the search still has to pick one of them
+            columns = analyseThreats(game_state).nonLosingColumns() or columns
+        columns = self.orderMoves(game_state, columns, 0, first_col)
+        best_col, best_score = columns[0], float('-inf')
+        alpha, beta = float('-inf'), float('inf')
+        for col in columns:
+            game_state.make_move(col)
+            try:
+                score = -self.negamax(game_state, depth - 1, -beta, -alpha, 1)
+            finally:
+                game_state.unmake_move()
+            if score > best_score:
+                best_col, best_score = col, score
+            alpha = max(alpha, score)
+        return best_col, best_score
 
+    def _resetTable(self, keep_tt: bool = False):
+        '''Start a search with an empty transposition table, or the kept one with <keep_tt>.'''
+        if self.tt_size_mb <= 0:
+            return
+        if self.transposition_table is None:
+            self.transposition_table = TranspositionTable(self.tt_size_mb)
+        elif not keep_tt:
+            self.transposition_table.clear()
+
+    def searchRootMove(
+        self, game_state: "GameState", col: int, depth: int, deadline: Optional[float]
+    ) -> Tuple[int, Optional[float], int]:
+        ''' Score of root move <col> searched to <depth> with a full window, for a worker of a parallel search. Returns
+        the column, its score (None if time.perf_counter() passed <deadline> first) and the number of nodes searched.
+        The deadline is absolute: perf_counter is the system wide monotonic clock on Linux, so a task that waited in
+        the queue gets what is left of the move's time rather than a budget of its own. Every task starts from an
+        empty table and move ordering, whatever <keep_tt> says: scores read from entries left by other root moves
+        depend on which moves the worker happened to be handed before, and so would the result.
+        '''
+        if self.ordering is not None:
+            self.ordering.clear()
+        self._resetTable()
+        self.deadline = deadline
+        self.nodes = self.evaluations = self.cutoffs = 0
+        game_state.make_move(col)
+        try:
+            score = -self.negamax(game_state, depth - 1, float('-inf'), float('inf'), 1)
+        except SearchTimeout:
+            score = None
+        finally:
+            game_state.unmake_move()
+        return col, score, self.nodes
 
+    def parallelSearch(self, game_state: "GameState", deadline: Optional[float] = None) -> Tuple[int, float, int]:
+        '''search split at the root over the worker pool, see the class docstring.'''
+        # the workers search a copy on the same engine and only need the position, not how it was reached
+        board = copy.copy(game_state)
+        board.move_stack = []
+        columns = game_state.getPossibleColumns()
+        if self.threats:
+            columns = analyseThreats(game_state).nonLosingColumns() or columns
+        columns = self.orderColumns(game_state, columns)
+        best_col, best_score, depth_reached = columns[0], 0, 0
+        for depth in range(1, max(1, self.depth) + 1):
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            results = self.worker_pool.map(
+                self._worker_key, self, 'searchRootMove',
+                [(board, col, depth, deadline) for col in columns]
+            )
+            self.nodes += sum(nodes for _, _, nodes in results)
+            if any(score is None for _, score, _ in results):
+                break
+            # max keeps the first of equal scores, so ties go to the move earlier in centre first order
+            best_col, best_score, _ = max(results, key=lambda result: result[1])
+            depth_reached = depth
+            if abs(best_score) >= WIN_SCORE - depth:
+                break
+        return best_col, best_score, depth_reached
+
+    def solvePosition(self, game_state: "GameState", deadline: Optional[float] = None) -> Optional["Solution"]:
+        ''' Exact solution of the position for the player to move, or None if the solver does not finish before
+        <deadline>. The solver and its transposition table are kept for the rest of the game.
+        '''
+        if self.solver is None:
+            self.solver = Solver(game_state.num_rows, game_state.num_cols)
+        try:
+            self.last_solution = self.solver.solve(game_state, deadline)
+        except SolverTimeout:
+            return None
+        if game_state.verbose:
+            print(
+                f"Solved position : {self.last_solution.outcome} in {self.last_solution.distance} plies, best column : "
+                f"{self.last_solution.best_col}, {self.last_solution.nodes} nodes"
+            )
+        return self.last_solution
+
+    def bookMove(self, game_state: "GameState") -> Optional[int]:
+        ''' Best column stored in the opening book for the position, or None when there is no book or no entry.'''
+        if self.book_path is None:
+            return None
+        if self.book is None:
+            self.book = OpeningBook(self.book_path)
+        if (
+            game_state.move_numer > self.book.plies or
+            (self.book.num_rows, self.book.num_cols) != (game_state.num_rows, game_state.num_cols)
+        ):
+            return None
+        key, mirrored = game_state.toBitboard().canonicalKey()
+        entry = self.book.lookup(key)
+        if entry is None:
+            return None
+        score, best_col, exact = entry
+        if mirrored:
+            best_col = game_state.mirrorMove(best_col)
+        if game_state.verbose:
+            print(f"Book move : {best_col} with score {score}{' (exact)' if exact else ''}")
+        return best_col
+
+    def ponderOn(self, game_state: "GameState"):
+        ''' Search the opponent's move one ply deeper than a move of our own, until stopped. The table then holds the
+        positions after every reply, searched to about the depth the next move will search them to.
+        '''
+        game_state.verbose = False
+        self.search(game_state, max_depth=self.depth + 1)
+        self.ponder_nodes = self.nodes
+
+    def search(
+        self, game_state: "GameState", deadline: Optional[float] = None, max_depth: Optional[int] = None
+    ) -> Tuple[int, float, int]:
+        ''' Iterative deepening search of the position for the player to move, stopping at <max_depth> (self.depth by
+        default) or once time.perf_counter() passes <deadline>. Returns the best column, its score and the depth of the last iteration
+        that completed (0 if none did, in which case the column is only the first one in move order).
+        '''
+        self.deadline = deadline
+        self.nodes = self.evaluations = self.cutoffs = 0
+        if self.evaluator == 'incremental':
+            # before the workers get their copies, which keep tracking
+            game_state.trackLines()
+        if self.ordering is not None:
+            self.ordering.newSearch()
+        if self.worker_pool is None:
+            self._resetTable(self.keep_tt)
+        best_col, best_score, depth_reached = None, 0, 0
+        if self.worker_pool is not None:
+            best_col, best_score, depth_reached = self.parallelSearch(game_state, deadline)
+        else:
+            for depth in range(1, max(1, self.depth if max_depth is None else max_depth) + 1):
+                try:
+                    best_col, best_score = self.searchRoot(game_state, depth, best_col)
+                except SearchTimeout:
+                    break
+                depth_reached = depth
+                if abs(best_score) >= WIN_SCORE - depth:
+                    # the outcome is proven, searching deeper cannot change it
+                    break
+        if depth_reached == 0:
+            best_col = self.orderColumns(game_state, game_state.getPossibleColumns())[0]
+        if game_state.verbose:
+            print(f"{type(self).__name__} searched {self.nodes} nodes to depth {depth_reached}, best column : {best_col}")
+            if self.transposition_table is not None:
+                print(f"Transposition table : {self.transposition_table.stats()}")
+            if self.ordering is not None:
+                print(f"Move ordering : {self.ordering.stats()}")
+        return best_col, best_score, depth_reached
+
+    def getAction(self, game_state: "GameState") -> Tuple[int, int]:
+        assert game_state.current_player == self.identifier
+        self.stopPondering()
+        start = time.perf_counter()
+        budget = self._moveTimeBudget(game_state)
+        with self._phase('book'):
+            best_col = self.bookMove(game_state)
+        source, counts, depth_reached = 'book', {}, 0
+        empty_cells = game_state.num_rows * game_state.num_cols - game_state.move_numer
+        if best_col is None and empty_cells <= self.solver_empty_cells:
+            # leave half of the budget to the heuristic search in case the solver does not finish
+            with self._phase('solver'):
+                solution = self.solvePosition(game_state, None if budget is None else start + budget / 2)
+            if solution is not None:
+                best_col, source, counts = solution.best_col, 'solver', {'nodes': solution.nodes}
+        if best_col is None:
+            table_hits = 0 if self.transposition_table is None else self.transposition_table.hits
+            with self._phase('search'):
+                best_col, _, depth_reached = self.search(game_state, None if budget is None else start + budget)
+            if self.transposition_table is not None:
+                # a kept table counts its hits over the whole game
+                table_hits = self.transposition_table.hits - table_hits if self.keep_tt else self.transposition_table.hits
+            source = 'search'
+            counts = {
+                'nodes': self.nodes, 'evaluations': self.evaluations, 'cache_hits': table_hits, 'cutoffs': self.cutoffs
+            }
+        self.time_used += time.perf_counter() - start
+        action = (game_state.getNextRow(best_col), best_col)
+        self._reportMove(game_state, action, counts, depth=depth_reached, source=source, ponder_nodes=self.ponder_nodes)
+        return action
+
+
+class AlphaBetaAgent(MinMaxAgent):
+    ''' MinMaxAgent with alpha-beta pruning and, by default, a 16MB transposition table and MoveOrdering.'''
+    PRUNE = True
+
+    def __init__(self, player_number, tt_size_mb: float = 16, move_ordering: bool = True, **kwargs):
+        super().__init__(player_number, tt_size_mb=tt_size_mb, move_ordering=move_ordering, **kwargs)
+
+
+class SolverAgent(AlphaBetaAgent):
+    ''' AlphaBetaAgent that plays perfectly once at most <solver_empty_cells> cells are left, 14 by default.'''
+    def __init__(self, player_number, solver_empty_cells: int = 14, **kwargs):
+        super().__init__(player_number, solver_empty_cells=solver_empty_cells, **kwargs)
+
+
+class MCTSAgent(BaseAgent):
+    ''' Monte Carlo tree search with UCT selection, for boards too large to search full width.
+
+    Every playout walks the tree by UCT, adds one node and plays the game out to the end. Playouts run by make_move /
+    unmake_move on one BitboardGameState copy of the position per move, never on the Node graph of GameState. The tree
+    is kept between moves: the subtree of the move played becomes the root, and on the next call the child matching the
+    opponent's reply does.
+
+    The agent plays until its share of <timeout> for the move runs out, or <playouts> playouts without a timeout, and
+    keeps the playouts per second of its last move in playouts_per_second.
+
+    With more than one worker the search is root parallel: every worker process grows its own tree from the position
+    with its own random seed, drawn from the random module, and the visits and wins of the root moves are summed over
+    the workers. The most visited move wins, the leftmost of equal ones. Trees are not kept between moves then.
+    '''
+    WORKER_EXCLUDED = BaseAgent.WORKER_EXCLUDED + ('root',)
+
+    def __init__(
+        self, player_number, exploration: float = 1.4, rollout_policy: str = 'random', playouts: int = 1000, **kwargs
+    ):
+        ''' <exploration> is the UCT exploration constant and <rollout_policy> one of ROLLOUT_POLICIES.'''
+        super().__init__(player_number, **kwargs)
+        if rollout_policy not in ROLLOUT_POLICIES:
+            raise ValueError(f"Unknown rollout policy {rollout_policy}, expected one of {ROLLOUT_POLICIES}")
+        self.exploration = float(exploration)
+        self.rollout_policy = rollout_policy
+        self.playouts = int(playouts)
+        self.root = None
+        # (num_rows, num_cols, stones of player 1, all stones) of the root position
+        self._root_position = None
+        self.last_playouts = 0
+        self.playouts_per_second = 0.0
+        self.ponder_playouts = 0
+
+    def _findRoot(self, board: "GameState") -> MCTSNode:
+        ''' The kept subtree for the position on <board> when it is the last root or follows from it by one move, a
+        new root otherwise.
+        '''
+        if self.root is not None and self._root_position is not None:
+            num_rows, num_cols, stones, mask = self._root_position
+            new_stone = board.mask & ~mask
+            if (num_rows, num_cols, stones, mask) == (board.num_rows, board.num_cols, board.boards[1], board.mask):
+                return self.root
+            if (
+                (num_rows, num_cols) == (board.num_rows, board.num_cols) and board.mask & mask == mask and
+                board.boards[1] & mask == stones and new_stone and not new_stone & (new_stone - 1)
+            ):
+                child = self.root.children.get((new_stone.bit_length() - 1) // (num_rows + 1) + 1)
+                if child is not None:
+                    child.parent = None
+                    return child
+        return MCTSNode(move=None, player=-board.current_player, untried=board.getPossibleColumns())
+
+    def _rolloutMove(self, board: "GameState") -> int:
+        if self.rollout_policy == 'random':
+            return random.choice(board.getPossibleColumns())
+        columns, weights = [], []
+        for move in board.getPossibleMoves():
+            columns.append(move[1])
+            weights.append(self.scoreMove(board, board.moveNode(board.current_player, move), board.current_player))
+        return random.choices(columns, weights)[0]
+
+    def playout(self, root: MCTSNode, board: "GameState"):
+        ''' Select a leaf of the tree below <root>, expand it by one node, play the game out at random and record the
+        result on the way back up. <board> holds the root position and is left as it was.
+        '''
+        node = root
+        num_moves = 0
+        try:
+            while not node.isLeaf():
+                node = node.selectChild(self.exploration)
+                board.make_move(node.move)
+                num_moves += 1
+            if node.untried and not board.game_complete:
+                col = node.untried.pop(random.randrange(len(node.untried)))
+                board.make_move(col)
+                num_moves += 1
+                node = node.addChild(col, [] if board.game_complete else board.getPossibleColumns())
+            while not board.game_complete and board.move_numer < board.num_rows * board.num_cols:
+                board.make_move(self._rolloutMove(board))
+                num_moves += 1
+            # make_move has passed the turn on, so a finished game was won by the other player
+            winner = -board.current_player if board.game_complete else 0
+        finally:
+            for _ in range(num_moves):
+                board.unmake_move()
+        while node is not None:
+            node.update(winner)
+            node = node.parent
+
+    def ponderOn(self, game_state: "GameState"):
+        '''Grow the kept tree from the opponent's position until stopped, the reply's subtree becomes the next root.'''
+        board = game_state.toBitboard()
+        board.verbose = False
+        root = self._findRoot(board)
+        self.root = root
+        self._root_position = (board.num_rows, board.num_cols, board.boards[1], board.mask)
+        self.ponder_playouts = 0
+        while not self._ponder_stop:
+            self.playout(root, board)
+            self.ponder_playouts += 1
+
+    def runPlayouts(self, root: MCTSNode, board: "GameState", budget: Optional[float]) -> int:
+        '''Playouts from <root> until <budget> seconds have passed, or self.playouts of them. Returns how many ran.'''
+        start = time.perf_counter()
+        playouts = 0
+        while (
+            playouts < self.playouts if budget is None else playouts == 0 or time.perf_counter() - start < budget
+        ):
+            self.playout(root, board)
+            playouts += 1
+        return playouts
+
+    def rootStatistics(
+        self, board: "GameState", deadline: Optional[float], seed: int
+    ) -> Tuple[Dict[int, Tuple[int, float]], int]:
+        ''' Visits and wins of every root move after searching a new tree from <board> with random seed <seed> until
+        time.perf_counter() passes <deadline>, and the number of playouts, for a worker of a root parallel search. The
+        deadline is absolute, see MinMaxAgent.searchRootMove.
+        '''
+        random.seed(seed)
+        root = MCTSNode(move=None, player=-board.current_player, untried=board.getPossibleColumns())
+        playouts = self.runPlayouts(root, board, None if deadline is None else max(0.0, deadline - time.perf_counter()))
+        return {col: (child.visits, child.wins) for col, child in root.children.items()}, playouts
+
+    def parallelStatistics(
+        self, board: "GameState", budget: Optional[float]
+    ) -> Tuple[Dict[int, Tuple[int, float]], int]:
+        '''rootStatistics summed over the worker pool, see the class docstring.'''
+        seeds = [random.getrandbits(32) for _ in range(self.workers)]
+        deadline = None if budget is None else time.perf_counter() + budget
+        results = self.worker_pool.map(
+            self._worker_key, self, 'rootStatistics', [(board, deadline, seed) for seed in seeds]
+        )
+        statistics = {}
+        for worker_statistics, _ in results:
+            for col, (visits, wins) in worker_statistics.items():
+                total_visits, total_wins = statistics.get(col, (0, 0.0))
+                statistics[col] = (total_visits + visits, total_wins + wins)
+        return statistics, sum(playouts for _, playouts in results)
+
+    def getAction(self, game_state: "GameState") -> Tuple[int, int]:
+        assert game_state.current_player == self.identifier
+        self.stopPondering()
+        start = time.perf_counter()
+        budget = self._moveTimeBudget(game_state)
+        board = game_state.toBitboard()
+        board.verbose = False
+        with self._phase('playouts'):
+            if self.worker_pool is not None:
+                board.move_stack = []
+                statistics, playouts = self.parallelStatistics(board, budget)
+                reused_visits = 0
+                best_col = max(sorted(statistics), key=lambda col: statistics[col][0])
+                self.root = None
+            else:
+                root = self._findRoot(board)
+                reused_visits = root.visits
+                playouts = self.runPlayouts(root, board, budget)
+                statistics = {col: (child.visits, child.wins) for col, child in root.children.items()}
+                best_col = root.mostVisitedChild().move
+        elapsed = time.perf_counter() - start
+        self.time_used += elapsed
+        self.last_playouts = playouts
+        self.playouts_per_second = playouts / elapsed if elapsed > 0 else 0.0
+
+        if game_state.verbose:
+            visits, wins = statistics[best_col]
+            print(
+                f"{type(self).__name__} ran {playouts} playouts ({self.playouts_per_second:.0f} playouts/s) on top of "
+                f"{reused_visits} kept from the last move, best column : {best_col} won {wins / visits:.2f} of "
+                f"{visits} visits"
+            )
+        if self.worker_pool is None:
+            board.make_move(best_col)
+            self.root = root.children[best_col]
+            self.root.parent = None
+            self._root_position = (board.num_rows, board.num_cols, board.boards[1], board.mask)
+        action = (game_state.getNextRow(best_col), best_col)
+        # every playout adds one node to the tree
+        self._reportMove(
+            game_state, action, {'nodes': playouts}, playouts_per_second=self.playouts_per_second,
+            reused_visits=reused_visits, ponder_playouts=self.ponder_playouts
+        )
+        return action
@@ -0,0 +1,79 @@
+from typing import Dict, Iterable, TYPE_CHECKING
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINNING_PIECES = 4
+CENTRE_COL_WEIGHT = 2
+# weight of a window holding WINNING_PIECES-1 pieces of one player and an empty cell
+THREAT_WEIGHT = 10 ** WINNING_PIECES // 2
+
+if TYPE_CHECKING:
+    from src.game_state import GameState
+
+
+def statesToArray(game_states: Iterable["GameState"]) -> np.ndarray:
+    ''' Stack game states of the same size into an (N, num_rows, num_cols) int8 array holding 1, -1 or 0 per cell.
+    Index [n, 0, 0] is row 1, col 1 of the n-th state, the bottom left cell.
+    '''
+    game_states = list(game_states)
+    num_rows, num_cols = game_states[0].num_rows, game_states[0].num_cols
+    boards = np.zeros((len(game_states), num_rows, num_cols), dtype=np.int8)
+    for idx, game_state in enumerate(game_states):
+        for (row, col), node in game_state.grid.items():
+            boards[idx, row - 1, col - 1] = node.value
+    return boards
+
+
+def boardWindows(boards: np.ndarray, length: int = WINNING_PIECES) -> np.ndarray:
+    ''' Every line of <length> cells of every board as an (N, num_lines, length) strided view: rows, columns, and the
+    two diagonals taken from the <length> x <length> squares of the board.
+    '''
+    num_boards, num_rows, num_cols = boards.shape
+    windows = []
+    if num_cols >= length:
+        windows.append(sliding_window_view(boards, length, axis=2).reshape(num_boards, -1, length))
+    if num_rows >= length:
+        windows.append(sliding_window_view(boards, length, axis=1).reshape(num_boards, -1, length))
+    if num_rows >= length and num_cols >= length:
+        squares = sliding_window_view(boards, (length, length), axis=(1, 2))
+        # row 0 is the bottom row, so the main diagonal of a square has a positive slope
+        windows.append(np.diagonal(squares, axis1=-2, axis2=-1).reshape(num_boards, -1, length))
+        windows.append(np.diagonal(squares[..., ::-1, :], axis1=-2, axis2=-1).reshape(num_boards, -1, length))
+    if not windows:
+        return np.zeros((num_boards, 0, length), dtype=boards.dtype)
+    return np.concatenate(windows, axis=1)
+
+
+def evaluateBoards(boards: np.ndarray, player_number: int = 1) -> Dict[str, np.ndarray]:
+    ''' Score N boards at once for <player_number>, the vectorised counterpart of the streak, blocking and centre
+    terms of BaseAgent.scoreMove.
+
+    Every window of WINNING_PIECES cells that the opponent has not entered scores 10 ** (own pieces in it) for the
+    player, and the same for the opponent. threats counts the windows one piece short of a win, and centre the pieces
+    in the centre column. Returns one length N array per term plus their combination under 'score', all from the point
+    of view of <player_number>, and a 'won' flag for boards where the player already has WINNING_PIECES in a row.
+    '''
+    boards = np.asarray(boards, dtype=np.int8)
+    windows = boardWindows(boards)
+    own = (windows == player_number).sum(axis=-1)
+    opponent = (windows == -player_number).sum(axis=-1)
+    weights = 10 ** np.arange(WINNING_PIECES + 1, dtype=np.int64)
+    own_open = opponent == 0
+    opponent_open = own == 0
+    streak = (
+        np.where(own_open, weights[own], 0).sum(axis=-1) - np.where(opponent_open, weights[opponent], 0).sum(axis=-1)
+    )
+    threats = (own_open & (own == WINNING_PIECES - 1)).sum(axis=-1)
+    opponent_threats = (opponent_open & (opponent == WINNING_PIECES - 1)).sum(axis=-1)
+    centre_col = (boards.shape[2] + 1) // 2 - 1
+    centre_column = boards[:, :, centre_col]
+    centre = CENTRE_COL_WEIGHT * ((centre_column == player_number).sum(axis=-1) - (centre_column == -player_number).sum(axis=-1))
+    return {
+        'streak': streak,
+        'threats': threats,
+        'opponent_threats': opponent_threats,
+        'centre': centre,
+        'score': streak + THREAT_WEIGHT * (threats - opponent_threats) + centre,
+        'won': (own == WINNING_PIECES).any(axis=-1),
+    }
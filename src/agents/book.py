@@ -0,0 +1,74 @@
+import bisect
+import mmap
+import struct
+from typing import Dict, Optional, Tuple
+
+# magic, format version, num_rows, num_cols, plies, number of entries
+HEADER = struct.Struct('<4sBBBBI')
+# position key, score for the player to move, best column, flags
+ENTRY = struct.Struct('<QiBB')
+_KEY = struct.Struct('<Q')
+MAGIC = b'C4BK'
+# 2: keys and best columns are those of the canonical (mirror folded) position
+VERSION = 2
+# the score was proven by the solver rather than estimated by a depth limited search
+FLAG_EXACT = 1
+# bits of the key field, BitboardGameState.positionKey takes (num_rows+1)*num_cols of them
+KEY_BITS = 8 * _KEY.size
+
+
+def checkBoardSize(num_rows: int, num_cols: int):
+    '''Raises ValueError for boards whose position keys do not fit in the key field of a book entry.'''
+    if (num_rows + 1) * num_cols > KEY_BITS:
+        raise ValueError(
+            f"Opening books support boards with (num_rows+1)*num_cols <= {KEY_BITS}, not {num_rows}x{num_cols}"
+        )
+
+
+def writeBook(path: str, num_rows: int, num_cols: int, plies: int, entries: Dict[int, Tuple[int, int, bool]]):
+    ''' Write <entries>, a mapping of BitboardGameState.canonicalKey to (score, best column, exact), sorted by key.
+    The best column is the one for the canonical orientation of the position.
+    '''
+    checkBoardSize(num_rows, num_cols)
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, num_rows, num_cols, plies, len(entries)))
+        for key in sorted(entries):
+            score, best_col, exact = entries[key]
+            book_file.write(ENTRY.pack(key, int(score), best_col, FLAG_EXACT if exact else 0))
+
+
+class OpeningBook:
+    ''' Read only opening book built by build_book.py.
+
+    The file is memory mapped rather than parsed, so opening it is O(1) whatever its size, lookups are a binary
+    search that only touches the pages it reads, and every process using the same book shares those pages.
+    '''
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.num_rows, self.num_cols, self.plies, self.num_entries = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self.num_entries
+
+    def __getitem__(self, idx: int) -> int:
+        # keys only, so that bisect can search the file directly
+        return _KEY.unpack_from(self._mmap, HEADER.size + idx * ENTRY.size)[0]
+
+    def lookup(self, key: int) -> Optional[Tuple[int, int, bool]]:
+        ''' Returns (score, best column, exact) for the position key, or None if it is not in the book.'''
+        idx = bisect.bisect_left(self, key)
+        if idx < self.num_entries and self[idx] == key:
+            self.hits += 1
+            _, score, best_col, flags = ENTRY.unpack_from(self._mmap, HEADER.size + idx * ENTRY.size)
+            return score, best_col, bool(flags & FLAG_EXACT)
+        self.misses += 1
+        return None
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
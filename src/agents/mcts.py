@@ -0,0 +1,51 @@
+import math
+from typing import Dict, List, Optional
+
+import attr
+
+
+@attr.s(slots=True, eq=False)
+class MCTSNode:
+    ''' Node of a Monte Carlo search tree. <player> is the player who made <move>, the column that leads from the parent
+    to this node, and <wins> counts the playouts through the node from their side, a draw counting half.
+    '''
+    move: Optional[int] = attr.ib()
+    player: int = attr.ib()
+    untried: List[int] = attr.ib()
+    parent: Optional["MCTSNode"] = attr.ib(default=None)
+    children: Dict[int, "MCTSNode"] = attr.ib(factory=dict)
+    visits: int = attr.ib(default=0)
+    wins: float = attr.ib(default=0.0)
+
+    def isLeaf(self) -> bool:
+        return bool(self.untried) or not self.children
+
+    def selectChild(self, exploration: float) -> "MCTSNode":
+        ''' Child with the highest UCT value: its win rate plus an exploration bonus that shrinks as it is visited
+        more often than its siblings.
+        '''
+        log_visits = math.log(self.visits)
+        return max(
+            self.children.values(),
+            key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+        )
+
+    def addChild(self, move: int, untried: List[int]) -> "MCTSNode":
+        child = MCTSNode(move=move, player=-self.player, untried=untried, parent=self)
+        self.children[move] = child
+        return child
+
+    def update(self, winner: int):
+        '''Record a playout won by <winner>, 0 for a draw.'''
+        self.visits += 1
+        if winner == self.player:
+            self.wins += 1
+        elif winner == 0:
+            self.wins += 0.5
+
+    def mostVisitedChild(self) -> "MCTSNode":
+        return max(self.children.values(), key=lambda child: child.visits)
+
+    def size(self) -> int:
+        '''Number of nodes in the tree below and including this one.'''
+        return 1 + sum(child.size() for child in self.children.values())
@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+import json
+import time
+from typing import Any, Dict, Iterator, Optional, TextIO
+
+
+class SearchMetrics:
+    ''' Counters and phase timers of one agent's moves, written out as one JSON line per move.
+
+    Agents count nodes, evaluations and cutoffs in their own int attributes during a search and add them here once the
+    move is chosen, and the game state adds one to <updates> for every update when it holds a SearchMetrics in its
+    metrics attribute, so nothing on the hot path looks at this object. An agent or game state without metrics (None,
+    the default) pays for a None check per move, or per update for the game state.
+
+    Each record holds the agent, player, move number and action, the counters since the last record, the seconds spent
+    in every phase and whatever extra values the agent passes to endMove, such as the depth reached.
+    '''
+    COUNTERS = ('nodes', 'evaluations', 'cache_hits', 'cutoffs', 'updates')
+
+    def __init__(self, output: Optional[TextIO] = None):
+        ''' Records are written to <output>, a text file, when given. The last one is also kept in last_record.'''
+        self.output = output
+        self.last_record: Optional[Dict[str, Any]] = None
+        self.moves = 0
+        self.reset()
+
+    @classmethod
+    def toFile(cls, path: str) -> "SearchMetrics":
+        '''SearchMetrics appending its records to the JSON lines file at <path>.'''
+        return cls(open(path, 'a'))
+
+    def reset(self):
+        self.nodes = 0
+        self.evaluations = 0
+        self.cache_hits = 0
+        self.cutoffs = 0
+        self.updates = 0
+        self.phases: Dict[str, float] = {}
+
+    def add(self, **counts: int):
+        for name, count in counts.items():
+            setattr(self, name, getattr(self, name) + count)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        '''Time the block as part of phase <name> of the current move.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def endMove(self, agent: str, player: int, move_number: int, action, **extra) -> Dict[str, Any]:
+        ''' Close the record of the move <agent> (the agent's class name) played as <player>, write it out and start
+        the next one. Returns the record.
+        '''
+        record = {'agent': agent, 'player': player, 'move_number': move_number, 'action': list(action)}
+        record.update((name, getattr(self, name)) for name in self.COUNTERS)
+        record['phases'] = self.phases
+        record.update(extra)
+        self.write(record)
+        self.last_record = record
+        self.moves += 1
+        self.reset()
+        return record
+
+    def write(self, record: Dict[str, Any]):
+        '''Write <record> to the output as one JSON line, for records made elsewhere as well, like in another process.'''
+        if self.output is not None:
+            self.output.write(json.dumps(record) + '\n')
+            self.output.flush()
+
+    def close(self):
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+
+    def __getstate__(self):
+        # copies, like the ones sent to worker processes or the pondering thread, count on their own and write nothing
+        state = self.__dict__.copy()
+        state['output'] = None
+        return state
@@ -0,0 +1,91 @@
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from .threats import analyseThreats
+
+if TYPE_CHECKING:
+    from src.game_state import GameState
+
+# Moves are sorted by tier first, lower tiers are searched first
+TT_MOVE, WINNING_MOVE, BLOCKING_MOVE, KILLER_MOVE, QUIET_MOVE = range(5)
+
+
+class MoveOrdering:
+    ''' Orders the moves of a search node so that alpha-beta finds its cutoffs early.
+
+    The best move stored in the transposition table comes first, then moves that win at once, then moves that block an
+    immediate win of the opponent, then the killer moves of the ply (the last <num_killers> moves that caused a cutoff
+    at the same distance from the root) and finally every other move by history score: how much cutting off has that
+    column done for that player so far, weighted by the square of the remaining depth. Ties go to the column nearest
+    the centre.
+
+    Every cutoff is counted, and so is whether it came from the first move searched. A high first move rate means the
+    ordering rarely makes the search look past its first guess.
+    '''
+    def __init__(self, num_killers: int = 2):
+        self.num_killers = num_killers
+        self.killers: Dict[int, List[int]] = {}
+        self.history: Dict[int, Dict[int, int]] = {1: {}, -1: {}}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def newSearch(self):
+        ''' Forget the killers, which are indexed by ply from the old root, and halve the history so that it follows
+        the game rather than its opening.
+        '''
+        self.killers = {}
+        for player_history in self.history.values():
+            for col in player_history:
+                player_history[col] //= 2
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def clear(self):
+        '''Forget the killers and the whole history, for a search that must not depend on the ones before it.'''
+        self.killers = {}
+        self.history = {1: {}, -1: {}}
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, game_state: "GameState", columns: List[int], ply: int, tt_move: Optional[int] = None) -> List[int]:
+        '''<columns> in the order they should be searched at <ply> plies from the root.'''
+        player = game_state.current_player
+        threats = analyseThreats(game_state)
+        wins = set(threats.immediateWins(player))
+        blocks = set(threats.immediateWins(-player))
+        killers = self.killers.get(ply, [])
+        history = self.history[player]
+        centre_col = game_state.centre_col
+
+        def sortKey(col):
+            if col == tt_move:
+                tier = TT_MOVE
+            elif col in wins:
+                tier = WINNING_MOVE
+            elif col in blocks:
+                tier = BLOCKING_MOVE
+            elif col in killers:
+                return KILLER_MOVE, killers.index(col), 0
+            else:
+                tier = QUIET_MOVE
+            return tier, -history.get(col, 0), abs(col - centre_col)
+
+        return sorted(columns, key=sortKey)
+
+    def recordCutoff(self, player_number: int, ply: int, col: int, depth: int, first_move: bool):
+        '''<col>, played by <player_number> with <depth> plies left, caused a cutoff at <ply>.'''
+        self.cutoffs += 1
+        self.first_move_cutoffs += first_move
+        killers = self.killers.setdefault(ply, [])
+        if col in killers:
+            killers.remove(col)
+        killers.insert(0, col)
+        del killers[self.num_killers:]
+        history = self.history[player_number]
+        history[col] = history.get(col, 0) + depth * depth
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_rate': self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+        }
@@ -0,0 +1,44 @@
+from collections import OrderedDict
+import multiprocessing
+from typing import Any, List, Sequence, Tuple
+
+# Agents unpickled in this worker process, by the key of the agent they were sent from, so that what a worker agent
+# builds up (a transposition table, move ordering history) lasts from one task to the next. The least recently used
+# ones are dropped past MAX_WORKER_AGENTS, each can hold a transposition table.
+_WORKER_AGENTS: "OrderedDict[str, Any]" = OrderedDict()
+MAX_WORKER_AGENTS = 4
+
+
+def _callWorkerAgent(task: Tuple[str, Any, str, tuple]):
+    key, agent, method, args = task
+    worker_agent = _WORKER_AGENTS.setdefault(key, agent)
+    _WORKER_AGENTS.move_to_end(key)
+    while len(_WORKER_AGENTS) > MAX_WORKER_AGENTS:
+        _WORKER_AGENTS.popitem(last=False)
+    return getattr(worker_agent, method)(*args)
+
+
+class WorkerPool:
+    ''' Process pool that runs methods of copies of one agent, for agents that split a move's search across cores.
+
+    The pool is only started on the first call. Agents are pickled with every task, so they drop their large or
+    unpicklable attributes when pickled (see BaseAgent.__getstate__), and every worker process keeps the first copy
+    it receives of each agent, up to MAX_WORKER_AGENTS of them. Results come back in the order of the tasks whatever order the workers finish in.
+    '''
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool = None
+
+    def map(self, key: str, agent: Any, method: str, args_list: Sequence[tuple]) -> List[Any]:
+        ''' [agent.method(*args) for args in args_list], run across the worker processes. <key> identifies the agent
+        in the workers.
+        '''
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers)
+        return self._pool.map(_callWorkerAgent, [(key, agent, method, args) for args in args_list], chunksize=1)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
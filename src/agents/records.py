@@ -0,0 +1,106 @@
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, Optional, Type, TYPE_CHECKING
+
+import attr
+
+if TYPE_CHECKING:
+    from src.game_state import GameState
+
+# magic, format version, written once at the start of an archive
+FILE_HEADER = struct.Struct('<4sB')
+# num_rows, num_cols, first player, result, number of moves; the move columns follow, one byte each
+RECORD_HEADER = struct.Struct('<BBbbH')
+MAGIC = b'C4GR'
+VERSION = 1
+# result of a game that was stopped before anyone won or the board filled up
+UNFINISHED = 2
+
+
+@attr.s(frozen=True, slots=True)
+class GameRecord:
+    ''' A finished game: the board size, the player who moved first (1 or -1), the winner (1, -1, 0 for a draw or None
+    if the game was stopped) and the 1 indexed column of every move in the order they were played.
+    '''
+    num_rows: int = attr.ib()
+    num_cols: int = attr.ib()
+    first_player: int = attr.ib()
+    winner: Optional[int] = attr.ib()
+    moves: bytes = attr.ib(converter=bytes)
+
+    def pack(self) -> bytes:
+        result = UNFINISHED if self.winner is None else self.winner
+        return RECORD_HEADER.pack(self.num_rows, self.num_cols, self.first_player, result, len(self.moves)) + self.moves
+
+
+def _checkFileHeader(header: bytes, path: str):
+    if len(header) < FILE_HEADER.size or FILE_HEADER.unpack_from(header) != (MAGIC, VERSION):
+        raise ValueError(f"{path} is not a version {VERSION} game record archive")
+
+
+class RecordWriter:
+    ''' Appends GameRecords to an archive file, writing the file header first if the file is new and checking it
+    otherwise, so records are never appended to another kind of file. Records go through the file's buffer as they
+    come, so a long run never holds more than one game in memory.
+    '''
+    def __init__(self, path: str):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as archive_file:
+                _checkFileHeader(archive_file.read(FILE_HEADER.size), path)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.records_written = 0
+
+    def write(self, record: GameRecord):
+        self._file.write(record.pack())
+        self.records_written += 1
+
+    def writeAll(self, records: Iterable[GameRecord]):
+        for record in records:
+            self.write(record)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def readRecords(path: str) -> Iterator[GameRecord]:
+    ''' The records of an archive in the order they were written, decoded one at a time from a memory map of the file,
+    so reading stops costing anything as soon as the caller stops iterating. A record cut short at the end of the file,
+    like the last one of a run that was killed while writing, raises a ValueError after the complete records.
+    '''
+    with open(path, 'rb') as archive_file:
+        if os.fstat(archive_file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ) as archive:
+            _checkFileHeader(archive[:FILE_HEADER.size], path)
+            offset = FILE_HEADER.size
+            while offset < len(archive):
+                if offset + RECORD_HEADER.size > len(archive):
+                    raise ValueError(f"{path} ends in a truncated record at byte {offset}")
+                num_rows, num_cols, first_player, result, num_moves = RECORD_HEADER.unpack_from(archive, offset)
+                if offset + RECORD_HEADER.size + num_moves > len(archive):
+                    raise ValueError(f"{path} ends in a truncated record at byte {offset}")
+                offset += RECORD_HEADER.size
+                yield GameRecord(
+                    num_rows, num_cols, first_player, None if result == UNFINISHED else result,
+                    archive[offset:offset + num_moves]
+                )
+                offset += num_moves
+
+
+def replay(record: GameRecord, state_cls: Type["GameState"]) -> "GameState":
+    ''' A <state_cls> game state (GameState or BitboardGameState) holding the final position of <record>, built with
+    make_move alone, so nothing is printed and every move can be taken back with unmake_move.
+    '''
+    game_state = state_cls(record.num_rows, record.num_cols, record.first_player)
+    for col in record.moves:
+        game_state.make_move(col)
+    return game_state
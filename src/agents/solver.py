@@ -0,0 +1,173 @@
+import time
+from typing import List, Optional, TYPE_CHECKING
+
+import attr
+
+from .transposition import EXACT, LOWER_BOUND, UPPER_BOUND, TranspositionTable
+WINNING_PIECES = 4
+
+if TYPE_CHECKING:
+    from src.game_state import GameState
+
+
+class SolverTimeout(Exception):
+    '''Raised when the solver runs past its deadline.'''
+
+
+@attr.s
+class Solution:
+    ''' Exact result of a position for the player to move.
+
+    score is 0 for a draw, positive for a win and negative for a loss, and its absolute value is one more than the
+    number of empty cells left when the game ends, so faster wins score higher. distance is the number of plies to
+    the end of the game under perfect play.
+    '''
+    score: int = attr.ib()
+    best_col: Optional[int] = attr.ib()
+    distance: int = attr.ib()
+    nodes: int = attr.ib(default=0)
+
+    @property
+    def outcome(self) -> str:
+        if self.score > 0:
+            return 'win'
+        if self.score < 0:
+            return 'loss'
+        return 'draw'
+
+
+class Solver:
+    ''' Exact win/draw/loss search for positions with few empty cells.
+
+    The search runs on plain integers using the BitboardGameState layout: <current> holds the stones of the player to
+    move and <mask> all the stones. The exact score is found by null-window probing: every probe is an alpha-beta
+    search with a window of width one that only answers whether the score is above a guess, and the guesses bisect the
+    range of possible scores. A transposition table keeps the bounds found by earlier probes.
+    '''
+    def __init__(self, num_rows: int, num_cols: int, tt_size_mb: float = 16):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.num_cells = num_rows * num_cols
+        self.stride = num_rows + 1
+        self._win_shifts = (1, self.stride, self.stride - 1, self.stride + 1)
+        self.bottom_mask = sum(1 << (col * self.stride) for col in range(num_cols))
+        self.board_mask = self.bottom_mask * ((1 << num_rows) - 1)
+        # key = current + mask + bottom_mask is unique per position, it only needs hashing on very large boards
+        self._exact_keys = self.stride * num_cols <= 64
+        centre = (num_cols - 1) / 2
+        self.column_order = sorted(range(num_cols), key=lambda col: abs(col - centre))
+        self.transposition_table = TranspositionTable(tt_size_mb)
+        self.nodes = 0
+        self.deadline = None
+
+    def _isWin(self, board: int) -> bool:
+        for shift in self._win_shifts:
+            streak = board
+            for step in range(1, WINNING_PIECES):
+                streak &= board >> (step * shift)
+            if streak:
+                return True
+        return False
+
+    def _key(self, current: int, mask: int) -> int:
+        key = current + mask + self.bottom_mask
+        return key if self._exact_keys else hash((current, mask)) & 0xFFFFFFFFFFFFFFFF
+
+    def _moveBits(self, mask: int) -> List[int]:
+        ''' The bit of the next free cell of every playable column, centre columns first.'''
+        moves = []
+        for col in self.column_order:
+            bit = (mask + (1 << (col * self.stride))) & (((1 << self.num_rows) - 1) << (col * self.stride))
+            if bit:
+                moves.append(bit)
+        return moves
+
+    def negamax(self, current: int, mask: int, num_moves: int, alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise SolverTimeout()
+        empty = self.num_cells - num_moves
+        if empty == 0:
+            return 0
+        moves = self._moveBits(mask)
+        for bit in moves:
+            if self._isWin(current | bit):
+                return empty
+
+        # we cannot win with this move, so at best we win with our next one, or draw when no cell is left for it
+        max_score = max(empty - 2, 0)
+        key = self._key(current, mask)
+        entry = self.transposition_table.probe(key)
+        if entry is not None:
+            _, flag, tt_score, _ = entry
+            if flag == EXACT:
+                return tt_score
+            if flag == UPPER_BOUND:
+                max_score = min(max_score, tt_score)
+            elif flag == LOWER_BOUND:
+                alpha = max(alpha, tt_score)
+        if beta > max_score:
+            beta = max_score
+        if alpha >= beta:
+            return beta
+
+        alpha_orig = alpha
+        opponent = current ^ mask
+        best_score = -self.num_cells
+        for bit in moves:
+            score = -self.negamax(opponent, mask | bit, num_moves + 1, -beta, -alpha)
+            if score > best_score:
+                best_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        if best_score <= alpha_orig:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.transposition_table.store(key, empty, flag, best_score, None)
+        return best_score
+
+    def _solveScore(self, current: int, mask: int, num_moves: int) -> int:
+        empty = self.num_cells - num_moves
+        low, high = -empty, empty
+        while low < high:
+            guess = low + (high - low) // 2
+            # probe near zero first, deciding win/draw/loss is cheaper than finding the exact distance
+            if guess <= 0 and low // 2 < guess:
+                guess = low // 2
+            elif guess >= 0 and high // 2 > guess:
+                guess = high // 2
+            score = self.negamax(current, mask, num_moves, guess, guess + 1)
+            if score <= guess:
+                high = score
+            else:
+                low = score
+        return low
+
+    def solve(self, game_state: "GameState", deadline: Optional[float] = None) -> Solution:
+        ''' Solve the position for game_state.current_player. The game must not be over. Raises SolverTimeout once
+        time.perf_counter() passes <deadline>.
+        '''
+        bitboard = game_state.toBitboard()
+        current = bitboard.boards[bitboard.current_player]
+        mask = bitboard.mask
+        num_moves = bin(mask).count('1')
+        empty = self.num_cells - num_moves
+        self.nodes = 0
+        self.deadline = deadline
+
+        best_col, best_score = None, -self.num_cells
+        for bit in self._moveBits(mask):
+            col = (bit.bit_length() - 1) // self.stride + 1
+            if self._isWin(current | bit):
+                score = empty
+            else:
+                score = -self._solveScore(current ^ mask, mask | bit, num_moves + 1)
+            if score > best_score:
+                best_col, best_score = col, score
+        distance = empty - abs(best_score) + 1 if best_score else empty
+        return Solution(score=best_score, best_col=best_col, distance=distance, nodes=self.nodes)
@@ -0,0 +1,174 @@
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import attr
+WINNING_PIECES = 4
+
+if TYPE_CHECKING:
+    from src.game_state import GameState
+
+
+def _bitboards(game_state: "GameState") -> Tuple[Dict[int, int], int]:
+    ''' Stones of each player and of both, in the BitboardGameState layout. Read directly from a BitboardGameState and
+    built from the grid otherwise.
+    '''
+    boards = getattr(game_state, 'boards', None)
+    if boards is not None:
+        return boards, game_state.mask
+    stride = game_state.num_rows + 1
+    boards = {1: 0, -1: 0}
+    for (row, col), node in game_state.grid.items():
+        boards[node.value] |= 1 << ((col - 1) * stride + row - 1)
+    return boards, boards[1] | boards[-1]
+
+
+def threatCells(board: int, mask: int, num_rows: int, num_cols: int, winning_pieces: int = WINNING_PIECES) -> int:
+    ''' Bitboard of the empty cells that would complete a line of <winning_pieces> for the stones in <board>, whether
+    or not the cell can be played yet. For every direction and every position of the empty cell in the line, the
+    board is shifted onto the cell once per other cell of the line and the shifts are ANDed. Lines that leave the
+    board always cross a sentinel bit, which is never set, so they never wrap into the next column.
+    '''
+    stride = num_rows + 1
+    bottom_mask = sum(1 << (col * stride) for col in range(num_cols))
+    board_mask = bottom_mask * ((1 << num_rows) - 1)
+    cells = 0
+    for shift in (1, stride, stride - 1, stride + 1):
+        for empty_index in range(winning_pieces):
+            line = board_mask
+            for index in range(winning_pieces):
+                offset = (index - empty_index) * shift
+                if offset > 0:
+                    line &= board >> offset
+                elif offset < 0:
+                    line &= board << -offset
+            cells |= line
+    return cells & board_mask & ~mask
+
+
+@attr.s(frozen=True, slots=True)
+class Threats:
+    ''' Threats of both players in one position. A threat is an empty cell that completes a line for a player.
+
+    Rows are 1 indexed, so with an even number of rows the player who moved first gets the odd rows and the second
+    player the even rows once the board fills up column by column: a player's threats are worth most on their own row
+    parity, and the lowest threat of each column is the one that decides it.
+    '''
+    num_rows: int = attr.ib()
+    num_cols: int = attr.ib()
+    current_player: int = attr.ib()
+    first_player: int = attr.ib()
+    cells: Dict[int, int] = attr.ib()
+    # the cell the next piece of every column that is not full lands in
+    playable: int = attr.ib()
+
+    def _bit(self, row, col) -> int:
+        return 1 << ((col - 1) * (self.num_rows + 1) + row - 1)
+
+    def threatCells(self, player_number: int) -> List[Tuple[int, int]]:
+        '''Threats of <player_number> as (row, col), column by column bottom up.'''
+        return [
+            (row, col) for col in range(1, self.num_cols + 1) for row in range(1, self.num_rows + 1)
+            if self.cells[player_number] & self._bit(row, col)
+        ]
+
+    def lowestThreats(self, player_number: int) -> List[Optional[int]]:
+        '''Row of the lowest threat of <player_number> in every column, None for columns without one.'''
+        lowest = [None] * self.num_cols
+        for row, col in reversed(self.threatCells(player_number)):
+            lowest[col - 1] = row
+        return lowest
+
+    def immediateWins(self, player_number: int) -> List[int]:
+        '''Columns <player_number> wins by playing in now, left to right.'''
+        stride = self.num_rows + 1
+        return [(bit.bit_length() - 1) // stride + 1 for bit in _setBits(self.cells[player_number] & self.playable)]
+
+    def goodParityThreats(self, player_number: int) -> List[int]:
+        ''' Columns whose lowest threat of <player_number> lies on their row parity (odd for the first player, even for
+        the second) and is not undercut by a threat of the opponent lower in the same column.
+        '''
+        parity = 1 if player_number == self.first_player else 0
+        opponent_lowest = self.lowestThreats(-player_number)
+        return [
+            col for col, row in enumerate(self.lowestThreats(player_number), start=1)
+            if row is not None and row % 2 == parity
+            and (opponent_lowest[col - 1] is None or opponent_lowest[col - 1] > row)
+        ]
+
+    def parityScore(self, player_number: int) -> int:
+        '''Good parity threats of <player_number> minus those of the opponent, as an evaluation term.'''
+        return len(self.goodParityThreats(player_number)) - len(self.goodParityThreats(-player_number))
+
+    def nonLosingColumns(self) -> List[int]:
+        ''' Columns the player to move can play without losing on the next move: the opponent's immediate win when it
+        has one, and never a column whose next cell sits right under a threat of the opponent. Winning columns come
+        first of all.
+        '''
+        wins = self.immediateWins(self.current_player)
+        if wins:
+            return wins
+        opponent = -self.current_player
+        forced = self.immediateWins(opponent)
+        if len(forced) > 1:
+            return []
+        candidates = forced or [
+            (bit.bit_length() - 1) // (self.num_rows + 1) + 1 for bit in _setBits(self.playable)
+        ]
+        return [
+            col for col in candidates
+            if not self.cells[opponent] & (self.playable & self._columnMask(col)) << 1
+        ]
+
+    def _columnMask(self, col: int) -> int:
+        return ((1 << self.num_rows) - 1) << ((col - 1) * (self.num_rows + 1))
+
+    def forcedOutcome(self) -> Optional[Tuple[int, int]]:
+        ''' (1, plies) when the player to move wins and (-1, plies) when they lose in <plies> whatever they play, as
+        far as the threats show it without searching: an immediate win, two immediate wins of the opponent, or every
+        move either leaving an immediate win open or playing under a threat of the opponent. None otherwise.
+        '''
+        if self.immediateWins(self.current_player):
+            return 1, 1
+        if self.playable and not self.nonLosingColumns():
+            return -1, 2
+        return None
+
+    def zugzwangWinner(self) -> int:
+        ''' Player favoured by the row parity once the board fills up, 0 when neither is or the number of rows is odd.
+        A heuristic from the simplified odd/even rules, not a proof: the first player needs a good parity threat, the
+        second player wins with one of their own when the first player has none.
+        '''
+        if self.num_rows % 2:
+            return 0
+        first, second = self.first_player, -self.first_player
+        if self.goodParityThreats(first):
+            return first
+        if self.goodParityThreats(second):
+            return second
+        return 0
+
+
+def _setBits(board: int):
+    while board:
+        bit = board & -board
+        yield bit
+        board ^= bit
+
+
+def analyseThreats(game_state: "GameState") -> Threats:
+    '''Threats of both players in the position of <game_state>.'''
+    boards, mask = _bitboards(game_state)
+    num_rows, num_cols = game_state.num_rows, game_state.num_cols
+    stride = num_rows + 1
+    bottom_mask = sum(1 << (col * stride) for col in range(num_cols))
+    board_mask = bottom_mask * ((1 << num_rows) - 1)
+    current = game_state.current_player
+    # players alternate, so the parity of the number of stones says who moved first
+    first_player = current if bin(mask).count('1') % 2 == 0 else -current
+    return Threats(
+        num_rows=num_rows,
+        num_cols=num_cols,
+        current_player=current,
+        first_player=first_player,
+        cells={player: threatCells(boards[player], mask, num_rows, num_cols) for player in (1, -1)},
+        playable=(mask + bottom_mask) & board_mask,
+    )
@@ -0,0 +1,72 @@
+from array import array
+from typing import Dict, Optional, Tuple
+
+# Bound types of a stored score
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+
+class TranspositionTable:
+    ''' Fixed memory transposition table keyed by a 64 bit position hash (see GameState.zobrist_hash).
+
+    The table is split into buckets of two slots. The first slot is depth-preferred: it keeps the entry searched to
+    the greatest depth, and an entry it evicts is moved down to the second slot. The second slot is always-replace: it
+    takes whatever the first slot did not keep. All entries live in two preallocated arrays, 8 bytes of key and 8 bytes
+    of packed data, so the memory use is fixed by <size_mb> and does not grow during a search.
+
+    Packed data layout, least significant bit first: 1 bit set for used slots, 2 bits bound type, 5 unused bits,
+    8 bits best move column (0 when unknown), 8 bits depth, and the signed score in the remaining bits.
+    '''
+    ENTRY_BYTES = 16
+
+    def __init__(self, size_mb: float = 8):
+        num_entries = max(2, int(size_mb * 1024 * 1024) // self.ENTRY_BYTES)
+        self.num_buckets = num_entries // 2
+        self.keys = array('Q', bytes(8 * 2 * self.num_buckets))
+        self.data = array('q', bytes(8 * 2 * self.num_buckets))
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        '''Empty the table in place, several times faster than allocating a new one of the same size.'''
+        zeros = bytes(8 * 2 * self.num_buckets)
+        memoryview(self.keys).cast('B')[:] = zeros
+        memoryview(self.data).cast('B')[:] = zeros
+        self.hits = self.misses = self.collisions = self.stores = 0
+
+    @staticmethod
+    def _pack(depth: int, flag: int, score: int, move: Optional[int]) -> int:
+        return (int(score) << 24) | (depth << 16) | ((move or 0) << 8) | (flag << 1) | 1
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, Optional[int]]]:
+        ''' Returns (depth, bound type, score, best move) stored for <key>, or None.'''
+        slot = (key % self.num_buckets) * 2
+        for idx in (slot, slot + 1):
+            data = self.data[idx]
+            if data and self.keys[idx] == key:
+                self.hits += 1
+                return (data >> 16) & 0xFF, (data >> 1) & 0x3, data >> 24, ((data >> 8) & 0xFF) or None
+        if self.data[slot] or self.data[slot + 1]:
+            # the bucket is in use by other positions
+            self.collisions += 1
+        self.misses += 1
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score: int, move: Optional[int]):
+        slot = (key % self.num_buckets) * 2
+        data = self._pack(min(depth, 0xFF), flag, score, move)
+        self.stores += 1
+        depth_slot_data = self.data[slot]
+        if self.keys[slot] == key or not depth_slot_data or depth >= (depth_slot_data >> 16) & 0xFF:
+            if depth_slot_data and self.keys[slot] != key:
+                # demote the evicted deep entry to the always-replace slot
+                self.keys[slot + 1], self.data[slot + 1] = self.keys[slot], depth_slot_data
+            self.keys[slot], self.data[slot] = key, data
+        else:
+            self.keys[slot + 1], self.data[slot + 1] = key, data
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'collisions': self.collisions, 'stores': self.stores}
@@ -0,0 +1,292 @@
+from functools import partial
+from optparse import OptionParser
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from run import GAME_STATE_ENGINES, loadAgent
+
+BOARD_SIZES = ((4, 5), (6, 7), (7, 9))
+BENCHMARKS = ('update', 'getPossibleMoves', 'isBlockingMove', 'scoreMove', 'GreedyAgent.getAction')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# timings only mean something on the machine that measured them, so they are saved next to the committed allocation
+# baseline but never committed (the file is in .gitignore)
+DEFAULT_TIMINGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_timings.json')
+CALIBRATION_LOOPS = 100000
+# a repeat replays the games until its operations took this long, so that short benchmarks are not timed on a few
+# milliseconds of work
+MIN_REPEAT_NS = 50_000_000
+
+
+def moveSequences(num_rows: int, num_cols: int, num_games: int, seed: int) -> List[List[int]]:
+    ''' Columns of <num_games> uniformly random games, each played until it is won or the board is full. The same
+    seed gives the same games on every engine and every run.
+    '''
+    sequences = []
+    for game_number in range(num_games):
+        rng = random.Random(f"{seed}-{num_rows}x{num_cols}-{game_number}")
+        game_state = GAME_STATE_ENGINES['grid'](num_rows, num_cols, 1)
+        sequence = []
+        while not game_state.game_complete and game_state.getPossibleColumns():
+            col = rng.choice(game_state.getPossibleColumns())
+            game_state.make_move(col)
+            sequence.append(col)
+        sequences.append(sequence)
+    return sequences
+
+
+def _operations(benchmark: str, game_state, col: int, agents: Dict[int, Any]) -> List[Callable[[], Any]]:
+    ''' The calls <benchmark> times in the position before <col> is played. Setting them up, like building the move
+    nodes with the cumulative sums scoreMove reads, is not timed.
+    '''
+    player = game_state.current_player
+    if benchmark == 'update':
+        return [partial(game_state.update, player, (game_state.getNextRow(col), col))]
+    if benchmark == 'getPossibleMoves':
+        # the first call after a move, the one that builds the moves
+        return [game_state.getPossibleMoves]
+    if benchmark == 'GreedyAgent.getAction':
+        return [partial(agents[player].getAction, game_state)]
+    operations = []
+    for move, move_node in game_state.getPossibleMoves().items():
+        if benchmark == 'isBlockingMove':
+            operations.append(partial(game_state.isBlockingMove, move_node))
+        else:
+            operations.append(partial(agents[player].scoreMove, game_state, game_state.moveNode(player, move), player))
+    return operations
+
+
+def _replay(benchmark: str, engine: str, num_rows: int, num_cols: int, sequences: List[List[int]],
+            measure: Callable[[Callable[[], Any]], None]):
+    ''' Replay every sequence on a fresh game state and hand each operation of <benchmark> to <measure>, which calls it.
+    '''
+    agents = {player: loadAgent('GreedyAgent')(player) for player in (1, -1)}
+    for sequence in sequences:
+        game_state = GAME_STATE_ENGINES[engine](num_rows, num_cols, 1)
+        for col in sequence:
+            for operation in _operations(benchmark, game_state, col, agents):
+                measure(operation)
+            if benchmark == 'update':
+                game_state.current_player = -game_state.current_player
+            else:
+                game_state.make_move(col)
+
+
+def calibrationLoop(loops: int = CALIBRATION_LOOPS) -> float:
+    ''' Nanoseconds per iteration of a fixed loop of the tuple, dict and integer work the game states are made of.
+    Timings are divided by it so that a machine that is busier, or slower, for a while does not read as a regression.
+    '''
+    cells = {}
+    start = time.perf_counter_ns()
+    for i in range(loops):
+        cell = (i & 7, i & 15)
+        cells[cell] = cells.get(cell, 0) + i
+    return (time.perf_counter_ns() - start) / loops
+
+
+def timeBenchmark(benchmark: str, engine: str, num_rows: int, num_cols: int, sequences: List[List[int]],
+                  repeat: int) -> Tuple[int, float, float]:
+    ''' Number of operations in one replay, the nanoseconds per operation of the fastest of <repeat> repeats and that
+    time relative to the fastest calibration loop, run before every repeat. A repeat replays the games as many times as
+    it takes to time MIN_REPEAT_NS of operations. The garbage collector is off while timing so that its pauses do not
+    land on whichever operation triggers them.
+    '''
+    best_ns = best_calibration_ns = None
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            calibration_ns = calibrationLoop()
+            best_calibration_ns = calibration_ns if best_calibration_ns is None else min(best_calibration_ns, calibration_ns)
+            totals = [0, 0]
+
+            def measure(operation):
+                start = time.perf_counter_ns()
+                operation()
+                totals[0] += time.perf_counter_ns() - start
+                totals[1] += 1
+
+            replays = 0
+            while replays == 0 or (totals[0] < MIN_REPEAT_NS and totals[1]):
+                _replay(benchmark, engine, num_rows, num_cols, sequences, measure)
+                replays += 1
+            ns_per_op = totals[0] / max(totals[1], 1)
+            best_ns = ns_per_op if best_ns is None else min(best_ns, ns_per_op)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return totals[1] // replays, best_ns, best_ns / best_calibration_ns
+
+
+def allocationBenchmark(benchmark: str, engine: str, num_rows: int, num_cols: int, sequences: List[List[int]]) -> float:
+    ''' Bytes allocated per operation according to tracemalloc: the peak during the operation above the memory held
+    before it, so both what the operation keeps and what it frees again count. Kept separate from the timing runs,
+    which tracing would slow down. An untraced replay first fills the caches the first calls allocate. A full
+    collection then empties the interpreter's free lists: a tuple or float taken from a free list is not a new
+    allocation to tracemalloc, so what earlier work, such as a varying number of timing replays, left in them would
+    change the count. The garbage collector stays off while tracing, so the number is the same on every run and can be
+    held to the baseline strictly.
+    '''
+    totals = [0, 0]
+
+    def measure(operation):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        totals[0] += peak - before
+        totals[1] += 1
+
+    _replay(benchmark, engine, num_rows, num_cols, sequences, lambda operation: operation())
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    try:
+        _replay(benchmark, engine, num_rows, num_cols, sequences, measure)
+    finally:
+        tracemalloc.stop()
+        if gc_enabled:
+            gc.enable()
+    return totals[0] / max(totals[1], 1)
+
+
+def runBenchmarks(engine: str, board_sizes, benchmarks, num_games: int, seed: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for num_rows, num_cols in board_sizes:
+        sequences = moveSequences(num_rows, num_cols, num_games, seed)
+        for benchmark in benchmarks:
+            ops, ns_per_op, relative_time = timeBenchmark(benchmark, engine, num_rows, num_cols, sequences, repeat)
+            results[f"{benchmark} {num_rows}x{num_cols}"] = {
+                'ops': ops,
+                'ns_per_op': ns_per_op,
+                'relative_time': relative_time,
+                'alloc_bytes_per_op': allocationBenchmark(benchmark, engine, num_rows, num_cols, sequences),
+            }
+    return results
+
+
+def compareToBaseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                      timings: Dict[str, Dict[str, float]], threshold: float, alloc_threshold: float) -> Dict[str, str]:
+    ''' Status of every result: 'new' when the allocation baseline lacks it or replayed other games (another number
+    of operations), 'more allocations' when it allocates more than <alloc_threshold> (a fraction) above the baseline,
+    'slower' or 'faster' when its calibrated time is more than <threshold> above or below the locally saved <timings>
+    and 'ok' otherwise. Without local timings only the allocations are compared.
+    '''
+    statuses = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        timing = timings.get(name)
+        if base is None or base['ops'] != result['ops']:
+            statuses[name] = 'new'
+        elif result['alloc_bytes_per_op'] > base['alloc_bytes_per_op'] * (1 + alloc_threshold):
+            statuses[name] = 'more allocations'
+        elif timing is not None and result['relative_time'] > timing['relative_time'] * (1 + threshold):
+            statuses[name] = 'slower'
+        elif timing is not None and result['relative_time'] < timing['relative_time'] * (1 - threshold):
+            statuses[name] = 'faster'
+        else:
+            statuses[name] = 'ok'
+    return statuses
+
+
+def printTable(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+               timings: Dict[str, Dict[str, float]], statuses: Dict[str, str]):
+    print(f"{'benchmark':<32}{'ops':>8}{'ns/op':>12}{'relative':>10}{'local':>10}{'change':>9}{'alloc B/op':>12}"
+          f"{'baseline':>12}  status")
+    for name, result in results.items():
+        base = baseline.get(name)
+        timing = timings.get(name)
+        base_alloc = f"{base['alloc_bytes_per_op']:.0f}" if base else '-'
+        local = f"{timing['relative_time']:.1f}" if timing else '-'
+        change = f"{100 * (result['relative_time'] / timing['relative_time'] - 1):+.1f}%" if timing else '-'
+        print(
+            f"{name:<32}{result['ops']:>8}{result['ns_per_op']:>12.0f}{result['relative_time']:>10.1f}{local:>10}{change:>9}"
+            f"{result['alloc_bytes_per_op']:>12.0f}{base_alloc:>12}  {statuses[name]}"
+        )
+
+
+def _loadJson(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def _saveJson(path: str, data: Dict[str, Any]):
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, indent=2, sort_keys=True)
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python benchmark.py <options>
+    EXAMPLES:   (1) python benchmark.py
+                (2) python benchmark.py -e bitboard -t 0.1 -a 0
+                (3) python benchmark.py --save_baseline
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-e', '--engine', dest='engine', type='choice', choices=list(GAME_STATE_ENGINES),
+                      help='the game state implementation to benchmark: ' + ', '.join(GAME_STATE_ENGINES), default='grid')
+    parser.add_option('-b', '--benchmarks', dest='benchmarks', help='comma separated benchmarks to run: ' + ', '.join(BENCHMARKS),
+                      default=','.join(BENCHMARKS))
+    parser.add_option('-n', '--num_games', dest='num_games', type='int', help='the number of seeded games per board size', default=20)
+    parser.add_option('-s', '--seed', dest='seed', type='int', help='the random seed of the games', default=0)
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', help='time the fastest of this many replays', default=5)
+    parser.add_option('-t', '--threshold', dest='threshold', type='float',
+                      help='the fraction above the local timings that counts as slower', default=0.5)
+    parser.add_option('-a', '--alloc_threshold', dest='alloc_threshold', type='float',
+                      help='the fraction above the baseline allocations that counts as a regression', default=0.01)
+    parser.add_option('--baseline', dest='baseline', help='the committed allocation baseline JSON file', default=DEFAULT_BASELINE)
+    parser.add_option('--timings', dest='timings', help='the timings JSON file of this machine', default=DEFAULT_TIMINGS)
+    parser.add_option('--save_baseline', dest='save_baseline', action='store_true',
+                      help='store the allocations as the baseline and the timings as the local timings of the engine '
+                      'instead of failing on regressions', default=False)
+    parser.add_option('-o', '--output', dest='output', help='write the results as JSON to this path', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    unknown = set(options.benchmarks.split(',')) - set(BENCHMARKS)
+    if unknown:
+        raise Exception(f"Unknown benchmarks {sorted(unknown)}, choose from {BENCHMARKS}")
+    return options
+
+
+if __name__ == '__main__':
+    """
+    Times GameState.update, getPossibleMoves, isBlockingMove, BaseAgent.scoreMove and GreedyAgent.getAction over seeded
+    random games on several board sizes and measures what they allocate. Exits with status 1 when a benchmark allocates
+    more than the committed baseline of the engine, or is slower than the timings saved on this machine, by more than
+    the thresholds.
+
+    > python benchmark.py -e grid -t 0.5
+    """
+    args = readCommand(sys.argv[1:])
+    results = runBenchmarks(args.engine, BOARD_SIZES, args.benchmarks.split(','), args.num_games, args.seed, args.repeat)
+    baselines = _loadJson(args.baseline)
+    all_timings = _loadJson(args.timings)
+    baseline = baselines.get(args.engine, {})
+    timings = all_timings.get(args.engine, {})
+    statuses = compareToBaseline(results, baseline, timings, args.threshold, args.alloc_threshold)
+    printTable(results, baseline, timings, statuses)
+    if args.output:
+        _saveJson(args.output, results)
+    if args.save_baseline:
+        baselines[args.engine] = {
+            **baseline,
+            **{name: {key: result[key] for key in ('ops', 'alloc_bytes_per_op')} for name, result in results.items()},
+        }
+        all_timings[args.engine] = {
+            **timings,
+            **{name: {key: result[key] for key in ('ns_per_op', 'relative_time')} for name, result in results.items()},
+        }
+        _saveJson(args.baseline, baselines)
+        _saveJson(args.timings, all_timings)
+        print(f"Saved the {args.engine} allocations to {args.baseline} and timings to {args.timings}")
+    elif any(status in ('slower', 'more allocations') for status in statuses.values()):
+        sys.exit(1)
@@ -0,0 +1,92 @@
+from optparse import OptionParser
+import sys
+import time
+from typing import Dict, Tuple
+
+from agents.agent import AlphaBetaAgent
+from agents.book import checkBoardSize, writeBook
+from agents.solver import Solver
+from game_state import BitboardGameState, GameState
+
+
+def evaluatePositions(
+        num_rows: int, num_cols: int, plies: int, depth: int, solver_empty_cells: int, verbose: bool = False
+) -> Dict[int, Tuple[int, int, bool]]:
+    ''' Walk every position reachable in at most <plies> moves and compute the best move for the player to move.
+    Positions with at most <solver_empty_cells> empty cells are solved exactly, the others get a depth <depth>
+    alpha-beta search. The walk keeps a GameState for the search and a BitboardGameState for the position key in
+    lockstep through make_move / unmake_move, and visits every position once however many move orders reach it. A
+    position and its mirror image share one entry.
+    '''
+    game_state = GameState(num_rows, num_cols, 1)
+    bitboard = BitboardGameState(num_rows, num_cols, 1)
+    # the table is valid across positions, so one agent per player serves the whole walk
+    agents = {player: AlphaBetaAgent(player, depth=depth, keep_tt=True) for player in (1, -1)}
+    solver = Solver(num_rows, num_cols)
+    entries = {}
+    start = time.perf_counter()
+
+    def visit(ply: int):
+        key, mirrored = bitboard.canonicalKey()
+        if key in entries:
+            return
+        if num_rows * num_cols - game_state.move_numer <= solver_empty_cells:
+            solution = solver.solve(bitboard)
+            score, best_col, exact = solution.score, solution.best_col, True
+        else:
+            best_col, score, _ = agents[game_state.current_player].search(game_state)
+            exact = False
+        entries[key] = (score, bitboard.mirrorMove(best_col) if mirrored else best_col, exact)
+        if verbose and len(entries) % 100 == 0:
+            print(f"{len(entries)} positions in {time.perf_counter() - start:.1f}s")
+        if ply == plies:
+            return
+        for col in game_state.getPossibleColumns():
+            game_state.make_move(col)
+            bitboard.make_move(col)
+            if not game_state.game_complete and game_state.getPossibleColumns():
+                visit(ply + 1)
+            game_state.unmake_move()
+            bitboard.unmake_move()
+
+    visit(0)
+    return entries
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python build_book.py <options>
+    EXAMPLES:   (1) python build_book.py -r 6 -c 7 -p 4 -d 6 -o book.bin
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-r', '--num_rows', dest='num_rows', type='int', help='the number of rows in the board', default=6)
+    parser.add_option('-c', '--num_col', dest='num_cols', type='int', help='the number of cols in the board', default=7)
+    parser.add_option('-p', '--plies', dest='plies', type='int', help='the number of plies covered by the book', default=4)
+    parser.add_option('-d', '--depth', dest='depth', type='int', help='the search depth for every position', default=6)
+    parser.add_option(
+        '-s', '--solver_empty_cells', dest='solver_empty_cells', type='int',
+        help='solve positions exactly once at most this many cells are empty', default=16
+    )
+    parser.add_option('-o', '--output', dest='output', help='the path of the book file to write', default='book.bin')
+    parser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='print progress', default=False)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    """
+    Builds an opening book that search agents load with the book_path agent argument.
+
+    > python build_book.py -r 6 -c 7 -p 4 -d 6 -o book.bin
+    > python run.py -a AlphaBetaAgent -r 6 -c 7 --book book.bin
+    """
+    args = readCommand(sys.argv[1:])
+    # fail before the walk rather than after it
+    checkBoardSize(args.num_rows, args.num_cols)
+    entries = evaluatePositions(
+        args.num_rows, args.num_cols, args.plies, args.depth, args.solver_empty_cells, verbose=args.verbose
+    )
+    writeBook(args.output, args.num_rows, args.num_cols, args.plies, entries)
+    print(f"Wrote {len(entries)} positions to {args.output}")
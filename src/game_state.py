@@ -1,16 +1,74 @@
-from typing import Callable, Dict, Optional, Tuple, List, Type
+from collections.abc import Mapping
+import random
+from typing import Callable, Dict, Iterator, Optional, Tuple, List, Type
 import attr
 
 WINNING_PIECES = 4
-
-@attr.s
+# Weight of a winning line by the number of pieces one player has in it, when the other player has none
+LINE_WEIGHTS = [0] + [10 ** num_pieces for num_pieces in range(1, WINNING_PIECES + 1)]
+CENTRE_COL_WEIGHT = 2
+
+# Zobrist keys per (num_rows, num_cols), see getZobristKeys
+_ZOBRIST_KEYS = {}
+
+
+def getZobristKeys(num_rows, num_cols) -> Tuple[Dict[Tuple[int, int, int], int], int]:
+    ''' Random 64 bit keys for every (player, row, col) of a board of the given size, and one key XORed in when player -1
+    is to move. The generator is seeded with the board size, so every process builds the same keys and hashes can be
+    shared between them.
+    '''
+    keys = _ZOBRIST_KEYS.get((num_rows, num_cols))
+    if keys is None:
+        rng = random.Random(num_rows * 1000 + num_cols)
+        piece_keys = {
+            (player, row, col): rng.getrandbits(64)
+            for player in (1, -1) for row in range(1, num_rows + 1) for col in range(1, num_cols + 1)
+        }
+        keys = (piece_keys, rng.getrandbits(64))
+        _ZOBRIST_KEYS[(num_rows, num_cols)] = keys
+    return keys
+
+
+@attr.s(frozen=True)
+class WinningLines:
+    ''' Every line of winning_pieces cells on a board, as tuples of (row, col), and for every cell the ids (indexes
+    into lines) of the lines through it.
+    '''
+    lines: Tuple[Tuple[Tuple[int, int], ...], ...] = attr.ib()
+    cell_lines: Dict[Tuple[int, int], Tuple[int, ...]] = attr.ib()
+
+
+# WinningLines per (num_rows, num_cols, winning_pieces), see getWinningLines
+_WINNING_LINES = {}
+
+
+def getWinningLines(num_rows, num_cols, winning_pieces=WINNING_PIECES) -> WinningLines:
+    ''' Winning line index of a board size, built on first use and shared by every game state of that size.'''
+    winning_lines = _WINNING_LINES.get((num_rows, num_cols, winning_pieces))
+    if winning_lines is None:
+        lines = []
+        for row in range(1, num_rows + 1):
+            for col in range(1, num_cols + 1):
+                for dir in [(0, 1), (1, 0), (1, 1), (-1, 1)]:
+                    end_row, end_col = row + (winning_pieces - 1) * dir[0], col + (winning_pieces - 1) * dir[1]
+                    if 1 <= end_row <= num_rows and end_col <= num_cols:
+                        lines.append(tuple((row + step * dir[0], col + step * dir[1]) for step in range(winning_pieces)))
+        cell_lines = {
+            (row, col): tuple(line_id for line_id, line in enumerate(lines) if (row, col) in line)
+            for row in range(1, num_rows + 1) for col in range(1, num_cols + 1)
+        }
+        winning_lines = WinningLines(lines=tuple(lines), cell_lines=cell_lines)
+        _WINNING_LINES[(num_rows, num_cols, winning_pieces)] = winning_lines
+    return winning_lines
+
+@attr.s(slots=True)
 class Sum:
     row_sum: int=attr.ib(default=0)
     col_sum: int=attr.ib(default=0)
     pos_slope_diag_sum: int=attr.ib(default=0)
     neg_slope_diag_sum: int=attr.ib(default=0)
 
-@attr.s
+@attr.s(slots=True)
 class Node:
     col: int = attr.ib()
     row: int = attr.ib()
@@ -27,12 +85,141 @@ class GameState:
         self.num_rows = num_rows
         self.num_cols = num_cols
         # A list of tuple containing the (row, col) for all the edge nodes. By definition number of edge nodes is upper
-        # bounded by number of columns
+        # bounded by number of columns. Setting it also sets heights, the number of pieces in each column
         self.edge_nodes = [Node(col=col, row=0, value=0) for col in range(1, self.num_cols+1)]
         self.grid = {} # key is a tuple of row and col
-        self.centre_col = int(self.num_cols // 2)
+        # columns are 1 indexed, so this is the column the board is mirror symmetric about (left of centre when even)
+        self.centre_col = (self.num_cols + 1) // 2
         self.game_complete = False
         self.verbose = False
+        # an agents.metrics.SearchMetrics counting the updates, None to count nothing
+        self.metrics = None
+        # One entry per update, holding everything needed to take the move back. See unmake_move
+        self.move_stack = []
+        # (cumulative sum, field, previous value) for every neighbour sum rewritten by the current update
+        self._sum_journal = []
+        self._zobrist_keys, self._zobrist_side_key = getZobristKeys(self.num_rows, self.num_cols)
+        self._zobrist_pieces = 0
+        self._zobrist_mirror_pieces = 0
+        self._initLineCounts()
+
+    def _initLineCounts(self):
+        self.winning_lines = getWinningLines(self.num_rows, self.num_cols)
+        # number of pieces of each player in every winning line
+        self.line_counts = {player: [0] * len(self.winning_lines.lines) for player in (1, -1)}
+        # number of lines holding WINNING_PIECES-1 pieces of a player and an empty cell, i.e. open threats
+        self.threat_counts = {1: 0, -1: 0}
+        # heuristic score of the position for player 1, see _lineCountsDelta
+        self.evaluation = 0
+
+    def _evaluationDelta(self, player_number: int, row, col, delta: int) -> int:
+        ''' Change of self.evaluation, for player 1, when <delta> pieces of <player_number> are added at (row, col).
+
+        The evaluation sums, over every winning line only one player has pieces in, LINE_WEIGHTS[pieces] for player 1
+        and minus that for player -1, plus CENTRE_COL_WEIGHT for every piece in the centre column. A move only changes
+        the lines through its cell.
+        '''
+        own_counts, other_counts = self.line_counts[player_number], self.line_counts[-player_number]
+        score = 0
+        for line_id in self.winning_lines.cell_lines[(row, col)]:
+            other = other_counts[line_id]
+            if other == 0:
+                own = own_counts[line_id]
+                score += LINE_WEIGHTS[own + delta] - LINE_WEIGHTS[own]
+            elif own_counts[line_id] + (delta if delta < 0 else 0) == 0:
+                # the line moves between belonging to the other player and being shared
+                score += delta * LINE_WEIGHTS[other]
+        if col == self.centre_col:
+            score += delta * CENTRE_COL_WEIGHT
+        return player_number * score
+
+    @property
+    def edge_nodes(self) -> Optional[List[Node]]:
+        return self._edge_nodes
+
+    @edge_nodes.setter
+    def edge_nodes(self, edge_nodes: Optional[List[Node]]):
+        ''' Replace the edge nodes wholesale and rebuild heights from them, index 0 being column 1. Columns without an
+        edge node count as full. update and unmake_move keep both in step one column at a time.
+        '''
+        self._edge_nodes = edge_nodes
+        self.heights = [self.num_rows] * self.num_cols
+        for edge_node in edge_nodes or []:
+            if 0 < edge_node.col <= self.num_cols:
+                self.heights[edge_node.col - 1] = edge_node.row
+        self._possible_moves = None
+
+    def getNextRow(self, col: int) -> int:
+        '''Row the next piece dropped in <col> lands in.'''
+        return self.heights[col-1] + 1
+
+    def isValidAction(self, action: Tuple[int, int]) -> bool:
+        '''Whether <action> is one of getPossibleMoves, looked up in the column heights.'''
+        row, col = action
+        return 0 < col <= self.num_cols and row == self.heights[col-1] + 1 and row <= self.num_rows
+
+    def scoreIfPlayed(self, col: int, player_number: Optional[int] = None) -> int:
+        ''' Evaluation of the position, for <player_number> (the player to move by default), after they play in
+        <col>. Costs one pass over the lines through the cell and does not touch the state.
+        '''
+        player = self.current_player if player_number is None else player_number
+        return player * (self.evaluation + self._evaluationDelta(player, self.getNextRow(col), col, 1))
+
+    def trackLines(self):
+        ''' Keep line_counts, threat_counts and evaluation up to date from here on. GameState always does, the line
+        counts are how it finds wins, so this is a no-op here; see BitboardGameState.trackLines.
+        '''
+
+    def _updateLineCounts(self, player_number: int, row, col, delta: int) -> bool:
+        ''' Add <delta> (1 for a move, -1 to take it back) pieces of <player_number> to the lines through (row, col),
+        keeping threat_counts and evaluation in step. Touches only the lines through the cell. Returns True if one of
+        them is now complete.
+        '''
+        # computed from the counts before the change, for moves and take-backs alike
+        self.evaluation += self._evaluationDelta(player_number, row, col, delta)
+        own_counts, other_counts = self.line_counts[player_number], self.line_counts[-player_number]
+        threat_counts = self.threat_counts
+        almost = WINNING_PIECES - 1
+        won = False
+        for line_id in self.winning_lines.cell_lines[(row, col)]:
+            own, other = own_counts[line_id], other_counts[line_id]
+            if other == 0:
+                threat_counts[player_number] += (own + delta == almost) - (own == almost)
+            elif own == 0 and other == almost:
+                # the line was a threat of the other player, the first piece of this player breaks it
+                threat_counts[-player_number] -= delta
+            elif own + delta == 0 and other == almost:
+                threat_counts[-player_number] += 1
+            own_counts[line_id] = own + delta
+            if own + delta == WINNING_PIECES:
+                won = True
+        return won
+
+    @property
+    def zobrist_hash(self) -> int:
+        ''' 64 bit Zobrist hash of the pieces on the board and the player to move, kept up to date by every update and
+        unmake_move in O(1).
+        '''
+        if self.current_player == -1:
+            return self._zobrist_pieces ^ self._zobrist_side_key
+        return self._zobrist_pieces
+
+    def canonicalHash(self) -> Tuple[int, bool]:
+        ''' The smaller of zobrist_hash and the hash of the position mirrored about the centre column, and whether the
+        mirrored one was taken. Mirror images are equivalent, so caches keyed on this store one entry per pair. A move
+        read from or written to such a cache must go through mirrorMove when the mirror was taken.
+        '''
+        mirror_hash = self._zobrist_mirror_pieces
+        if self.current_player == -1:
+            mirror_hash ^= self._zobrist_side_key
+        zobrist_hash = self.zobrist_hash
+        if mirror_hash < zobrist_hash:
+            return mirror_hash, True
+        return zobrist_hash, False
+
+    def mirrorMove(self, col: int) -> int:
+        '''Column <col> reflected about the centre of the board.'''
+        return self.num_cols + 1 - col
 
     def check_if_node_in_grid(self, node: Node) -> bool:
         ''' Checks if the node is within the specfic grid of 7X6.
@@ -48,18 +235,34 @@ class GameState:
         ''' Fina a list of places where the player could possibly play their next move. By definiton of the game, these
         are restricted to be the nodes that are 1 above the edge nodes in the grid where edge node is the highest filled
         row in any given column for every column.
+        The dict is built from the column heights once per move and shared by every call until the next update, so
+        callers must not change it or its nodes. Moves are scored on the nodes of moveNode instead.
         '''
-        possible_moves = {}
-        if self.edge_nodes is None:
-            return possible_moves
-
-        for edge_node in self.edge_nodes:
-            new_node = Node(col=edge_node.col, row=edge_node.row+1)
-            if not self.check_if_node_in_grid(new_node):
-                continue
-            possible_moves[(new_node.row, new_node.col)] = new_node
-
-        return possible_moves
+        if self._possible_moves is None:
+            self._possible_moves = {
+                (height + 1, col): Node(col=col, row=height + 1)
+                for col, height in enumerate(self.heights, start=1) if height < self.num_rows
+            }
+        return self._possible_moves
+
+    def getPossibleColumns(self) -> List[int]:
+        '''Columns (1 indexed) that still have room for a piece, left to right.'''
+        return [col for col, height in enumerate(self.heights, start=1) if height < self.num_rows]
+
+    def toBitboard(self) -> "BitboardGameState":
+        ''' Build a BitboardGameState holding the same position, player to move and move count as this state. Nodes are
+        replayed bottom up so that every column is filled in a valid order.
+        '''
+        bitboard = BitboardGameState(self.num_rows, self.num_cols, self.current_player)
+        for (row, col), node in sorted(self.grid.items()):
+            bitboard.update(node.value, (row, col))
+        # the replay order is not the order the moves were played in, so the copy starts with an empty history
+        bitboard.move_stack = []
+        bitboard.move_numer = self.move_numer
+        bitboard.game_complete = self.game_complete
+        bitboard.verbose = self.verbose
+        bitboard.metrics = self.metrics
+        return bitboard
 
     def getNextNode(self, row, col, dir: Tuple[int, int]):
         if self.check_if_index_in_grid(row + dir[0], col + dir[1]):
@@ -100,6 +303,7 @@ class GameState:
             # no need to update anything since the right node anyways started with 1 or -1 value for row_sum since it's left was empty
             return
         else:
+            self._sum_journal.append((right_node.cumulative_sum, 'row_sum', right_node.cumulative_sum.row_sum))
             right_node.cumulative_sum.row_sum = node.cumulative_sum.row_sum + self.current_player
             if self._gameOver(right_node):
                 self.game_complete = True
@@ -116,6 +320,7 @@ class GameState:
         if pos_slope_diag_upper_node is None or pos_slope_diag_upper_node.value != node.value:
             return
         else:
+            self._sum_journal.append((pos_slope_diag_upper_node.cumulative_sum, 'pos_slope_diag_sum', pos_slope_diag_upper_node.cumulative_sum.pos_slope_diag_sum))
             pos_slope_diag_upper_node.cumulative_sum.pos_slope_diag_sum = node.cumulative_sum.pos_slope_diag_sum + self.current_player
             if self._gameOver(pos_slope_diag_upper_node):
                 self.game_complete = True
@@ -131,6 +336,7 @@ class GameState:
         if neg_slope_diag_lower_node is None or neg_slope_diag_lower_node.value != node.value:
             return
         else:
+            self._sum_journal.append((neg_slope_diag_lower_node.cumulative_sum, 'neg_slope_diag_sum', neg_slope_diag_lower_node.cumulative_sum.neg_slope_diag_sum))
             neg_slope_diag_lower_node.cumulative_sum.neg_slope_diag_sum = node.cumulative_sum.neg_slope_diag_sum + self.current_player
             if self._gameOver(neg_slope_diag_lower_node):
                 self.game_complete = True
@@ -159,9 +365,13 @@ class GameState:
         self._updatePosSlopeDiagUpperNextNodesSum(node)
         return
 
+    def moveNode(self, player_number: int, action: Tuple[int, int]) -> Node:
+        '''A new Node for <action> with the cumulative sums it would get if <player_number> played it, to score the move.'''
+        return Node(row=action[0], col=action[1], cumulative_sum=self.updateNodeCumulativeSum(player_number, action))
+
     def updateNodeCumulativeSum(self, player_number: int, action: Tuple[int, int]) -> Sum:
         curr_node = Node(row=action[0], col=action[1])
-        col_prev_node = self.edge_nodes[action[1] - 1]  # since grid is 1 indexed
+        col_prev_node = self._edge_nodes[action[1] - 1]  # since grid is 1 indexed
         assert col_prev_node.row == action[0] - 1 and col_prev_node.col == action[1], f"Move is not a valid move"
         # if the player plays a blocking move then the most recent node starts with a new sum else we add to the sum
         # from previous node for both row and col
@@ -202,13 +412,27 @@ class GameState:
         Compute the cumulative sum value for the new node for rows, cols and each diagonal.
         Check if game over and set the state accordingly.
         Update the right row counts, positive slope diagonal and negative slope diagonal counts recursively if it is a middle node
+        Every update pushes an entry on the move stack so that it can be taken back with unmake_move.
         '''
-        self.move_numer += 1
+        if self.metrics is not None:
+            self.metrics.updates += 1
         curr_cumulative_sum = self.updateNodeCumulativeSum(player_number, action)
+        self._sum_journal = []
+        self.move_stack.append(
+            (action, self._edge_nodes[action[1]-1], self.current_player, self.game_complete, self._sum_journal)
+        )
+        self.move_numer += 1
+        self._zobrist_pieces ^= self._zobrist_keys[(player_number, action[0], action[1])]
+        self._zobrist_mirror_pieces ^= self._zobrist_keys[(player_number, action[0], self.num_cols + 1 - action[1])]
         curr_node = Node(row=action[0], col=action[1], value=player_number, cumulative_sum=curr_cumulative_sum)
-        self.edge_nodes[action[1]-1] = curr_node
+        self._edge_nodes[action[1]-1] = curr_node
+        self.heights[action[1]-1] = action[0]
+        self._possible_moves = None
         self.grid[(action[0], action[1])] = curr_node
-        if self._gameOver(curr_node):
+        # the winning lines through the new node decide the game, the cumulative sums are only kept for scoring
+        if self._updateLineCounts(player_number, action[0], action[1], 1):
+            if self.verbose:
+                print(f"Game over while checking for node : {curr_node}")
             self.game_complete = True
             return
 
@@ -218,6 +442,31 @@ class GameState:
         self._updateForMiddleNode(curr_node)
         return
 
+    def make_move(self, col: int):
+        ''' Play the current player's piece in <col> and hand the turn to the other player. Meant for tree search, where
+        every make_move is paired with an unmake_move instead of copying the state.
+        '''
+        self.update(self.current_player, (self.heights[col-1] + 1, col))
+        self.current_player = -self.current_player
+
+    def unmake_move(self):
+        ''' Take back the last update (or make_move). Restores the edge node, removes the node from the grid, reverts the
+        neighbour cumulative sums the update rewrote, and resets move_numer, current_player and game_complete.
+        '''
+        action, prev_edge_node, prev_player, prev_game_complete, sum_journal = self.move_stack.pop()
+        for cumulative_sum, field, value in reversed(sum_journal):
+            setattr(cumulative_sum, field, value)
+        player_number = self.grid.pop(action).value
+        self._updateLineCounts(player_number, action[0], action[1], -1)
+        self._zobrist_pieces ^= self._zobrist_keys[(player_number, action[0], action[1])]
+        self._zobrist_mirror_pieces ^= self._zobrist_keys[(player_number, action[0], self.num_cols + 1 - action[1])]
+        self._edge_nodes[action[1]-1] = prev_edge_node
+        self.heights[action[1]-1] = prev_edge_node.row
+        self._possible_moves = None
+        self.move_numer -= 1
+        self.current_player = prev_player
+        self.game_complete = prev_game_complete
+
 
     def getMaxLookAheadSum(self, node: Node, dir: List[int], sum_accessor_fn: Callable):
         ''' Recursively find the length of the max continuous series for same player as for the <node> that exists to
@@ -294,4 +543,256 @@ class GameState:
                 print(f"Negative Diagonal blocking move : {node.row, node.col}")
             return blocking_neg_diag
 
-        return False
\ No newline at end of file
+        return False
+
+
+class _BitboardGrid(Mapping):
+    ''' Read only view over a BitboardGameState that exposes the same (row, col) -> Node lookups as GameState.grid.
+    Nodes are built on demand, including their cumulative sums, so printing, scoring and blocking checks written
+    against the dict grid keep working.
+    '''
+    def __init__(self, state: "BitboardGameState"):
+        self._state = state
+
+    def get(self, key, default=None):
+        row, col = key
+        state = self._state
+        if not state.check_if_index_in_grid(row, col):
+            return default
+        value = state.getCellValue(row, col)
+        if value == 0:
+            return default
+        return Node(col=col, row=row, value=value, cumulative_sum=state.getCellSum(row, col, value))
+
+    def __getitem__(self, key) -> Node:
+        node = self.get(key)
+        if node is None:
+            raise KeyError(key)
+        return node
+
+    def __contains__(self, key) -> bool:
+        row, col = key
+        return self._state.check_if_index_in_grid(row, col) and self._state.getCellValue(row, col) != 0
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for col, height in enumerate(self._state.heights, start=1):
+            for row in range(1, height + 1):
+                yield (row, col)
+
+    def __len__(self) -> int:
+        return sum(self._state.heights)
+
+
+class BitboardGameState(GameState):
+    ''' Game state backed by one integer bitmask per player and a per column height array.
+
+    Cell (row, col) maps to bit (col-1)*(num_rows+1) + (row-1). Every column carries one spare sentinel bit above its
+    top row, so shifting a board by 1, num_rows, num_rows+1 or num_rows+2 walks a column, a negative slope diagonal, a
+    row or a positive slope diagonal without wrapping into the next column. A move is an OR and a height increment, and
+    a win is a handful of shift-and-AND tests instead of the recursive cumulative sum updates of GameState.
+
+    grid and edge_nodes are adapters that build Node objects on demand, so Game and the agents can use this class as a
+    drop-in replacement for GameState.
+    '''
+    def __init__(self, num_rows, num_cols, current_player: int):
+        self.move_numer = 0
+        self.current_player = current_player
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        # columns are 1 indexed, so this is the column the board is mirror symmetric about (left of centre when even)
+        self.centre_col = (self.num_cols + 1) // 2
+        self.game_complete = False
+        self.verbose = False
+        self.metrics = None
+        # number of pieces in each column, index 0 is column 1
+        self.heights = [0] * self.num_cols
+        self._possible_moves = None
+        # one bitmask per player plus the union of both
+        self.boards = {1: 0, -1: 0}
+        self.mask = 0
+        self._stride = self.num_rows + 1
+        self._win_shifts = (1, self._stride, self._stride - 1, self._stride + 1)
+        self._bottom_mask = sum(1 << (col * self._stride) for col in range(self.num_cols))
+        self.grid = _BitboardGrid(self)
+        self.move_stack = []
+        self._zobrist_keys, self._zobrist_side_key = getZobristKeys(self.num_rows, self.num_cols)
+        self._zobrist_pieces = 0
+        self._zobrist_mirror_pieces = 0
+        self.winning_lines = getWinningLines(self.num_rows, self.num_cols)
+        # line_counts, threat_counts and evaluation are only kept after trackLines, see there
+        self.track_lines = False
+        self.line_counts = self.threat_counts = self.evaluation = None
+
+    def trackLines(self):
+        ''' Keep line_counts, threat_counts and evaluation up to date on every move from here on, for the incremental
+        evaluator. They are off by default so that a move stays a handful of integer operations for the perft counts,
+        MCTS playouts and the solver, which never read them. The counts are rebuilt from the boards, so tracking can
+        start in any position, and copies keep tracking.
+        '''
+        if self.track_lines:
+            return
+        self.track_lines = True
+        self._initLineCounts()
+        for col, height in enumerate(self.heights, start=1):
+            for row in range(1, height + 1):
+                self._updateLineCounts(self.getCellValue(row, col), row, col, 1)
+
+    @property
+    def edge_nodes(self) -> List[Node]:
+        '''Highest filled node of every column, or a row 0 placeholder for empty columns, as in GameState.'''
+        return [
+            self.grid.get((height, col)) if height else Node(col=col, row=0, value=0)
+            for col, height in enumerate(self.heights, start=1)
+        ]
+
+    def _bit(self, row, col) -> int:
+        return 1 << ((col - 1) * self._stride + row - 1)
+
+    def positionKey(self) -> int:
+        ''' Exact key of the position for the player to move: their stones plus all the stones plus the bottom row.
+        Adding the bottom row turns every column's stones into a unique bit pattern, so unlike zobrist_hash two
+        different positions never share a key. It fits in 64 bits when (num_rows+1)*num_cols <= 64.
+        '''
+        return self.boards[self.current_player] + self.mask + self._bottom_mask
+
+    def _mirrorBits(self, board: int) -> int:
+        ''' Reverse the order of the column bit groups of <board>. Works on positionKey as well, since adding the
+        bottom row never carries from one column group into the next.
+        '''
+        column_mask = (1 << self._stride) - 1
+        mirrored = 0
+        for col in range(self.num_cols):
+            mirrored |= ((board >> (col * self._stride)) & column_mask) << ((self.num_cols - 1 - col) * self._stride)
+        return mirrored
+
+    def canonicalKey(self) -> Tuple[int, bool]:
+        ''' The smaller of positionKey and the key of the mirrored position, and whether the mirrored one was taken.
+        Like canonicalHash, but exact.
+        '''
+        key = self.positionKey()
+        mirrored_key = self._mirrorBits(key)
+        if mirrored_key < key:
+            return mirrored_key, True
+        return key, False
+
+    def getCellValue(self, row, col) -> int:
+        '''Returns the player occupying the cell, or 0 if it is empty.'''
+        bit = self._bit(row, col)
+        if self.boards[1] & bit:
+            return 1
+        if self.boards[-1] & bit:
+            return -1
+        return 0
+
+    def _runLength(self, board: int, row, col, dir: Tuple[int, int]) -> int:
+        '''Number of consecutive cells of <board> starting at (row, col) and walking in direction <dir>.'''
+        length = 0
+        while self.check_if_index_in_grid(row, col) and board & self._bit(row, col):
+            length += 1
+            row += dir[0]
+            col += dir[1]
+        return length
+
+    def getCellSum(self, row, col, player_number) -> Sum:
+        '''Cumulative sums of an occupied cell, computed the same way GameState keeps them: the signed length of the
+        streak ending at the cell when walking left to right (bottom to top for columns).'''
+        board = self.boards[player_number]
+        return Sum(
+            row_sum=player_number * self._runLength(board, row, col, (0, -1)),
+            col_sum=player_number * self._runLength(board, row, col, (-1, 0)),
+            pos_slope_diag_sum=player_number * self._runLength(board, row, col, (-1, -1)),
+            neg_slope_diag_sum=player_number * self._runLength(board, row, col, (1, -1)),
+        )
+
+    def updateNodeCumulativeSum(self, player_number: int, action: Tuple[int, int]) -> Sum:
+        row, col = action
+        assert self.heights[col - 1] == row - 1, f"Move is not a valid move"
+        board = self.boards[player_number]
+        return Sum(
+            row_sum=player_number * (1 + self._runLength(board, row, col - 1, (0, -1))),
+            col_sum=player_number * (1 + self._runLength(board, row - 1, col, (-1, 0))),
+            pos_slope_diag_sum=player_number * (1 + self._runLength(board, row - 1, col - 1, (-1, -1))),
+            neg_slope_diag_sum=player_number * (1 + self._runLength(board, row + 1, col - 1, (1, -1))),
+        )
+
+    def getPossibleColumns(self) -> List[int]:
+        '''Columns (1 indexed) that still have room for a piece, left to right.'''
+        return [col for col, height in enumerate(self.heights, start=1) if height < self.num_rows]
+
+
+    def _isWin(self, board: int) -> bool:
+        for shift in self._win_shifts:
+            streak = board
+            for step in range(1, WINNING_PIECES):
+                streak &= board >> (step * shift)
+            if streak:
+                return True
+        return False
+
+    def update(self, player_number, action: Tuple[int, int]):
+        '''
+        Drop a piece for <player_number> at <action>, which must be the next free row of its column, and check whether
+        it completes a line of WINNING_PIECES.
+        '''
+        if self.metrics is not None:
+            self.metrics.updates += 1
+        row, col = action
+        assert self.heights[col - 1] == row - 1, f"Move is not a valid move"
+        self.move_stack.append((player_number, col, self.current_player, self.game_complete))
+        bit = self._bit(row, col)
+        self.boards[player_number] |= bit
+        self.mask |= bit
+        self.heights[col - 1] = row
+        self._possible_moves = None
+        self.move_numer += 1
+        self._zobrist_pieces ^= self._zobrist_keys[(player_number, row, col)]
+        self._zobrist_mirror_pieces ^= self._zobrist_keys[(player_number, row, self.num_cols + 1 - col)]
+        if self.track_lines:
+            self._updateLineCounts(player_number, row, col, 1)
+        if self._isWin(self.boards[player_number]):
+            if self.verbose:
+                print(f"Game over after move : {action}")
+            self.game_complete = True
+
+    def make_move(self, col: int):
+        self.update(self.current_player, (self.heights[col - 1] + 1, col))
+        self.current_player = -self.current_player
+
+    def unmake_move(self):
+        player_number, col, prev_player, prev_game_complete = self.move_stack.pop()
+        row = self.heights[col - 1]
+        self._zobrist_pieces ^= self._zobrist_keys[(player_number, row, col)]
+        self._zobrist_mirror_pieces ^= self._zobrist_keys[(player_number, row, self.num_cols + 1 - col)]
+        if self.track_lines:
+            self._updateLineCounts(player_number, row, col, -1)
+        bit = self._bit(self.heights[col - 1], col)
+        self.boards[player_number] ^= bit
+        self.mask ^= bit
+        self.heights[col - 1] -= 1
+        self._possible_moves = None
+        self.move_numer -= 1
+        self.current_player = prev_player
+        self.game_complete = prev_game_complete
+
+    def toBitboard(self) -> "BitboardGameState":
+        return self.copy()
+
+    def copy(self) -> "BitboardGameState":
+        '''Cheap independent copy, the board itself is just a few integers.'''
+        new_state = BitboardGameState(self.num_rows, self.num_cols, self.current_player)
+        new_state.move_numer = self.move_numer
+        new_state.game_complete = self.game_complete
+        new_state.verbose = self.verbose
+        new_state.metrics = self.metrics
+        new_state.heights = list(self.heights)
+        new_state.boards = dict(self.boards)
+        new_state.mask = self.mask
+        new_state._zobrist_pieces = self._zobrist_pieces
+        new_state._zobrist_mirror_pieces = self._zobrist_mirror_pieces
+        if self.track_lines:
+            new_state.track_lines = True
+            new_state.line_counts = {player: list(counts) for player, counts in self.line_counts.items()}
+            new_state.threat_counts = dict(self.threat_counts)
+            new_state.evaluation = self.evaluation
+        new_state.move_stack = list(self.move_stack)
+        return new_state
@@ -0,0 +1,133 @@
+from optparse import OptionParser
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+
+def _latencyStats(latencies: List[float]) -> Dict[str, float]:
+    if not latencies:
+        return {'mean': 0.0, 'p50': 0.0, 'p99': 0.0, 'max': 0.0}
+    ordered = sorted(latencies)
+    return {
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p99': ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))],
+        'max': ordered[-1],
+    }
+
+
+class LoadClient:
+    ''' Plays games against a running server.py, one game at a time per connection, with uniformly random human moves,
+    and times every move request. The latency of a move request covers the human move and the AI's reply.
+    '''
+    def __init__(self, args):
+        self.args = args
+        self.agent_args = json.loads(args.agent_args)
+        self.games_left = args.num_games
+        self.latencies: List[float] = []
+        self.games_played = 0
+        self.errors = 0
+
+    async def _connect(self):
+        if self.args.unix:
+            return await asyncio.open_unix_connection(self.args.unix)
+        return await asyncio.open_connection(self.args.host, self.args.port)
+
+    async def _request(self, reader, writer, request: dict) -> dict:
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    async def runConnection(self, connection_number: int):
+        rng = random.Random(self.args.seed + connection_number)
+        reader, writer = await self._connect()
+        try:
+            while self.games_left > 0:
+                self.games_left -= 1
+                game = await self._request(reader, writer, {
+                    'op': 'new', 'agent': self.args.agent, 'agent_args': self.agent_args,
+                    'rows': self.args.num_rows, 'cols': self.args.num_cols, 'ai_first': rng.random() < 0.5,
+                })
+                if not game['ok']:
+                    self.errors += 1
+                    continue
+                while not game['complete']:
+                    start = time.perf_counter()
+                    game = await self._request(reader, writer, {
+                        'op': 'move', 'game_id': game['game_id'], 'col': rng.choice(game['possible_columns']),
+                    })
+                    self.latencies.append(time.perf_counter() - start)
+                    if not game['ok']:
+                        self.errors += 1
+                        break
+                await self._request(reader, writer, {'op': 'close', 'game_id': game.get('game_id')})
+                self.games_played += 1
+        finally:
+            writer.close()
+
+    async def run(self) -> dict:
+        start = time.perf_counter()
+        await asyncio.gather(*(self.runConnection(number) for number in range(self.args.concurrency)))
+        wall_time = time.perf_counter() - start
+        return {
+            'games': self.games_played,
+            'moves': len(self.latencies),
+            'errors': self.errors,
+            'wall_time': wall_time,
+            'moves_per_second': len(self.latencies) / wall_time if wall_time > 0 else 0.0,
+            'latency': _latencyStats(self.latencies),
+        }
+
+
+def printSummary(summary: dict):
+    latency = summary['latency']
+    print(
+        f"Games : {summary['games']}, moves : {summary['moves']}, errors : {summary['errors']} in "
+        f"{summary['wall_time']:.1f}s, {summary['moves_per_second']:.1f} moves/s"
+    )
+    print(
+        f"Move latency mean {latency['mean'] * 1000:.2f}ms p50 {latency['p50'] * 1000:.2f}ms "
+        f"p99 {latency['p99'] * 1000:.2f}ms max {latency['max'] * 1000:.2f}ms"
+    )
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python loadgen.py <options>
+    EXAMPLES:   (1) python loadgen.py -p 4004 -n 200 -c 50 -a GreedyAgent
+                (2) python loadgen.py --unix /tmp/connect4.sock -a AlphaBetaAgent --agent_args '{"depth": 4}'
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('--host', dest='host', help='the server address', default='127.0.0.1')
+    parser.add_option('-p', '--port', dest='port', type='int', help='the server TCP port', default=4004)
+    parser.add_option('--unix', dest='unix', help='connect to this Unix socket path instead of TCP', default=None)
+    parser.add_option('-n', '--num_games', dest='num_games', type='int', help='the number of games to play', default=100)
+    parser.add_option('-c', '--concurrency', dest='concurrency', type='int', help='the number of connections playing at once', default=10)
+    parser.add_option('-a', '--agent', dest='agent', help='the agent TYPE the server plays', default='GreedyAgent')
+    parser.add_option('--agent_args', dest='agent_args', help='JSON keyword arguments of the agent', default='{}')
+    parser.add_option('-r', '--num_rows', dest='num_rows', type='int', help='the number of rows in the board', default=6)
+    parser.add_option('--num_col', dest='num_cols', type='int', help='the number of cols in the board', default=7)
+    parser.add_option('-s', '--seed', dest='seed', type='int', help='the base random seed of the human moves', default=0)
+    parser.add_option('-o', '--output', dest='output', help='write the summary as JSON to this path', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    """
+    Load generator for server.py, reports moves per second and move latency percentiles.
+
+    > python loadgen.py -p 4004 -n 200 -c 50
+    """
+    args = readCommand(sys.argv[1:])
+    summary = asyncio.run(LoadClient(args).run())
+    printSummary(summary)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
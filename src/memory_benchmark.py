@@ -0,0 +1,130 @@
+from optparse import OptionParser
+import json
+import random
+import sys
+import tracemalloc
+import types
+from typing import Dict
+
+from run import GAME_STATE_ENGINES, Game
+
+
+def _playRandomMoves(game_state, rng: random.Random, num_moves: int):
+    ''' Plays like Game.alternateTurns with two random agents: every move asks for the possible moves, validates the
+    chosen action and updates the state.
+    '''
+    game = types.SimpleNamespace(game_state=game_state)
+    player = game_state.current_player
+    for _ in range(num_moves):
+        moves = game_state.getPossibleMoves()
+        if game_state.game_complete or not moves:
+            break
+        action = rng.choice(list(moves.keys()))
+        assert Game.validateAction(game, action)
+        game_state.current_player = player
+        game_state.update(player, action)
+        player = -player
+
+
+def _tracedBlocks() -> int:
+    return sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+
+
+def measurePosition(engine: str, num_rows: int, num_cols: int, plies: int, seed: int, games: int) -> Dict[str, float]:
+    ''' Memory held by a game state after up to <plies> random moves, move history included, and the number of memory
+    blocks it is made of, averaged over <games> games.
+    '''
+    total_bytes, total_blocks = 0, 0
+    tracemalloc.start()
+    try:
+        for game_number in range(games):
+            start_bytes, _ = tracemalloc.get_traced_memory()
+            start_blocks = _tracedBlocks()
+            game_state = GAME_STATE_ENGINES[engine](num_rows, num_cols, 1)
+            _playRandomMoves(game_state, random.Random(seed + game_number), plies)
+            end_bytes, _ = tracemalloc.get_traced_memory()
+            total_bytes += end_bytes - start_bytes
+            total_blocks += _tracedBlocks() - start_blocks
+            del game_state
+    finally:
+        tracemalloc.stop()
+    return {'bytes_per_position': total_bytes / games, 'blocks_per_position': total_blocks / games}
+
+
+def measureMoves(engine: str, num_rows: int, num_cols: int, seed: int, games: int) -> Dict[str, float]:
+    ''' Allocations of one move of a random game, averaged over the moves of <games> games: the bytes and blocks the
+    state keeps per move, and the transient bytes (peak above the memory held before the move) that are allocated and
+    freed again.
+    '''
+    num_moves, kept_bytes, kept_blocks, transient_bytes = 0, 0, 0, 0
+    tracemalloc.start()
+    try:
+        for game_number in range(games):
+            game_state = GAME_STATE_ENGINES[engine](num_rows, num_cols, 1)
+            rng = random.Random(seed + game_number)
+            start_blocks = _tracedBlocks()
+            while not game_state.game_complete and game_state.getPossibleColumns():
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                _playRandomMoves(game_state, rng, 1)
+                after, peak = tracemalloc.get_traced_memory()
+                kept_bytes += after - before
+                transient_bytes += peak - after
+                num_moves += 1
+            kept_blocks += _tracedBlocks() - start_blocks
+    finally:
+        tracemalloc.stop()
+    num_moves = max(num_moves, 1)
+    return {
+        'moves': num_moves,
+        'kept_bytes_per_move': kept_bytes / num_moves,
+        'kept_blocks_per_move': kept_blocks / num_moves,
+        'transient_bytes_per_move': transient_bytes / num_moves,
+    }
+
+
+def runBenchmark(num_rows: int, num_cols: int, plies: int, seed: int, games: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for engine in GAME_STATE_ENGINES:
+        results[engine] = measurePosition(engine, num_rows, num_cols, plies, seed, games)
+        results[engine].update(measureMoves(engine, num_rows, num_cols, seed, games))
+    return results
+
+
+def printResults(results: Dict[str, Dict[str, float]]):
+    columns = list(next(iter(results.values())))
+    print(f"{'engine':<10}" + ''.join(f"{column:>26}" for column in columns))
+    for engine, row in results.items():
+        print(f"{engine:<10}" + ''.join(f"{row[column]:>26.1f}" for column in columns))
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python memory_benchmark.py <options>
+    EXAMPLES:   (1) python memory_benchmark.py -r 6 -c 7 -p 21
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-r', '--num_rows', dest='num_rows', type='int', help='the number of rows in the board', default=6)
+    parser.add_option('-c', '--num_col', dest='num_cols', type='int', help='the number of cols in the board', default=7)
+    parser.add_option('-p', '--plies', dest='plies', type='int', help='the number of moves in the measured position', default=21)
+    parser.add_option('-s', '--seed', dest='seed', type='int', help='the random seed of the moves', default=0)
+    parser.add_option('-g', '--games', dest='games', type='int', help='the number of random games to average over', default=20)
+    parser.add_option('-o', '--output', dest='output', help='write the results as JSON to this path', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    """
+    Measures with tracemalloc the memory a game state takes per position and allocates per move, for every engine.
+
+    > python memory_benchmark.py -r 6 -c 7 -p 21
+    """
+    args = readCommand(sys.argv[1:])
+    results = runBenchmark(args.num_rows, args.num_cols, args.plies, args.seed, args.games)
+    printResults(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
@@ -0,0 +1,168 @@
+from optparse import OptionParser
+import sys
+import time
+from typing import Dict, List, Sequence, Tuple
+
+# Leaf counts by depth from the empty board with player 1 to move and WINNING_PIECES=4, as counted by naivePerft
+KNOWN_PERFT: Dict[Tuple[int, int], List[int]] = {
+    (4, 4): [1, 4, 16, 64, 256, 1020, 4020, 15540, 57504, 206904, 690504],
+    (4, 5): [1, 5, 25, 125, 625, 3120, 15500, 76300, 363308],
+    (5, 6): [1, 6, 36, 216, 1296, 7776, 46650, 279720],
+    (6, 7): [1, 7, 49, 343, 2401, 16807, 117649, 823536, 5673234],
+}
+
+
+def perft(game_state, depth: int) -> int:
+    ''' Number of positions reached by playing every sequence of <depth> moves from <game_state>, with
+    getPossibleMoves and update. A game that is won before the last move is not played on, so it adds nothing. The
+    state is left as it was.
+    '''
+    if depth == 0:
+        return 1
+    player = game_state.current_player
+    nodes = 0
+    for action in list(game_state.getPossibleMoves()):
+        game_state.update(player, action)
+        if depth == 1:
+            nodes += 1
+        elif not game_state.game_complete:
+            game_state.current_player = -player
+            nodes += perft(game_state, depth - 1)
+        game_state.unmake_move()
+    return nodes
+
+
+def divide(game_state, depth: int) -> Dict[Tuple[int, int], int]:
+    '''perft(<depth>) split by the first move, to narrow a wrong count down to one line of play.'''
+    player = game_state.current_player
+    counts = {}
+    for action in list(game_state.getPossibleMoves()):
+        game_state.update(player, action)
+        game_state.current_player = -player
+        counts[action] = 1 if depth == 1 else 0 if game_state.game_complete else perft(game_state, depth - 1)
+        game_state.unmake_move()
+    return counts
+
+
+def parseMoves(moves: str) -> List[int]:
+    '''Columns (1 indexed) of a move string: one digit per move like "4453", or comma separated like "4,10,3".'''
+    try:
+        return [int(col) for col in (moves.split(',') if ',' in moves else moves)]
+    except ValueError:
+        raise ValueError(f"Moves {moves!r} are not a string of columns like 4453 or 4,10,3") from None
+
+
+def playMoves(game_state, moves: Sequence[int]):
+    '''Play <moves>, a sequence of columns, with make_move, checking that every one is legal and none ends the game.'''
+    for number, col in enumerate(moves, start=1):
+        if col not in game_state.getPossibleColumns():
+            raise ValueError(f"Move {number} plays column {col}, which is full or off the board")
+        game_state.make_move(col)
+        if game_state.game_complete:
+            raise ValueError(f"Move {number} in column {col} ends the game")
+
+
+def naivePerft(num_rows: int, num_cols: int, depth: int, winning_pieces: int = 4, moves: Sequence[int] = ()) -> int:
+    ''' perft from the empty board, or the position after <moves> (columns), on a plain list of rows, checking for a
+    win by scanning every line of the board after every move. Shares no code with the game states, which is what makes
+    it a reference for them; it is far too slow for anything else.
+    '''
+    board = [[0] * num_cols for _ in range(num_rows)]
+    for number, col in enumerate(moves):
+        row = next(row for row in range(num_rows) if board[row][col - 1] == 0)
+        board[row][col - 1] = 1 if number % 2 == 0 else -1
+
+    def won(player: int) -> bool:
+        for row in range(num_rows):
+            for col in range(num_cols):
+                for d_row, d_col in ((0, 1), (1, 0), (1, 1), (-1, 1)):
+                    cells = [(row + step * d_row, col + step * d_col) for step in range(winning_pieces)]
+                    if all(0 <= r < num_rows and 0 <= c < num_cols and board[r][c] == player for r, c in cells):
+                        return True
+        return False
+
+    def count(depth: int, player: int) -> int:
+        if depth == 0:
+            return 1
+        nodes = 0
+        for col in range(num_cols):
+            row = next((row for row in range(num_rows) if board[row][col] == 0), None)
+            if row is None:
+                continue
+            board[row][col] = player
+            if depth == 1:
+                nodes += 1
+            elif not won(player):
+                nodes += count(depth - 1, -player)
+            board[row][col] = 0
+        return nodes
+
+    return count(depth, 1 if len(moves) % 2 == 0 else -1)
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python perft.py <options>
+    EXAMPLES:   (1) python perft.py -r 6 -c 7 -d 8
+                (2) python perft.py -r 5 -c 8 -d 6 -e bitboard --naive
+                (3) python perft.py -r 4 -c 4 -d 6 --divide
+                (4) python perft.py -r 6 -c 7 -d 6 -m 4453 --naive
+    """
+    from run import GAME_STATE_ENGINES
+
+    parser = OptionParser(usageStr)
+    parser.add_option('-r', '--num_rows', dest='num_rows', type='int', help='the number of rows in the board', default=6)
+    parser.add_option('-c', '--num_col', dest='num_cols', type='int', help='the number of cols in the board', default=7)
+    parser.add_option('-d', '--depth', dest='depth', type='int', help='count the positions up to this many moves ahead', default=6)
+    parser.add_option('-e', '--engine', dest='engine', type='choice', choices=list(GAME_STATE_ENGINES),
+                      help='the game state implementation: ' + ', '.join(GAME_STATE_ENGINES), default='grid')
+    parser.add_option('-m', '--moves', dest='moves', help='count from the position after these columns, like 4453 or 4,10,3',
+                      default='')
+    parser.add_option('--naive', dest='naive', action='store_true',
+                      help='check against naivePerft for the depths without a known value (slow)', default=False)
+    parser.add_option('--divide', dest='divide', action='store_true',
+                      help='also print the count below every first move at the last depth', default=False)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    options.moves = parseMoves(options.moves)
+    return options
+
+
+if __name__ == '__main__':
+    """
+    perft from the empty board, or the position after -m, at every depth up to -d, checked against the known counts of
+    the board size (or naivePerft with --naive), with the nodes per second of the engine. Exits with status 1 on a wrong
+    count.
+
+    > python perft.py -r 6 -c 7 -d 8 -e bitboard
+    """
+    # imported here rather than at the top so that the tests can import this module from the repository root
+    from run import GAME_STATE_ENGINES
+
+    args = readCommand(sys.argv[1:])
+    # the known counts are from the empty board
+    known = [] if args.moves else KNOWN_PERFT.get((args.num_rows, args.num_cols), [])
+    game_state = GAME_STATE_ENGINES[args.engine](args.num_rows, args.num_cols, 1)
+    playMoves(game_state, args.moves)
+    failed = False
+    print(f"{'depth':>5}{'nodes':>14}{'expected':>14}{'seconds':>10}{'nodes/s':>12}  status")
+    for depth in range(args.depth + 1):
+        start = time.perf_counter()
+        nodes = perft(game_state, depth)
+        seconds = time.perf_counter() - start
+        if depth < len(known):
+            expected = known[depth]
+        elif args.naive:
+            expected = naivePerft(args.num_rows, args.num_cols, depth, moves=args.moves)
+        else:
+            expected = None
+        status = 'unknown' if expected is None else 'ok' if nodes == expected else 'WRONG'
+        failed = failed or status == 'WRONG'
+        nodes_per_second = f"{nodes / seconds:.0f}" if seconds > 0 else '-'
+        print(f"{depth:>5}{nodes:>14}{expected if expected is not None else '-':>14}{seconds:>10.3f}{nodes_per_second:>12}  {status}")
+    if args.divide and args.depth > 0:
+        for action, nodes in divide(game_state, args.depth).items():
+            print(f"{action}: {nodes}")
+    if failed:
+        sys.exit(1)
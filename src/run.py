@@ -1,10 +1,12 @@
 from collections import defaultdict
 import random
-from typing import Tuple, Type
+from typing import List, Optional, Tuple, Type
 import sys
 
 from agents import agent
-from game_state import GameState
+from agents.metrics import SearchMetrics
+from agents.records import GameRecord, RecordWriter
+from game_state import BitboardGameState, GameState
 from agents.keyboard_agent import KeyBoardAgent
 
 NUM_ROWS = 3
@@ -18,8 +20,13 @@ PLAYER_PIECE_MAPPING = {
     AI_PLAYER: ' o '
 }
 
+GAME_STATE_ENGINES = {
+    'grid': GameState,
+    'bitboard': BitboardGameState,
+}
+
 class Game:
-    def __init__(self, computer_agent: str, human_agent: str="KeyBoardAgent",  num_rows=6, num_cols=7, verbose=False, agent_args={}):
+    def __init__(self, computer_agent: str, human_agent: str="KeyBoardAgent",  num_rows=6, num_cols=7, verbose=False, agent_args={}, engine: str="grid"):
         ''' The main game class that orchestrates the running of the game and encapsulates the core game logic and rules
         '''
         self.NUM_ROWS = num_rows
@@ -28,8 +35,15 @@ class Game:
         self.human_player = loadAgent(human_agent)(HUMAN_PLAYER) # assumes human agent is always keyboard agent for now
         self.computer_player = loadAgent(computer_agent)(AI_PLAYER, **agent_args)
         self._coinToss()
-        self.game_state = GameState(num_rows=self.NUM_ROWS, num_cols=self.NUM_COLS, current_player=self.current_player.identifier)
-        self.log = defaultdict(list)
+        self.first_player = self.current_player.identifier
+        self.game_state = GAME_STATE_ENGINES[engine](num_rows=self.NUM_ROWS, num_cols=self.NUM_COLS, current_player=self.current_player.identifier)
+        # (player, action) of every move played, in order
+        self.log: List[Tuple[int, Tuple[int, int]]] = []
+        # (player, action) of the moves taken back, the most recently taken back last, until a new move is played
+        self.redo_log: List[Tuple[int, Tuple[int, int]]] = []
+        # the computer's time_used after each of its moves, so undo and redo hand back the time budget of the position
+        self.ai_times: List[float] = []
+        self.redo_ai_times: List[float] = []
         self.print_grid = defaultdict(list)
         self.game_state.verbose = verbose
 
@@ -42,8 +56,11 @@ class Game:
         '''
         Main API that is exposed to the players. This API coordinates that entire game play.
         '''
-        for turn in range(self.NUM_COLS*self.NUM_ROWS):
-            action = self.current_player.getAction(self.game_state)
+        if self.current_player is self.human_player:
+            self.computer_player.startPondering(self.game_state)
+        # starts from the moves already played, so a game can be resumed after undo or redo
+        for turn in range(len(self.log), self.NUM_COLS*self.NUM_ROWS):
+            action = self._getAction()
             print(f"chosen action by player {self.current_player.identifier} is {action}")
             if not self.validateAction(action):
                 raise ValueError(f"Invalid Input")
@@ -66,16 +83,38 @@ class Game:
                 break
             self.current_player = self.computer_player if self.current_player.identifier == HUMAN_PLAYER else self.human_player
             self.game_state.current_player = self.current_player.identifier
+            if self.current_player is self.human_player:
+                # a pondering agent searches on a copy of the board while the human thinks
+                self.computer_player.startPondering(self.game_state)
+            else:
+                self.computer_player.stopPondering()
             print("-*" * 50)
             print(f"Current player after turn : {turn} is {self.current_player.identifier}")
 
 
+    def _getAction(self) -> Tuple[int, int]:
+        ''' The current player's action. The game state counts its updates into the computer player's metrics only
+        while the computer chooses its move, so a record holds the updates of that search and not the moves played.
+        '''
+        if self.current_player is not self.computer_player:
+            return self.current_player.getAction(self.game_state)
+        self.game_state.metrics = self.computer_player.metrics
+        try:
+            return self.computer_player.getAction(self.game_state)
+        finally:
+            self.game_state.metrics = None
+
     def validateAction(self, action: Tuple[int, int]) -> bool:
         '''Checks if the chosen action is an actual valid move based on computed possible moves'''
-        return action in self.game_state.getPossibleMoves().keys()
+        return self.game_state.isValidAction(action)
 
     def updateGameState(self, action: Tuple[int, int]):
         self.game_state.update(self.current_player.identifier, action)
+        self._updateLog(action)
+        if self.current_player is self.computer_player:
+            self.ai_times.append(self.computer_player.time_used)
+        self.redo_log.clear()
+        self.redo_ai_times.clear()
         print(f"Updated for action : {action}, player : {self.current_player.identifier}")
 
     def checkWinner(self) -> bool:
@@ -94,20 +133,87 @@ class Game:
         for idx in self.game_state.getPossibleMoves():
             print(idx)
 
-    def _updateLog(self):
-        pass
+    def _updateLog(self, action: Tuple[int, int]):
+        self.log.append((self.current_player.identifier, action))
 
-    def undo(self, num_moves: int):
-        pass
+    def winner(self) -> Optional[int]:
+        '''The player who won, 0 for a draw and None while the game is on.'''
+        if self.game_state.game_complete:
+            return self.log[-1][0]
+        return None if self.game_state.getPossibleColumns() else 0
 
-    def undoSingleTurn(self, turn_number: int):
-        pass
+    def gameRecord(self) -> GameRecord:
+        '''The game so far as a GameRecord, see agents/records.py.'''
+        return GameRecord(
+            self.NUM_ROWS, self.NUM_COLS, self.first_player, self.winner(), bytes(col for _, (_, col) in self.log)
+        )
 
-    def _undoLastNLogsUpdates(self, num_actions: int):
-        pass
+    def undo(self, num_moves: int = 1) -> List[Tuple[int, Tuple[int, int]]]:
+        ''' Take back the last <num_moves> moves, which can be played again with redo until a new move is played.
+        Every move is reverted with the game state's unmake_move, so this costs <num_moves> small reversals whatever
+        the length of the game. Returns the (player, action) of the moves taken back, the last move first.
+        '''
+        if not 0 < num_moves <= len(self.log):
+            raise ValueError(f"Cannot undo {num_moves} moves, {len(self.log)} have been played")
+        self.computer_player.stopPondering()
+        undone = self._undoLastNLogsUpdates(num_moves)
+        print(f"Took back {num_moves} moves, player {self.current_player.identifier} to play")
+        return undone
+
+    def undoSingleTurn(self, turn_number: int) -> List[Tuple[int, Tuple[int, int]]]:
+        ''' Go back to the position before turn <turn_number> (counted from 1, as in the printed grids). The moves
+        played after it rest on it or were chosen because of it, so they are taken back with it and can be redone.
+        '''
+        if not 0 < turn_number <= len(self.log):
+            raise ValueError(f"Cannot undo turn {turn_number}, {len(self.log)} turns have been played")
+        self.computer_player.stopPondering()
+        undone = self._undoSpecificLogsUpdate(turn_number - 1)
+        print(f"Went back to before turn {turn_number}, player {self.current_player.identifier} to play")
+        return undone
 
-    def _undoSpecificLogsUpdate(self, num_actions: int):
-        pass
+    def redo(self, num_moves: int = 1) -> List[Tuple[int, Tuple[int, int]]]:
+        ''' Play the last <num_moves> moves taken back again, with one update each. Returns their (player, action).'''
+        if not 0 < num_moves <= len(self.redo_log):
+            raise ValueError(f"Cannot redo {num_moves} moves, {len(self.redo_log)} have been taken back")
+        self.computer_player.stopPondering()
+        redone = []
+        for _ in range(num_moves):
+            player, action = self.redo_log.pop()
+            self.game_state.update(player, action)
+            self.log.append((player, action))
+            if player == AI_PLAYER:
+                self.computer_player.time_used = self.redo_ai_times.pop()
+                self.ai_times.append(self.computer_player.time_used)
+            if not self.game_state.game_complete:
+                self.game_state.current_player = -player
+            redone.append((player, action))
+        self.current_player = self._player(self.game_state.current_player)
+        print(f"Played {num_moves} moves again, player {self.current_player.identifier} to play")
+        return redone
+
+    def _player(self, identifier: int) -> agent.BaseAgent:
+        return self.human_player if identifier == HUMAN_PLAYER else self.computer_player
+
+    def _undoLastNLogsUpdates(self, num_actions: int) -> List[Tuple[int, Tuple[int, int]]]:
+        ''' Pop the last <num_actions> log entries onto the redo log, unmaking each move on the game state, which also
+        hands the turn back to the player of the last move taken back, and the computer's time_used back to what it was
+        after its last move still played.
+        '''
+        undone = []
+        for _ in range(num_actions):
+            player, action = self.log.pop()
+            self.game_state.unmake_move()
+            self.redo_log.append((player, action))
+            if player == AI_PLAYER:
+                self.redo_ai_times.append(self.ai_times.pop())
+            undone.append((player, action))
+        self.computer_player.time_used = self.ai_times[-1] if self.ai_times else 0.0
+        self.current_player = self._player(self.game_state.current_player)
+        return undone
+
+    def _undoSpecificLogsUpdate(self, log_index: int) -> List[Tuple[int, Tuple[int, int]]]:
+        '''Undo the log entry at <log_index> together with every entry after it.'''
+        return self._undoLastNLogsUpdates(len(self.log) - log_index)
 
 def loadAgent(agent_to_load: str) -> Type[agent.BaseAgent]:
     '''Loads the agent type as specified in args from the BaseAgent class'''
@@ -143,12 +249,12 @@ def readCommand(argv):
 
     # parser.add_option('-n', '--numGames', dest='numGames', type='int',
     #                 help=default('the number of GAMES to play'), metavar='GAMES', default=1)
-    #TODO we can have a default auto mode. In this case the game will auto run and generate some stats.
+    # Games between two agents without a human player are run with selfplay.py
     parser.add_option('-a', '--agent', dest='agent',
                     help=default('the agent TYPE for the computer player'),
                     default='RandomAgent')
     parser.add_option(
-        '-d', '--depth', dest='depth', help=default('the depth for search algorithms'), default=2
+        '-d', '--depth', dest='depth', type='int', help=default('the maximum depth for search algorithms'), default=2
     )
     parser.add_option(
         '-r', '--num_rows', dest='num_rows', type='int',
@@ -162,6 +268,57 @@ def readCommand(argv):
         '-t', '--timeout', dest='timeout', type='int',
         help=default('Maximum length of time an agent can spend computing in a single game'), default=30
     )
+    parser.add_option(
+        '--tt_size_mb', dest='tt_size_mb', type='float',
+        help='the size in MB of the transposition table of search agents, 0 disables it', default=None
+    )
+    parser.add_option(
+        '--keep_tt', action='store_true', dest='keep_tt',
+        help=default('keep the transposition table of search agents across the moves of a game'), default=False
+    )
+    parser.add_option(
+        '--solver_empty_cells', dest='solver_empty_cells', type='int',
+        help='solve positions exactly once at most this many cells are empty', default=None
+    )
+    parser.add_option(
+        '--book', dest='book_path', help='the opening book written by build_book.py for search agents', default=None
+    )
+    parser.add_option(
+        '--threats', action='store_true', dest='threats',
+        help=default('let search agents detect forced wins and losses from the threats of both players'), default=False
+    )
+    parser.add_option(
+        '--no_move_ordering', action='store_false', dest='move_ordering',
+        help='search in plain centre first order instead of with killer moves and the history heuristic', default=True
+    )
+    parser.add_option(
+        '--rollout_policy', dest='rollout_policy', type='choice', choices=['random', 'scoreMove'],
+        help='how MCTSAgent picks the moves of its playouts, random by default', default=None
+    )
+    parser.add_option(
+        '-w', '--workers', dest='workers', type='int',
+        help=default('the number of processes search agents split every move across'), default=1
+    )
+    parser.add_option(
+        '--ponder', action='store_true', dest='ponder',
+        help=default('let search agents keep searching while the human player thinks'), default=False
+    )
+    parser.add_option(
+        '--evaluator', dest='evaluator', type='choice', choices=['scoreMove', 'incremental'],
+        help=default('how agents score positions, incremental reads the evaluation kept by the game state'),
+        default='scoreMove'
+    )
+    parser.add_option(
+        '--records', dest='records_path', help='append the finished game to this game record archive', default=None
+    )
+    parser.add_option(
+        '--metrics', dest='metrics_path',
+        help='append the search counters and phase timings of every computer move to this JSON lines file', default=None
+    )
+    parser.add_option(
+        '-e', '--engine', dest='engine', type='choice', choices=list(GAME_STATE_ENGINES),
+        help=default('the board representation used by the game state, one of grid or bitboard'), default='grid'
+    )
     parser.add_option(
         '-v', '--verbose', action='store_true', dest='verbose',
         help=default('Print the board after every move and print every action from every player'), default=False
@@ -178,7 +335,7 @@ if __name__ == '__main__':
     """
     The main function called when run.py is run
     from the command line:
-    See the usage string for more details. Currently, only greedy and random agent are supported
+    See the usage string for more details. Supported agents are random, greedy, minmax, alpha-beta and solver
 
     > python run.py --help
     
@@ -193,7 +350,33 @@ if __name__ == '__main__':
     agent_args = {}
     agent_args['timeout'] = args.timeout
     agent_args['depth'] = args.depth
-    game = Game(computer_agent=args.agent, num_rows=args.num_rows, num_cols=args.num_cols, verbose=args.verbose, agent_args=agent_args)
+    agent_args['keep_tt'] = args.keep_tt
+    agent_args['evaluator'] = args.evaluator
+    agent_args['threats'] = args.threats
+    agent_args['ponder'] = args.ponder
+    if args.workers > 1:
+        agent_args['workers'] = args.workers
+    if args.rollout_policy is not None:
+        agent_args['rollout_policy'] = args.rollout_policy
+    if not args.move_ordering:
+        agent_args['move_ordering'] = False
+    if args.tt_size_mb is not None:
+        agent_args['tt_size_mb'] = args.tt_size_mb
+    if args.solver_empty_cells is not None:
+        agent_args['solver_empty_cells'] = args.solver_empty_cells
+    if args.book_path is not None:
+        agent_args['book_path'] = args.book_path
+    if args.metrics_path is not None:
+        agent_args['metrics'] = SearchMetrics.toFile(args.metrics_path)
+    game = Game(computer_agent=args.agent, num_rows=args.num_rows, num_cols=args.num_cols, verbose=args.verbose, agent_args=agent_args, engine=args.engine)
     print(f"Chosen first player: {game.current_player}")
     game.printGrid()
-    game.alternateTurns()
\ No newline at end of file
+    try:
+        game.alternateTurns()
+        if args.records_path is not None:
+            with RecordWriter(args.records_path) as writer:
+                writer.write(game.gameRecord())
+    finally:
+        game.computer_player.close()
+        if game.computer_player.metrics is not None:
+            game.computer_player.metrics.close()
\ No newline at end of file
@@ -0,0 +1,197 @@
+from multiprocessing import Pool
+from optparse import OptionParser
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Dict, Iterable, List, Optional
+
+import attr
+
+from agents.records import GameRecord, RecordWriter
+from run import GAME_STATE_ENGINES, loadAgent
+
+FIRST_AGENT = 1
+SECOND_AGENT = -1
+
+
+@attr.s
+class GameResult:
+    game_number: int = attr.ib()
+    # FIRST_AGENT or SECOND_AGENT for a win, 0 for a draw
+    winner: int = attr.ib()
+    first_player: int = attr.ib()
+    num_moves: int = attr.ib()
+    # seconds spent in getAction for every move, per agent
+    move_times: Dict[int, List[float]] = attr.ib(factory=dict)
+    # column of every move in the order they were played
+    columns: List[int] = attr.ib(factory=list)
+
+
+@attr.s
+class SelfPlayConfig:
+    agents: Dict[int, str] = attr.ib()
+    agent_args: Dict[int, dict] = attr.ib()
+    num_rows: int = attr.ib(default=6)
+    num_cols: int = attr.ib(default=7)
+    engine: str = attr.ib(default='grid')
+    seed: int = attr.ib(default=0)
+
+
+def playGame(config: SelfPlayConfig, game_number: int) -> GameResult:
+    ''' Play one game between the two agents of <config> without printing anything. The agents take turns to start
+    and every game seeds the random module with seed + game_number, so a run is reproducible whatever the number of
+    workers.
+    '''
+    random.seed(config.seed + game_number)
+    agents = {
+        player: loadAgent(config.agents[player])(player, **config.agent_args[player])
+        for player in (FIRST_AGENT, SECOND_AGENT)
+    }
+    first_player = FIRST_AGENT if game_number % 2 == 0 else SECOND_AGENT
+    game_state = GAME_STATE_ENGINES[config.engine](config.num_rows, config.num_cols, first_player)
+    result = GameResult(
+        game_number=game_number, winner=0, first_player=first_player, num_moves=0,
+        move_times={FIRST_AGENT: [], SECOND_AGENT: []}
+    )
+    player = first_player
+    try:
+        while game_state.getPossibleColumns():
+            game_state.current_player = player
+            start = time.perf_counter()
+            action = agents[player].getAction(game_state)
+            result.move_times[player].append(time.perf_counter() - start)
+            if not game_state.isValidAction(action):
+                raise ValueError(f"Agent {config.agents[player]} played the invalid move {action}")
+            game_state.update(player, action)
+            result.columns.append(action[1])
+            if game_state.game_complete:
+                result.winner = player
+                break
+            player = -player
+    finally:
+        # stops the worker processes of parallel agents
+        for game_agent in agents.values():
+            game_agent.close()
+    result.num_moves = game_state.move_numer
+    return result
+
+
+def _playGameWorker(args) -> GameResult:
+    return playGame(*args)
+
+
+def runSelfPlay(config: SelfPlayConfig, num_games: int, workers: Optional[int] = None) -> List[GameResult]:
+    ''' Play <num_games> games spread over a pool of <workers> processes (one per CPU by default). Games between
+    agents that split their own moves across processes (a workers agent argument above 1) are played one after the
+    other in this process instead, since the daemonic pool processes cannot start pools of their own.
+    '''
+    jobs = [(config, game_number) for game_number in range(num_games)]
+    parallel_agents = any(int(args.get('workers', 1)) > 1 for args in config.agent_args.values())
+    if workers == 1 or parallel_agents:
+        return [_playGameWorker(job) for job in jobs]
+    with Pool(workers) as pool:
+        return pool.map(_playGameWorker, jobs)
+
+
+def gameRecords(config: SelfPlayConfig, results: List[GameResult]) -> Iterable[GameRecord]:
+    for result in results:
+        yield GameRecord(config.num_rows, config.num_cols, result.first_player, result.winner, bytes(result.columns))
+
+
+def _latencyStats(move_times: List[float]) -> Dict[str, float]:
+    if not move_times:
+        return {'mean': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(move_times)
+    return {
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        'max': ordered[-1],
+    }
+
+
+def summarise(config: SelfPlayConfig, results: List[GameResult]) -> dict:
+    summary = {
+        'games': len(results),
+        'draws': sum(result.winner == 0 for result in results),
+        'average_game_length': statistics.fmean(result.num_moves for result in results) if results else 0.0,
+        'agents': {},
+    }
+    for player, name in ((FIRST_AGENT, 'first'), (SECOND_AGENT, 'second')):
+        summary['agents'][name] = {
+            'agent': config.agents[player],
+            'agent_args': config.agent_args[player],
+            'wins': sum(result.winner == player for result in results),
+            'losses': sum(result.winner == -player for result in results),
+            'wins_moving_first': sum(
+                result.winner == player and result.first_player == player for result in results
+            ),
+            'move_latency': _latencyStats([t for result in results for t in result.move_times[player]]),
+        }
+    return summary
+
+
+def printSummary(summary: dict):
+    print(f"Games : {summary['games']}, draws : {summary['draws']}, "
+          f"average game length : {summary['average_game_length']:.1f} moves")
+    for name, stats in summary['agents'].items():
+        latency = stats['move_latency']
+        print(
+            f"{name} agent {stats['agent']} {stats['agent_args']} : {stats['wins']} wins "
+            f"({stats['wins_moving_first']} moving first), {stats['losses']} losses, move latency mean "
+            f"{latency['mean'] * 1000:.2f}ms p95 {latency['p95'] * 1000:.2f}ms max {latency['max'] * 1000:.2f}ms"
+        )
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python selfplay.py <options>
+    EXAMPLES:   (1) python selfplay.py -a AlphaBetaAgent -b GreedyAgent -n 100
+                (2) python selfplay.py -a AlphaBetaAgent --first_args '{"depth": 4}' -b AlphaBetaAgent -n 20 -w 4
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-a', '--first', dest='first', help='the first agent TYPE', default='GreedyAgent')
+    parser.add_option('-b', '--second', dest='second', help='the second agent TYPE', default='RandomAgent')
+    parser.add_option('--first_args', dest='first_args', help='JSON keyword arguments of the first agent', default='{}')
+    parser.add_option('--second_args', dest='second_args', help='JSON keyword arguments of the second agent', default='{}')
+    parser.add_option('-n', '--num_games', dest='num_games', type='int', help='the number of games to play', default=10)
+    parser.add_option('-w', '--workers', dest='workers', type='int', help='the number of worker processes, default one per CPU', default=None)
+    parser.add_option('-r', '--num_rows', dest='num_rows', type='int', help='the number of rows in the board', default=6)
+    parser.add_option('-c', '--num_col', dest='num_cols', type='int', help='the number of cols in the board', default=7)
+    parser.add_option(
+        '-e', '--engine', dest='engine', type='choice', choices=list(GAME_STATE_ENGINES),
+        help='the board representation used by the game state, one of grid or bitboard', default='grid'
+    )
+    parser.add_option('-s', '--seed', dest='seed', type='int', help='the base random seed', default=0)
+    parser.add_option('-o', '--output', dest='output', help='write the summary as JSON to this path', default=None)
+    parser.add_option('--records', dest='records', help='append every game to this game record archive', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    """
+    Plays games between two agents without any human input or printing of the board and reports the results.
+
+    > python selfplay.py -a AlphaBetaAgent -b GreedyAgent -n 100
+    """
+    args = readCommand(sys.argv[1:])
+    config = SelfPlayConfig(
+        agents={FIRST_AGENT: args.first, SECOND_AGENT: args.second},
+        agent_args={FIRST_AGENT: json.loads(args.first_args), SECOND_AGENT: json.loads(args.second_args)},
+        num_rows=args.num_rows, num_cols=args.num_cols, engine=args.engine, seed=args.seed,
+    )
+    start = time.perf_counter()
+    results = runSelfPlay(config, args.num_games, args.workers)
+    summary = summarise(config, results)
+    summary['wall_time'] = time.perf_counter() - start
+    printSummary(summary)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+    if args.records:
+        with RecordWriter(args.records) as writer:
+            writer.writeAll(gameRecords(config, results))
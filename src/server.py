@@ -0,0 +1,484 @@
+from concurrent.futures import Future, ProcessPoolExecutor
+from optparse import OptionParser
+import asyncio
+import collections
+import json
+import sys
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import attr
+
+from agents.agent import BaseAgent, EVALUATORS, ROLLOUT_POLICIES
+from agents.metrics import SearchMetrics
+from game_state import GameState
+from run import AI_PLAYER, GAME_STATE_ENGINES, HUMAN_PLAYER, NUM_COLS, NUM_ROWS, loadAgent
+
+# number of recent AI move latencies kept for the stats request
+LATENCY_WINDOW = 10000
+# the agents clients can play against and the arguments they may set: (low, high) for numbers, the allowed values for
+# the others. Anything else is refused, KeyBoardAgent would wait for input in a worker and arguments such as book_path,
+# workers, ponder or tt_size_mb would let a client open files, start processes or claim memory on the server.
+SERVER_AGENTS = ('RandomAgent', 'GreedyAgent', 'MinMaxAgent', 'AlphaBetaAgent', 'SolverAgent', 'MCTSAgent')
+AGENT_ARG_RANGES = {
+    'depth': (1, 12), 'timeout': (0, 3600), 'solver_empty_cells': (0, 20), 'playouts': (1, 100000),
+    'exploration': (0, 10),
+}
+AGENT_ARG_CHOICES = {
+    'evaluator': EVALUATORS, 'rollout_policy': ROLLOUT_POLICIES, 'threats': (False, True),
+    'move_ordering': (False, True),
+}
+# the largest number of rows or columns of a board, the winning lines of a new board are built on the event loop
+MAX_BOARD_SIZE = 12
+# agents kept by every worker process, see _workerAgent
+MAX_WORKER_AGENTS = 16
+
+
+class ProtocolError(Exception):
+    '''A request the server cannot serve, reported back to the client as an error response.'''
+
+
+@attr.s
+class ServerGame:
+    game_id: str = attr.ib()
+    game_state: GameState = attr.ib()
+    agent: str = attr.ib()
+    agent_args: dict = attr.ib()
+    # seconds the agent has spent on this game so far, carried from one move to the next for its timeout budget
+    ai_time_used: float = attr.ib(default=0.0)
+    # HUMAN_PLAYER or AI_PLAYER once someone has won, 0 for a draw, None while the game is on
+    winner: Optional[int] = attr.ib(default=None)
+    last_active: float = attr.ib(factory=time.monotonic)
+    # (player, action) of every move played, and of the moves taken back with undo until the human plays a new move
+    log: List[Tuple[int, Tuple[int, int]]] = attr.ib(factory=list)
+    redo_log: List[Tuple[int, Tuple[int, int]]] = attr.ib(factory=list)
+    # ai_time_used after every AI move of log and of redo_log, so that undo and redo take the time budget with them
+    ai_times: List[float] = attr.ib(factory=list)
+    redo_ai_times: List[float] = attr.ib(factory=list)
+    # one request at a time per game, even over several connections
+    lock: asyncio.Lock = attr.ib(factory=asyncio.Lock)
+
+
+def validateAgent(agent_name, agent_args) -> dict:
+    ''' Raises ProtocolError unless <agent_name> is one of SERVER_AGENTS and <agent_args> only sets arguments of
+    AGENT_ARG_RANGES and AGENT_ARG_CHOICES to allowed values. Returns the arguments.
+    '''
+    if agent_name not in SERVER_AGENTS:
+        raise ProtocolError(f"unknown agent {agent_name}, expected one of {list(SERVER_AGENTS)}")
+    if not isinstance(agent_args, dict):
+        raise ProtocolError('agent_args must be a JSON object')
+    for name, value in agent_args.items():
+        if name in AGENT_ARG_RANGES:
+            low, high = AGENT_ARG_RANGES[name]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+                raise ProtocolError(f"agent argument {name} must be a number from {low} to {high}")
+        elif name in AGENT_ARG_CHOICES:
+            # compared by type as well, so that 1 does not pass for True
+            if not any(type(value) is type(choice) and value == choice for choice in AGENT_ARG_CHOICES[name]):
+                raise ProtocolError(f"agent argument {name} must be one of {list(AGENT_ARG_CHOICES[name])}")
+        else:
+            raise ProtocolError(
+                f"agent argument {name} is not allowed, expected some of {sorted(AGENT_ARG_RANGES) + sorted(AGENT_ARG_CHOICES)}"
+            )
+    return agent_args
+
+
+def boardSize(request: dict, name: str, default: int) -> int:
+    size = request.get(name, default)
+    if isinstance(size, bool) or not isinstance(size, int) or not 1 <= size <= MAX_BOARD_SIZE:
+        raise ProtocolError(f"{name} must be an integer from 1 to {MAX_BOARD_SIZE}")
+    return size
+
+
+# Agents built in this worker process, see _workerAgent
+_WORKER_AGENTS: "collections.OrderedDict[tuple, BaseAgent]" = collections.OrderedDict()
+
+
+def _workerAgent(agent_name: str, agent_args: dict, num_rows: int, num_cols: int) -> BaseAgent:
+    ''' The agent of this worker process for <agent_name> with <agent_args> on boards of the given size, built on its
+    first move. Agents are shared by the games that ask for the same one, which keeps what they allocate, like the
+    16MB transposition table, from being built again for every move. Nothing else they keep outlives a move but what
+    is valid in any game: a search starts from an empty table and MCTSAgent only reuses its tree for the position it
+    was grown for. The least recently used agents are closed past MAX_WORKER_AGENTS.
+    '''
+    key = (agent_name, json.dumps(agent_args, sort_keys=True), num_rows, num_cols)
+    agent = _WORKER_AGENTS.get(key)
+    if agent is None:
+        agent = _WORKER_AGENTS[key] = loadAgent(agent_name)(AI_PLAYER, **agent_args)
+    _WORKER_AGENTS.move_to_end(key)
+    while len(_WORKER_AGENTS) > MAX_WORKER_AGENTS:
+        _WORKER_AGENTS.popitem(last=False)[1].close()
+    return agent
+
+
+def computeMove(
+    agent_name: str, agent_args: dict, game_state: GameState, time_used: float, record_metrics: bool = False
+) -> Tuple[Tuple[int, int], float, Optional[dict]]:
+    ''' Runs in a worker process: the AI agent's action for <game_state>, the agent's total time for the game and,
+    with <record_metrics>, the agent's SearchMetrics record of the move. The game's time budget is carried between
+    moves through <time_used>.
+    '''
+    metrics = SearchMetrics() if record_metrics else None
+    agent = _workerAgent(agent_name, agent_args, game_state.num_rows, game_state.num_cols)
+    agent.time_used = time_used
+    agent.metrics = metrics
+    game_state.metrics = metrics
+    action = agent.getAction(game_state)
+    return action, agent.time_used, None if metrics is None else metrics.last_record
+
+
+def fallbackMove(game_state: GameState) -> Tuple[int, int]:
+    '''The column nearest the centre, played when the agent runs past the server's move timeout.'''
+    col = min(game_state.getPossibleColumns(), key=lambda col: abs(col - game_state.centre_col))
+    return (game_state.getNextRow(col), col)
+
+
+def gameView(game: ServerGame) -> dict:
+    game_state = game.game_state
+    return {
+        'game_id': game.game_id,
+        # bottom row first, 1 for the human, -1 for the AI and 0 for empty cells
+        'board': [
+            [game_state.grid[(row, col)].value if (row, col) in game_state.grid else 0
+             for col in range(1, game_state.num_cols + 1)]
+            for row in range(1, game_state.num_rows + 1)
+        ],
+        'possible_columns': game_state.getPossibleColumns(),
+        'complete': game.winner is not None,
+        'winner': game.winner,
+    }
+
+
+class GameServer:
+    ''' Hosts many games at once over a line-delimited JSON protocol: every request is one JSON object on one line and
+    gets exactly one JSON line back, in order, with the request's "id" echoed when it has one.
+
+        {"op": "new", "agent": "AlphaBetaAgent", "agent_args": {"depth": 4}, "rows": 6, "cols": 7, "ai_first": false}
+        {"op": "move", "game_id": "...", "col": 4}
+        {"op": "undo", "game_id": "...", "moves": 1}
+        {"op": "redo", "game_id": "...", "moves": 1}
+        {"op": "state", "game_id": "..."}
+        {"op": "close", "game_id": "..."}
+        {"op": "stats"}
+
+    Responses carry "ok" and either the game (see gameView) or an "error". A move response also holds the human's and
+    the AI's actions. AI moves run in a process pool so the event loop only ever handles I/O. Clients pick the agent
+    from SERVER_AGENTS and its arguments from AGENT_ARG_RANGES and AGENT_ARG_CHOICES, on boards of at most
+    MAX_BOARD_SIZE rows and columns.
+
+    undo takes back the human's last <moves> moves with the AI's replies, leaving the human to move, and redo plays them
+    again without asking the agent. Both unmake or update one move at a time, whatever the length of the game.
+
+    Backpressure: at most <max_pending> AI moves are queued on the pool, further move requests wait for a slot, and
+    since every connection is served one request at a time, a client that waits stops being read from. New games are
+    refused past <max_games>.
+
+    With <metrics_path>, the SearchMetrics record of every AI move is appended to that JSON lines file with the game id
+    and the move latency added.
+
+    Timeouts: the agent's own "timeout" argument is its time budget for the whole game, carried over between moves.
+    The server also gives every AI move at most <move_timeout> seconds and plays fallbackMove past it. The worker cannot
+    be interrupted, so it finishes the move in the background and keeps its slot of <max_pending> until then. An agent
+    that fails or returns an invalid move gets fallbackMove played for it as well, with the reason in "ai_error". Games
+    without a request for <idle_timeout> seconds are dropped.
+    '''
+    def __init__(
+        self, workers: Optional[int] = None, max_pending: int = 64, max_games: int = 10000,
+        move_timeout: float = 10.0, idle_timeout: float = 600.0, engine: str = 'grid',
+        metrics_path: Optional[str] = None
+    ):
+        self.executor = ProcessPoolExecutor(workers)
+        self.max_pending = max_pending
+        self.pending = asyncio.Semaphore(max_pending)
+        self.in_flight = 0
+        self.max_games = max_games
+        self.move_timeout = move_timeout
+        self.idle_timeout = idle_timeout
+        self.engine = engine
+        self.games: Dict[str, ServerGame] = {}
+        self.moves_served = 0
+        self.move_timeouts = 0
+        self.move_errors = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.metrics = None if metrics_path is None else SearchMetrics.toFile(metrics_path)
+        self.ops = {
+            'new': self.newGame, 'move': self.move, 'undo': self.undo, 'redo': self.redo, 'state': self.state,
+            'close': self.closeGame, 'stats': self.stats,
+        }
+
+    async def handleConnection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ProtocolError('requests must be JSON objects')
+                    request_id = request.get('id')
+                    op = self.ops.get(request.get('op'))
+                    if op is None:
+                        raise ProtocolError(f"unknown op {request.get('op')}, expected one of {sorted(self.ops)}")
+                    response = await op(request)
+                    response['ok'] = True
+                except ProtocolError as error:
+                    response = {'ok': False, 'error': str(error)}
+                except Exception as error:
+                    # a bug or a broken worker pool fails the request, not the connection
+                    response = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+                if request_id is not None:
+                    response['id'] = request_id
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _game(self, request: dict) -> ServerGame:
+        game = self.games.get(request.get('game_id'))
+        if game is None:
+            raise ProtocolError(f"unknown game {request.get('game_id')}")
+        game.last_active = time.monotonic()
+        return game
+
+    def _releaseSlot(self, future: Future):
+        ''' Give back the pool slot of an AI move once its worker is done with it, which can be after a timeout.'''
+        self.in_flight -= 1
+        self.pending.release()
+        if not future.cancelled():
+            # retrieved so that a failure after a timeout is not reported as never retrieved
+            future.exception()
+
+    async def _aiMove(self, game: ServerGame) -> dict:
+        ''' Play the AI's move in <game> on the process pool, waiting for a pool slot first. The AI always moves: when
+        the agent times out, fails or returns an invalid move, fallbackMove is played instead.
+        '''
+        game_state = game.game_state
+        game_state.current_player = AI_PLAYER
+        await self.pending.acquire()
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, computeMove, game.agent, game.agent_args, game_state, game.ai_time_used,
+                self.metrics is not None
+            )
+        except BaseException:
+            self.in_flight -= 1
+            self.pending.release()
+            raise
+        future.add_done_callback(self._releaseSlot)
+        record, timed_out, error = None, False, None
+        try:
+            # shielded so that a timeout leaves the move running, and holding its slot, rather than cancelling it
+            action, game.ai_time_used, record = await asyncio.wait_for(asyncio.shield(future), self.move_timeout)
+            action = tuple(action)
+            if not game_state.isValidAction(action):
+                error = f"agent {game.agent} played the invalid move {list(action)}"
+        except asyncio.TimeoutError:
+            timed_out = True
+            game.ai_time_used += self.move_timeout
+            self.move_timeouts += 1
+        except Exception as agent_error:
+            error = f"{type(agent_error).__name__}: {agent_error}"
+        self.latencies.append(time.perf_counter() - start)
+        if timed_out or error is not None:
+            action = fallbackMove(game_state)
+            self.move_errors += error is not None
+        if record is not None:
+            record.update(game_id=game.game_id, latency=self.latencies[-1])
+            self.metrics.write(record)
+        self.moves_served += 1
+        self._play(game, AI_PLAYER, action)
+        response = {'ai_move': list(action), 'ai_timeout': timed_out}
+        if error is not None:
+            response['ai_error'] = error
+        return response
+
+    def _play(self, game: ServerGame, player: int, action: Tuple[int, int]):
+        game_state = game.game_state
+        game_state.current_player = player
+        game_state.update(player, action)
+        game.log.append((player, action))
+        if player == AI_PLAYER:
+            game.ai_times.append(game.ai_time_used)
+        if game_state.game_complete:
+            game.winner = player
+        elif not game_state.getPossibleColumns():
+            game.winner = 0
+        else:
+            game_state.current_player = -player
+
+    async def newGame(self, request: dict) -> dict:
+        if len(self.games) >= self.max_games:
+            raise ProtocolError('server full')
+        agent_name = request.get('agent', 'GreedyAgent')
+        agent_args = validateAgent(agent_name, request.get('agent_args', {}))
+        engine = request.get('engine', self.engine)
+        if engine not in GAME_STATE_ENGINES:
+            raise ProtocolError(f"unknown engine {engine}, expected one of {sorted(GAME_STATE_ENGINES)}")
+        first_player = AI_PLAYER if request.get('ai_first', False) else HUMAN_PLAYER
+        game_state = GAME_STATE_ENGINES[engine](
+            boardSize(request, 'rows', NUM_ROWS), boardSize(request, 'cols', NUM_COLS), first_player
+        )
+        game = ServerGame(game_id=uuid.uuid4().hex, game_state=game_state, agent=agent_name, agent_args=agent_args)
+        self.games[game.game_id] = game
+        response = {}
+        if first_player == AI_PLAYER:
+            async with game.lock:
+                response.update(await self._aiMove(game))
+        response.update(gameView(game))
+        return response
+
+    async def move(self, request: dict) -> dict:
+        game = self._game(request)
+        async with game.lock:
+            if game.winner is not None:
+                raise ProtocolError('the game is over')
+            col = request.get('col')
+            # true and 1.0 compare equal to column 1, but are not column numbers
+            if isinstance(col, bool) or not isinstance(col, int) or col not in game.game_state.getPossibleColumns():
+                raise ProtocolError(f"column {col} is not playable")
+            action = (game.game_state.getNextRow(col), col)
+            game.redo_log.clear()
+            game.redo_ai_times.clear()
+            self._play(game, HUMAN_PLAYER, action)
+            response = {'human_move': list(action)}
+            if game.winner is None:
+                response.update(await self._aiMove(game))
+        response.update(gameView(game))
+        return response
+
+    def _numMoves(self, request: dict, log: List[Tuple[int, Tuple[int, int]]]) -> int:
+        num_moves = request.get('moves', 1)
+        available = sum(player == HUMAN_PLAYER for player, _ in log)
+        # bool is an int subclass, but true is not a number of moves
+        if isinstance(num_moves, bool) or not isinstance(num_moves, int) or not 0 < num_moves <= available:
+            raise ProtocolError(f"moves must be an integer from 1 to {available}")
+        return num_moves
+
+    async def undo(self, request: dict) -> dict:
+        game = self._game(request)
+        async with game.lock:
+            num_moves = self._numMoves(request, game.log)
+            while num_moves:
+                player, action = game.log.pop()
+                game.game_state.unmake_move()
+                game.redo_log.append((player, action))
+                if player == AI_PLAYER:
+                    game.redo_ai_times.append(game.ai_times.pop())
+                num_moves -= player == HUMAN_PLAYER
+            game.ai_time_used = game.ai_times[-1] if game.ai_times else 0.0
+            game.game_state.current_player = HUMAN_PLAYER
+            game.winner = None
+            return gameView(game)
+
+    async def redo(self, request: dict) -> dict:
+        game = self._game(request)
+        async with game.lock:
+            num_moves = self._numMoves(request, game.redo_log)
+            # every human move is replayed with the AI reply that followed it
+            while game.redo_log and (num_moves or game.redo_log[-1][0] == AI_PLAYER):
+                player, action = game.redo_log.pop()
+                if player == AI_PLAYER:
+                    game.ai_time_used = game.redo_ai_times.pop()
+                self._play(game, player, action)
+                num_moves -= player == HUMAN_PLAYER
+            return gameView(game)
+
+    async def state(self, request: dict) -> dict:
+        return gameView(self._game(request))
+
+    async def closeGame(self, request: dict) -> dict:
+        game = self._game(request)
+        del self.games[game.game_id]
+        return {'game_id': game.game_id}
+
+    async def stats(self, request: dict) -> dict:
+        ordered = sorted(self.latencies)
+        return {
+            'games': len(self.games),
+            'moves_served': self.moves_served,
+            'move_timeouts': self.move_timeouts,
+            'move_errors': self.move_errors,
+            'in_flight': self.in_flight,
+            'max_pending': self.max_pending,
+            'latency_p50': ordered[len(ordered) // 2] if ordered else 0.0,
+            'latency_p99': ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] if ordered else 0.0,
+        }
+
+    async def reapIdleGames(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 2))
+            oldest = time.monotonic() - self.idle_timeout
+            for game_id in [game_id for game_id, game in self.games.items() if game.last_active < oldest]:
+                del self.games[game_id]
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.metrics is not None:
+            self.metrics.close()
+
+
+async def serve(args):
+    game_server = GameServer(
+        workers=args.workers, max_pending=args.max_pending, max_games=args.max_games,
+        move_timeout=args.move_timeout, idle_timeout=args.idle_timeout, engine=args.engine,
+        metrics_path=args.metrics_path,
+    )
+    if args.unix:
+        server = await asyncio.start_unix_server(game_server.handleConnection, path=args.unix)
+        print(f"Serving games on {args.unix}")
+    else:
+        server = await asyncio.start_server(game_server.handleConnection, host=args.host, port=args.port)
+        print(f"Serving games on {args.host}:{args.port}")
+    reaper = asyncio.create_task(game_server.reapIdleGames())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reaper.cancel()
+        game_server.close()
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python server.py <options>
+    EXAMPLES:   (1) python server.py -p 4004 -w 8
+                (2) python server.py --unix /tmp/connect4.sock --max_pending 16 --move_timeout 2
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('--host', dest='host', help='the address to listen on', default='127.0.0.1')
+    parser.add_option('-p', '--port', dest='port', type='int', help='the TCP port to listen on', default=4004)
+    parser.add_option('--unix', dest='unix', help='listen on this Unix socket path instead of TCP', default=None)
+    parser.add_option('-w', '--workers', dest='workers', type='int', help='the number of worker processes for AI moves, default one per CPU', default=None)
+    parser.add_option('--max_pending', dest='max_pending', type='int', help='the number of AI moves queued on the workers before move requests wait', default=64)
+    parser.add_option('--max_games', dest='max_games', type='int', help='the number of open games before new games are refused', default=10000)
+    parser.add_option('--move_timeout', dest='move_timeout', type='float', help='seconds an AI move may take before the server plays a fallback move', default=10.0)
+    parser.add_option('--idle_timeout', dest='idle_timeout', type='float', help='seconds without a request before a game is dropped', default=600.0)
+    parser.add_option(
+        '-e', '--engine', dest='engine', type='choice', choices=list(GAME_STATE_ENGINES),
+        help='the default board representation of new games, one of grid or bitboard', default='grid'
+    )
+    parser.add_option('--metrics', dest='metrics_path', help='append the search metrics of every AI move to this JSON lines file', default=None)
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+
+if __name__ == '__main__':
+    """
+    Serves many concurrent games against the AI agents over TCP or a Unix socket. See loadgen.py for a client.
+
+    > python server.py -p 4004
+    """
+    args = readCommand(sys.argv[1:])
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,279 @@
+from ast import literal_eval
+from collections import defaultdict
+import inspect
+import json
+import math
+from multiprocessing import Pool
+from optparse import OptionParser
+import os
+import random
+import statistics
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from agents import agent
+from run import GAME_STATE_ENGINES
+from selfplay import FIRST_AGENT, SECOND_AGENT, SelfPlayConfig, playGame
+
+# BayesElo style prior: virtual draws added between every pair of agents that met, so that an agent that won or lost
+# every game still gets a finite rating
+PRIOR_DRAWS = 2
+ELO_SCALE = 400
+
+
+def discoverAgents() -> List[str]:
+    '''Names of every concrete BaseAgent subclass defined in agents/agent.py.'''
+    return [
+        name for name, agent_class in inspect.getmembers(agent, inspect.isclass)
+        if issubclass(agent_class, agent.BaseAgent) and agent_class is not agent.BaseAgent and
+        agent_class.getAction is not agent.BaseAgent.getAction
+    ]
+
+
+def parseAgentSpec(spec: str) -> Tuple[str, dict]:
+    ''' Split an agent spec such as "AlphaBetaAgent:depth=4,timeout=10" into the agent name and its keyword
+    arguments. Values are read as python literals and kept as strings when they are not one.
+    '''
+    name, _, args = spec.partition(':')
+    agent_args = {}
+    for arg in filter(None, args.split(',')):
+        key, _, value = arg.partition('=')
+        try:
+            agent_args[key.strip()] = literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            agent_args[key.strip()] = value.strip()
+    return name, agent_args
+
+
+def scheduleGames(specs: List[str], games_per_pairing: int) -> List[Tuple[str, str, int]]:
+    ''' Every pairing of two specs, each with <games_per_pairing> games rounded up to an even number so that both
+    agents move first equally often (playGame alternates the first player with the game number).
+    '''
+    games_per_pairing += games_per_pairing % 2
+    return [
+        (specs[i], specs[j], game_number)
+        for i in range(len(specs)) for j in range(i + 1, len(specs)) for game_number in range(games_per_pairing)
+    ]
+
+
+def _playScheduledGame(args) -> dict:
+    first_spec, second_spec, game_number, num_rows, num_cols, engine, seed = args
+    first_name, first_args = parseAgentSpec(first_spec)
+    second_name, second_args = parseAgentSpec(second_spec)
+    config = SelfPlayConfig(
+        agents={FIRST_AGENT: first_name, SECOND_AGENT: second_name},
+        agent_args={FIRST_AGENT: first_args, SECOND_AGENT: second_args},
+        num_rows=num_rows, num_cols=num_cols, engine=engine, seed=seed,
+    )
+    result = playGame(config, game_number)
+    return {
+        'first': first_spec,
+        'second': second_spec,
+        'game_number': game_number,
+        'winner': {FIRST_AGENT: 'first', SECOND_AGENT: 'second', 0: 'draw'}[result.winner],
+        'first_player': 'first' if result.first_player == FIRST_AGENT else 'second',
+        'num_moves': result.num_moves,
+        'first_move_times': result.move_times[FIRST_AGENT],
+        'second_move_times': result.move_times[SECOND_AGENT],
+        'num_rows': num_rows,
+        'num_cols': num_cols,
+        'engine': engine,
+        'seed': seed,
+    }
+
+
+def loadResults(path: str) -> List[dict]:
+    ''' Results already streamed to <path>. A line cut short by a crash is ignored.'''
+    results = []
+    if not os.path.exists(path):
+        return results
+    with open(path) as results_file:
+        for line in results_file:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return results
+
+
+def runTournament(
+        specs: List[str], games_per_pairing: int, results_path: str, num_rows: int = 6, num_cols: int = 7,
+        engine: str = 'grid', seed: int = 0, workers: Optional[int] = None, verbose: bool = False
+) -> List[dict]:
+    ''' Play every scheduled game that is not already in <results_path> across a pool of <workers> processes. Each
+    result is appended to the file and flushed as soon as its game ends, so a crash loses at most the games in flight
+    and a rerun with the same arguments picks up where it stopped. Results in the file played with another board size,
+    engine or seed are left out, of the games to skip as well as of the results returned.
+
+    Agents that split their moves across processes (a workers argument above 1) cannot start their pools inside the
+    daemonic pool processes, so a tournament with any of them plays its games one after the other in this process.
+    '''
+    # every result line records these, a result only counts for a run with the same ones
+    settings = {'num_rows': num_rows, 'num_cols': num_cols, 'engine': engine, 'seed': seed}
+    results = [
+        result for result in loadResults(results_path)
+        if all(result.get(name) == value for name, value in settings.items())
+    ]
+    done = {(result['first'], result['second'], result['game_number']) for result in results}
+    jobs = [
+        (first, second, game_number, num_rows, num_cols, engine, seed)
+        for first, second, game_number in scheduleGames(specs, games_per_pairing)
+        if (first, second, game_number) not in done
+    ]
+    if verbose:
+        print(f"{len(done)} games already played, {len(jobs)} to go")
+    parallel_agents = any(int(parseAgentSpec(spec)[1].get('workers', 1)) > 1 for spec in specs)
+    with open(results_path, 'a') as results_file:
+        if parallel_agents:
+            _writeResults(map(_playScheduledGame, jobs), results_file, results, verbose)
+        else:
+            with Pool(workers) as pool:
+                _writeResults(pool.imap_unordered(_playScheduledGame, jobs), results_file, results, verbose)
+    return results
+
+
+def _writeResults(played, results_file, results: List[dict], verbose: bool):
+    for result in played:
+        results_file.write(json.dumps(result) + '\n')
+        results_file.flush()
+        results.append(result)
+        if verbose:
+            print(f"{result['first']} vs {result['second']} game {result['game_number']} : {result['winner']}")
+
+
+def _pairScores(results: List[dict]) -> Dict[Tuple[str, str], List[float]]:
+    ''' (points of a, games) for every pair (a, b) that met, with a win worth 1 and a draw 1/2.'''
+    pair_scores = defaultdict(lambda: [0.0, 0])
+    for result in results:
+        first, second = result['first'], result['second']
+        points = {'first': 1.0, 'second': 0.0, 'draw': 0.5}[result['winner']]
+        pair_scores[(first, second)][0] += points
+        pair_scores[(first, second)][1] += 1
+        pair_scores[(second, first)][0] += 1 - points
+        pair_scores[(second, first)][1] += 1
+    return pair_scores
+
+
+def estimateElo(results: List[dict], iterations: int = 1000) -> Dict[str, float]:
+    ''' Maximum likelihood Bradley-Terry ratings on the Elo scale, fitted with the minorisation-maximisation
+    updates, with PRIOR_DRAWS virtual draws per pair and the mean rating pinned to 0.
+    '''
+    pair_scores = _pairScores(results)
+    players = sorted({player for player, _ in pair_scores})
+    points = {player: 0.0 for player in players}
+    games = defaultdict(float)
+    for (player, opponent), (score, num_games) in pair_scores.items():
+        points[player] += score + PRIOR_DRAWS / 2
+        games[(player, opponent)] = num_games + PRIOR_DRAWS
+    strengths = {player: 1.0 for player in players}
+    for _ in range(iterations):
+        new_strengths = {}
+        for player in players:
+            denominator = sum(
+                games[(player, opponent)] / (strengths[player] + strengths[opponent])
+                for opponent in players if games[(player, opponent)]
+            )
+            new_strengths[player] = points[player] / denominator if denominator else strengths[player]
+        # normalise the geometric mean to 1, i.e. the mean rating to 0
+        log_mean = statistics.fmean(math.log(strength) for strength in new_strengths.values())
+        new_strengths = {player: strength / math.exp(log_mean) for player, strength in new_strengths.items()}
+        converged = max(abs(new_strengths[player] - strengths[player]) for player in players) < 1e-9
+        strengths = new_strengths
+        if converged:
+            break
+    return {player: ELO_SCALE * math.log10(strength) for player, strength in strengths.items()}
+
+
+def bootstrapElo(
+        results: List[dict], samples: int = 200, confidence: float = 0.95, seed: int = 0
+) -> Dict[str, Tuple[float, float]]:
+    ''' Confidence interval of every rating from refitting on games resampled with replacement.'''
+    rng = random.Random(seed)
+    ratings = defaultdict(list)
+    for _ in range(samples):
+        resampled = [rng.choice(results) for _ in results]
+        for player, rating in estimateElo(resampled, iterations=200).items():
+            ratings[player].append(rating)
+    tail = (1 - confidence) / 2
+    intervals = {}
+    for player, player_ratings in ratings.items():
+        player_ratings.sort()
+        intervals[player] = (
+            player_ratings[int(tail * (len(player_ratings) - 1))],
+            player_ratings[int((1 - tail) * (len(player_ratings) - 1))],
+        )
+    return intervals
+
+
+def standings(results: List[dict], samples: int = 200) -> List[dict]:
+    ratings = estimateElo(results)
+    intervals = bootstrapElo(results, samples)
+    rows = []
+    for player, rating in sorted(ratings.items(), key=lambda item: -item[1]):
+        player_games = [result for result in results if player in (result['first'], result['second'])]
+
+        def side(result: dict) -> str:
+            return 'first' if result['first'] == player else 'second'
+
+        move_times = [t for result in player_games for t in result[f"{side(result)}_move_times"]]
+        rows.append({
+            'agent': player,
+            'elo': rating,
+            'elo_low': intervals.get(player, (rating, rating))[0],
+            'elo_high': intervals.get(player, (rating, rating))[1],
+            'games': len(player_games),
+            'wins': sum(result['winner'] == side(result) for result in player_games),
+            'draws': sum(result['winner'] == 'draw' for result in player_games),
+            'mean_move_ms': 1000 * statistics.fmean(move_times) if move_times else 0.0,
+        })
+    return rows
+
+
+def printStandings(rows: List[dict]):
+    print(f"{'rank':>4} {'agent':<40} {'elo':>7} {'95% interval':>17} {'games':>6} {'wins':>5} {'draws':>5} {'ms/move':>8}")
+    for rank, row in enumerate(rows, start=1):
+        interval = f"[{row['elo_low']:.0f}, {row['elo_high']:.0f}]"
+        print(
+            f"{rank:>4} {row['agent']:<40} {row['elo']:>7.0f} {interval:>17} {row['games']:>6} {row['wins']:>5} "
+            f"{row['draws']:>5} {row['mean_move_ms']:>8.2f}"
+        )
+
+
+def readCommand(argv):
+    usageStr = """
+    USAGE:      python tournament.py <options> [agent specs]
+    EXAMPLES:   (1) python tournament.py -n 20
+                (2) python tournament.py -n 10 GreedyAgent AlphaBetaAgent:depth=2 AlphaBetaAgent:depth=4,timeout=60
+    Agent specs are agent names from agents/agent.py, optionally followed by :key=value,... agent arguments. Without
+    any spec every agent in agents/agent.py plays with its default arguments.
+    """
+    parser = OptionParser(usageStr)
+    parser.add_option('-n', '--games', dest='games', type='int', help='the number of games per pairing', default=10)
+    parser.add_option('-w', '--workers', dest='workers', type='int', help='the number of worker processes, default one per CPU', default=None)
+    parser.add_option('-r', '--num_rows', dest='num_rows', type='int', help='the number of rows in the board', default=6)
+    parser.add_option('-c', '--num_col', dest='num_cols', type='int', help='the number of cols in the board', default=7)
+    parser.add_option(
+        '-e', '--engine', dest='engine', type='choice', choices=list(GAME_STATE_ENGINES),
+        help='the game state engine, one of ' + ', '.join(GAME_STATE_ENGINES), default='grid'
+    )
+    parser.add_option('-s', '--seed', dest='seed', type='int', help='the base random seed', default=0)
+    parser.add_option('-o', '--results', dest='results', help='the JSON lines file results are streamed to', default='tournament.jsonl')
+    parser.add_option('--bootstrap', dest='bootstrap', type='int', help='the number of bootstrap samples for the intervals', default=200)
+    parser.add_option('-v', '--verbose', action='store_true', dest='verbose', help='print every game result', default=False)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    """
+    Round robin tournament between agents, ranked by Elo.
+
+    > python tournament.py -n 20 RandomAgent GreedyAgent AlphaBetaAgent:depth=2 AlphaBetaAgent:depth=4
+    """
+    args, specs = readCommand(sys.argv[1:])
+    specs = specs or discoverAgents()
+    results = runTournament(
+        specs, args.games, args.results, num_rows=args.num_rows, num_cols=args.num_cols, engine=args.engine,
+        seed=args.seed, workers=args.workers, verbose=args.verbose
+    )
+    results = [result for result in results if result['first'] in specs and result['second'] in specs]
+    printStandings(standings(results, args.bootstrap))